@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Startup benchmark for the ZeroHunter CLI
+
+Runs each CLI mode in a fresh interpreter and records wall time, peak RSS
+and the slowest imports (from ``python -X importtime``). Every run uses a
+throw-away HOME so the user's configuration and caches do not affect the
+numbers.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs N] [--output results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# CLI modes invoked by hooks, keyed by name
+MODES = {
+    'import': ['-c', 'import zerohunter.main'],
+    'version': ['-m', 'zerohunter.main', '--version'],
+    'help': ['-m', 'zerohunter.main', '--help'],
+    'scan_file': ['-m', 'zerohunter.main', '--cli', '--scan', '--no-cache', '--file', '{sample}'],
+}
+
+
+def run_once(argv, env):
+    """Run a command and return (wall seconds, peak RSS in KB, exit code, stderr)"""
+    start = time.perf_counter()
+    proc = subprocess.Popen(argv, env=env, cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    stderr = proc.stderr.read()
+    # wait4 reports the resource usage of exactly this child
+    _, status, usage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - start
+    proc.returncode = status >> 8 if os.WIFEXITED(status) else -1
+    return elapsed, usage.ru_maxrss, proc.returncode, stderr.decode('utf-8', 'replace')
+
+
+def parse_importtime(stderr, top=10):
+    """Return the slowest top-level imports from -X importtime output"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        try:
+            cumulative = int(parts[1])
+        except ValueError:
+            continue
+        # Nested imports are indented and already counted in their parent
+        name = parts[2][1:]
+        if not name.startswith(' '):
+            imports.append((cumulative, name))
+    imports.sort(reverse=True)
+    return [{'module': name, 'cumulative_us': us} for us, name in imports[:top]]
+
+
+def bench_mode(name, args, runs, env, sample):
+    """Benchmark one CLI mode"""
+    argv = [sys.executable] + [arg.format(sample=sample) for arg in args]
+    times = []
+    rss = []
+    returncode = 0
+    for _ in range(runs):
+        elapsed, maxrss, returncode, _ = run_once(argv, env)
+        times.append(elapsed)
+        rss.append(maxrss)
+
+    # One extra run to see which imports dominate
+    _, _, _, stderr = run_once([sys.executable, '-X', 'importtime'] + argv[1:], env)
+
+    return {
+        'mode': name,
+        'runs': runs,
+        'returncode': returncode,
+        'wall_s_median': statistics.median(times),
+        'wall_s_min': min(times),
+        'max_rss_kb': max(rss),
+        'top_imports': parse_importtime(stderr),
+    }
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Benchmark ZeroHunter CLI startup')
+    parser.add_argument('--runs', type=int, default=5, help='Runs per mode')
+    parser.add_argument('--mode', action='append', choices=sorted(MODES), help='Mode to run (default: all)')
+    parser.add_argument('--output', type=str, help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, HOME=home, PYTHONPATH=ROOT)
+        sample = os.path.join(home, 'sample.bin')
+        with open(sample, 'wb') as f:
+            f.write(os.urandom(4096))
+
+        results = {
+            'benchmark': 'startup',
+            'python': sys.version.split()[0],
+            'results': [bench_mode(name, MODES[name], args.runs, env, sample)
+                        for name in (args.mode or MODES)],
+        }
+
+    output = json.dumps(results, indent=4)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Compare two ZeroHunter benchmark result files
+
+Prints the throughput change of every benchmark and exits with status 1
+if any benchmark got slower than the allowed threshold.
+
+Usage:
+    python benchmarks/compare.py baseline.json candidate.json [--threshold 0.1]
+"""
+
+import sys
+import json
+import argparse
+
+
+def load(path):
+    """Load a result file"""
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def compare(baseline, candidate, threshold):
+    """Return (report lines, regressed benchmark names)"""
+    lines = [f"{'benchmark':<40} {'baseline':>14} {'candidate':>14} {'change':>9}"]
+    regressions = []
+    for name in sorted(set(baseline['results']) | set(candidate['results'])):
+        old = baseline['results'].get(name, {})
+        new = candidate['results'].get(name, {})
+        if old.get('status') != 'ok' or new.get('status') != 'ok':
+            lines.append(f"{name:<40} {old.get('status', '-'):>14} {new.get('status', '-'):>14} {'':>9}")
+            continue
+
+        change = new['ops_per_s'] / old['ops_per_s'] - 1.0 if old['ops_per_s'] else 0.0
+        flag = ''
+        if change < -threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        lines.append(f"{name:<40} {old['ops_per_s']:>14.1f} {new['ops_per_s']:>14.1f} {change:>+8.1%}{flag}")
+    return lines, regressions
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Compare ZeroHunter benchmark results')
+    parser.add_argument('baseline', help='Result file of the reference commit')
+    parser.add_argument('candidate', help='Result file of the commit under test')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Allowed slowdown (0.1 = 10%%)')
+    args = parser.parse_args()
+
+    baseline = load(args.baseline)
+    candidate = load(args.candidate)
+    if baseline.get('params') != candidate.get('params'):
+        print("warning: the runs used different parameters", file=sys.stderr)
+
+    lines, regressions = compare(baseline, candidate, args.threshold)
+    print(f"baseline:  {baseline.get('commit')}")
+    print(f"candidate: {candidate.get('commit')}")
+    print('\n'.join(lines))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
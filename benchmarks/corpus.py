@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Deterministic synthetic corpus for ZeroHunter benchmarks
+
+Every generator takes a seed and produces byte-identical output for the
+same arguments, so results from different commits are comparable.
+"""
+
+import io
+import os
+import time
+import struct
+import random
+import tarfile
+import zipfile
+import hashlib
+import ipaddress
+
+# Marker embedded in some generated files so that YARA rules have matches
+MARKER = b'ZEROHUNTER-BENCH-MARKER'
+
+WORDS = ('alpha bravo charlie delta echo foxtrot golf hotel india juliet kilo lima '
+         'mike november oscar papa quebec romeo sierra tango uniform victor whiskey '
+         'xray yankee zulu config server request response error warning').split()
+
+TLDS = ('com', 'net', 'org', 'io', 'info', 'biz', 'ru', 'cn', 'xyz', 'top')
+
+
+def _size(rng, min_size=64, max_size=4 * 1024 * 1024):
+    """Pick a log-uniformly distributed file size"""
+    return int(min_size * (max_size / min_size) ** rng.random())
+
+
+def _randbytes(rng, size):
+    """Generate random bytes (Random.randbytes needs Python 3.9)"""
+    if size <= 0:
+        return b''
+    return rng.getrandbits(size * 8).to_bytes(size, 'little')
+
+
+def _text(rng, size):
+    """Generate text made of words"""
+    out = []
+    length = 0
+    while length < size:
+        line = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(4, 16))) + '\n'
+        out.append(line)
+        length += len(line)
+    return ''.join(out).encode()[:size]
+
+
+def _binary(rng, size):
+    """Generate an ELF-looking binary blob"""
+    header = b'\x7fELF\x02\x01\x01' + bytes(9)
+    return header + _randbytes(rng, size - len(header))
+
+
+def _archive(rng, size):
+    """Generate a zip or tar.gz archive with text and binary members"""
+    buffer = io.BytesIO()
+    members = [(f'member{i}.txt', _text(rng, size // 4)) for i in range(2)]
+    members.append(('member.bin', _binary(rng, size // 4)))
+    if rng.random() < 0.5:
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name, data in members:
+                info = zipfile.ZipInfo(name, date_time=(2020, 1, 1, 0, 0, 0))
+                archive.writestr(info, data)
+    else:
+        with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+            for name, data in members:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = 1577836800
+                archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def make_file_tree(root, files=1000, seed=1, max_size=4 * 1024 * 1024, marker_rate=0.01, depth=4):
+    """Create a tree of text, binary and archive files, returning their total size"""
+    rng = random.Random(seed)
+    total = 0
+    for i in range(files):
+        directory = os.path.join(root, *(f'd{rng.randrange(8)}' for _ in range(rng.randint(0, depth))))
+        os.makedirs(directory, exist_ok=True)
+
+        kind = rng.random()
+        size = _size(rng, max_size=max_size)
+        if kind < 0.5:
+            data, suffix = _text(rng, size), '.txt'
+        elif kind < 0.9:
+            data, suffix = _binary(rng, size), '.bin'
+        else:
+            data, suffix = _archive(rng, min(size, 1024 * 1024)), '.zip'
+
+        if rng.random() < marker_rate:
+            offset = rng.randrange(len(data) + 1)
+            data = data[:offset] + MARKER + data[offset:]
+
+        path = os.path.join(directory, f'f{i:07d}{suffix}')
+        with open(path, 'wb') as f:
+            f.write(data)
+        os.utime(path, (1577836800, 1577836800))
+        total += len(data)
+    return total
+
+
+def make_yara_rules(path, rules=100, seed=1):
+    """Write a YARA rule file with random string rules and one marker rule"""
+    rng = random.Random(seed)
+    lines = [f'rule bench_marker {{ strings: $m = "{MARKER.decode()}" condition: $m }}']
+    for i in range(rules - 1):
+        strings = ' '.join(f'$s{j} = "{rng.choice(WORDS)}{rng.randrange(10 ** 6)}{rng.choice(WORDS)}"'
+                           for j in range(3))
+        lines.append(f'rule bench_{i} {{ strings: {strings} condition: any of them }}')
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def make_iocs(count, seed=1):
+    """Generate an IOC set with count entries split across the IOC types"""
+    rng = random.Random(seed)
+    per_type = max(count // 4, 1)
+    iocs = {'ip': [], 'domain': [], 'url': [], 'file_hash': []}
+    for _ in range(per_type):
+        iocs['ip'].append('.'.join(str(rng.randrange(1, 255)) for _ in range(4)))
+        domain = f'{rng.choice(WORDS)}{rng.randrange(10 ** 7)}.{rng.choice(TLDS)}'
+        iocs['domain'].append(domain)
+        iocs['url'].append(f'http://{domain}/{rng.choice(WORDS)}/{rng.randrange(10 ** 6)}')
+        iocs['file_hash'].append(hashlib.sha256(rng.getrandbits(128).to_bytes(16, 'little')).hexdigest())
+    return iocs
+
+
+def make_networks(count, seed=1, ipv6_rate=0.1):
+    """Generate network IOCs (CIDR strings) with a feed-like mix of prefix lengths"""
+    rng = random.Random(seed)
+    networks = []
+    for _ in range(count):
+        if rng.random() < ipv6_rate:
+            length = rng.choice((32, 48, 48, 56, 64, 128))
+            address = ipaddress.IPv6Address(0x20010db8 << 96 | rng.getrandbits(96))
+        else:
+            length = rng.choice((8, 16, 20, 22, 24, 24, 24, 28, 32))
+            address = ipaddress.IPv4Address(rng.getrandbits(32))
+        networks.append(str(ipaddress.ip_network(f'{address}/{length}', strict=False)))
+    return networks
+
+
+def make_packets(count, seed=1, flows=1000, ipv6_rate=0.0, vlan_rate=0.0):
+    """Generate Ethernet frames (TCP, UDP and ICMP over IPv4 or IPv6) as (ts, bytes)"""
+    rng = random.Random(seed)
+    endpoints = [(rng.getrandbits(32), rng.getrandbits(32), rng.randrange(1024, 65536),
+                  rng.choice((22, 25, 53, 80, 443, 8080)), rng.choice((6, 6, 6, 17, 1)))
+                 for _ in range(flows)]
+    ts = 1577836800.0
+    packets = []
+    for i in range(count):
+        src, dst, sport, dport, proto = rng.choice(endpoints)
+        if rng.random() < 0.5:
+            src, dst, sport, dport = dst, src, dport, sport
+        # The extra draws only happen when enabled, so the default stream is unchanged
+        ipv6 = ipv6_rate and rng.random() < ipv6_rate
+        vlan = vlan_rate and rng.random() < vlan_rate
+        payload = _randbytes(rng, rng.choice((0, 0, 64, 512, 1400)))
+        if proto == 6:
+            l4 = struct.pack('!HHIIBBHHH', sport, dport, i, 0, 5 << 4, 0x18, 65535, 0, 0)
+        elif proto == 17:
+            l4 = struct.pack('!HHHH', sport, dport, 8 + len(payload), 0)
+        else:
+            l4 = struct.pack('!BBHHH', 128 if ipv6 else 8, 0, 0, i & 0xffff, i & 0xffff)
+        if ipv6:
+            ip = struct.pack('!IHBB16s16s', 6 << 28, len(l4) + len(payload), 58 if proto == 1 else proto,
+                             64, b'\x20\x01\x0d\xb8' + bytes(8) + src.to_bytes(4, 'big'),
+                             b'\x20\x01\x0d\xb8' + bytes(8) + dst.to_bytes(4, 'big'))
+            ethertype = b'\x86\xdd'
+        else:
+            ip = struct.pack('!BBHHHBBHII', 0x45, 0, 20 + len(l4) + len(payload), i & 0xffff, 0,
+                             64, proto, 0, src, dst)
+            ethertype = b'\x08\x00'
+        if vlan:
+            ethertype = b'\x81\x00' + struct.pack('!H', (src % 4094) + 1) + ethertype
+        eth = b'\x00\x11\x22\x33\x44\x55\x66\x77\x88\x99\xaa\xbb' + ethertype
+        ts += rng.expovariate(10000.0)
+        packets.append((ts, eth + ip + l4 + payload))
+    return packets
+
+
+def write_pcap(path, packets, snaplen=65535):
+    """Write packets to a classic libpcap file"""
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, snaplen, 1))
+        for ts, data in packets:
+            sec = int(ts)
+            usec = int((ts - sec) * 1000000)
+            f.write(struct.pack('<IIII', sec, usec, len(data), len(data)))
+            f.write(data)
+
+
+def make_proc_snapshot(root, processes=500, seed=1):
+    """Create a fake /proc tree with status, cmdline and stat files"""
+    rng = random.Random(seed)
+    names = ('sshd', 'nginx', 'postgres', 'python3', 'bash', 'cron', 'systemd', 'java', 'node')
+    for pid in range(1, processes + 1):
+        directory = os.path.join(root, str(pid))
+        os.makedirs(directory, exist_ok=True)
+        name = rng.choice(names)
+        ppid = rng.randrange(1, pid) if pid > 1 else 0
+        uid = rng.choice((0, 0, 33, 1000))
+        with open(os.path.join(directory, 'status'), 'w') as f:
+            f.write(f'Name:\t{name}\nState:\tS (sleeping)\nPid:\t{pid}\nPPid:\t{ppid}\n'
+                    f'Uid:\t{uid}\t{uid}\t{uid}\t{uid}\nVmRSS:\t{rng.randrange(1000, 10 ** 6)} kB\n'
+                    f'Threads:\t{rng.randrange(1, 64)}\n')
+        with open(os.path.join(directory, 'cmdline'), 'wb') as f:
+            f.write(b'\0'.join([f'/usr/bin/{name}'.encode()] +
+                               [f'--{rng.choice(WORDS)}'.encode() for _ in range(rng.randrange(4))]) + b'\0')
+        with open(os.path.join(directory, 'stat'), 'w') as f:
+            # All 52 fields of proc(5), mostly zero
+            fields = [pid, f'({name})', 'S', ppid, pid, pid, 0, -1, 4194560, rng.randrange(10 ** 5), 0, 0, 0,
+                      rng.randrange(10 ** 6), rng.randrange(10 ** 5), 0, 0, 20, 0, 1, 0,
+                      rng.randrange(10 ** 7), rng.randrange(10 ** 9), rng.randrange(10 ** 5)]
+            fields += [0] * (52 - len(fields))
+            f.write(' '.join(map(str, fields)) + '\n')
+
+    # System-wide files that process listings depend on (boot time)
+    with open(os.path.join(root, 'stat'), 'w') as f:
+        f.write('cpu  1000 0 1000 100000 0 0 0 0 0 0\nbtime 1577836800\n')
+    return processes
+
+
+def timestamp():
+    """Return the current time for result files"""
+    return time.strftime('%Y-%m-%dT%H:%M:%S%z')
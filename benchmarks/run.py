@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark suite for ZeroHunter
+
+Generates a deterministic corpus (see corpus.py) in a temporary directory,
+runs the hot paths of the detection engine against it and writes the
+results as JSON. Compare two result files with compare.py.
+
+Usage:
+    python benchmarks/run.py [--quick] [--only NAME] [--output results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import corpus  # noqa: E402
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a benchmark function"""
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+class SkipBenchmark(Exception):
+    """Raised when a benchmark cannot run in this environment"""
+
+
+class Context:
+    """Shared corpus and parameters for the benchmarks"""
+
+    def __init__(self, work_dir, args):
+        """Initialize benchmark context"""
+        self.work_dir = work_dir
+        self.args = args
+        self._tree = None
+        self._packets = None
+        self._iocs = None
+
+    @property
+    def tree(self):
+        """Return (root, files, total bytes) of the generated file tree"""
+        if self._tree is None:
+            root = os.path.join(self.work_dir, 'tree')
+            total = corpus.make_file_tree(root, files=self.args.files, seed=self.args.seed,
+                                          max_size=self.args.max_file_size)
+            files = sorted(os.path.join(base, name)
+                           for base, _, names in os.walk(root) for name in names)
+            self._tree = (root, files, total)
+        return self._tree
+
+    @property
+    def packets(self):
+        """Return the generated packets"""
+        if self._packets is None:
+            self._packets = corpus.make_packets(self.args.packets, seed=self.args.seed)
+            corpus.write_pcap(os.path.join(self.work_dir, 'bench.pcap'), self._packets)
+        return self._packets
+
+    @property
+    def iocs(self):
+        """Return the generated IOC set, installed as the threat intelligence data"""
+        if self._iocs is None:
+            self._iocs = corpus.make_iocs(self.args.iocs, seed=self.args.seed)
+            data_dir = os.path.join(self.work_dir, 'home', '.zerohunter', 'data', 'threat_intel')
+            os.makedirs(os.path.join(data_dir, 'yara'), exist_ok=True)
+            with open(os.path.join(data_dir, 'iocs.json'), 'w') as f:
+                json.dump(self._iocs, f)
+            corpus.make_yara_rules(os.path.join(data_dir, 'yara', 'bench.yar'),
+                                   rules=self.args.rules, seed=self.args.seed)
+        return self._iocs
+
+    def config(self, **detection):
+        """Return a configuration with only the given detectors enabled"""
+        from zerohunter.core.config import Config
+        config = Config()
+        for name in ('behavioral_analysis', 'anomaly_detection', 'network_analysis', 'threat_intelligence'):
+            config.set(f'detection.{name}', detection.get(name, False))
+        config.set('scan.cache', False)
+        config.set('metrics.prometheus_file', None)
+        return config
+
+
+def measure(func, repeat):
+    """Run func repeat times and return the best wall time"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def require(module):
+    """Skip the benchmark if a module is not installed"""
+    try:
+        __import__(module)
+    except ImportError:
+        raise SkipBenchmark(f"{module} is not installed")
+
+
+@benchmark('engine.scan_file')
+def bench_scan_file(ctx):
+    """DetectionEngine.scan_file over every file of the tree, one process"""
+    require('yara')
+    ctx.iocs
+    _, files, total = ctx.tree
+    from zerohunter.detection import DetectionEngine
+    engine = DetectionEngine(ctx.config(behavioral_analysis=True, threat_intelligence=True))
+
+    def run():
+        for path in files:
+            engine.scan_file(path)
+    return {'seconds': measure(run, ctx.args.repeat), 'ops': len(files), 'bytes': total}
+
+
+@benchmark('engine.scan_directory')
+def bench_scan_directory(ctx):
+    """DetectionEngine.scan_directory with the configured number of jobs"""
+    require('yara')
+    ctx.iocs
+    root, files, total = ctx.tree
+    from zerohunter.detection import DetectionEngine
+    engine = DetectionEngine(ctx.config(behavioral_analysis=True, threat_intelligence=True))
+    seconds = measure(lambda: engine.scan_directory(root, jobs=ctx.args.jobs), ctx.args.repeat)
+    return {'seconds': seconds, 'ops': len(files), 'bytes': total, 'jobs': ctx.args.jobs}
+
+
+@benchmark('engine.scan_directory_warm_cache')
+def bench_scan_directory_cached(ctx):
+    """DetectionEngine.scan_directory when nothing changed since the last scan"""
+    require('yara')
+    ctx.iocs
+    root, files, total = ctx.tree
+    from zerohunter.detection import DetectionEngine
+    config = ctx.config(behavioral_analysis=True, threat_intelligence=True)
+    config.set('scan.cache_file', os.path.join(ctx.work_dir, 'scan_cache.db'))
+    engine = DetectionEngine(config, use_cache=True)
+    engine.scan_directory(root, jobs=ctx.args.jobs)
+    seconds = measure(lambda: engine.scan_directory(root, jobs=ctx.args.jobs), ctx.args.repeat)
+    return {'seconds': seconds, 'ops': len(files), 'bytes': total, 'jobs': ctx.args.jobs}
+
+
+@benchmark('threat_intel.check_ioc')
+def bench_check_ioc(ctx):
+    """ThreatIntelligence.check_ioc with a 50/50 mix of hits and misses"""
+    iocs = ctx.iocs
+    from zerohunter.detection.threat_intel import ThreatIntelligence
+    intel = ThreatIntelligence(ctx.config(threat_intelligence=True))
+    queries = []
+    for ioc_type, values in iocs.items():
+        for i, value in enumerate(values[:ctx.args.lookups // 8]):
+            queries.append((ioc_type, value))
+            queries.append((ioc_type, f'{value}-miss{i}'))
+
+    def run():
+        for ioc_type, value in queries:
+            intel.check_ioc(ioc_type, value)
+    return {'seconds': measure(run, ctx.args.repeat), 'ops': len(queries), 'iocs': sum(map(len, iocs.values()))}
+
+
+@benchmark('threat_intel.check_iocs')
+def bench_check_iocs(ctx):
+    """ThreatIntelligence.check_iocs on per-type batches with the same mix as check_ioc"""
+    iocs = ctx.iocs
+    from zerohunter.detection.threat_intel import ThreatIntelligence
+    intel = ThreatIntelligence(ctx.config(threat_intelligence=True))
+    batches = []
+    for ioc_type, values in iocs.items():
+        batch = []
+        for i, value in enumerate(values[:ctx.args.lookups // 8]):
+            batch.append(value)
+            batch.append(f'{value}-miss{i}')
+        batches.append((ioc_type, batch))
+
+    def run():
+        for ioc_type, batch in batches:
+            intel.check_iocs(ioc_type, batch)
+    return {'seconds': measure(run, ctx.args.repeat), 'ops': sum(len(batch) for _, batch in batches),
+            'iocs': sum(map(len, iocs.values()))}
+
+
+@benchmark('threat_intel.match_domains')
+def bench_match_domains(ctx):
+    """ThreatIntelligence.match_domains on subdomains of listed and unlisted domains"""
+    iocs = ctx.iocs
+    from zerohunter.detection.threat_intel import ThreatIntelligence
+    intel = ThreatIntelligence(ctx.config(threat_intelligence=True))
+    names = []
+    for i, domain in enumerate(iocs['domain'][:ctx.args.lookups // 2]):
+        names.append(f'www{i}.cdn.{domain}')
+        names.append(f'www{i}.cdn.miss{i}.{domain}.net')
+
+    def run():
+        intel.match_domains(names)
+    return {'seconds': measure(run, ctx.args.repeat), 'ops': len(names), 'iocs': sum(map(len, iocs.values()))}
+
+
+@benchmark('threat_intel.lookup_networks')
+def bench_lookup_networks(ctx):
+    """ThreatIntelligence.lookup_networks on a batch of IPv4 addresses"""
+    import numpy as np
+    ctx.iocs
+    from zerohunter.detection.threat_intel import ThreatIntelligence
+    intel = ThreatIntelligence(ctx.config(threat_intelligence=True))
+    networks = corpus.make_networks(ctx.args.networks, seed=ctx.args.seed)
+    intel.iocs['network'].update(networks)
+    intel.update()
+    addresses = np.random.default_rng(ctx.args.seed).integers(0, 2 ** 32, ctx.args.lookups, dtype=np.uint64)
+
+    def run():
+        intel.lookup_networks(addresses)
+    return {'seconds': measure(run, ctx.args.repeat), 'ops': len(addresses), 'networks': len(networks)}
+
+
+@benchmark('threat_intel.yara_match')
+def bench_yara(ctx):
+    """ThreatIntelligence.scan_file on in-memory buffers"""
+    require('yara')
+    ctx.iocs
+    _, files, total = ctx.tree
+    from zerohunter.detection.threat_intel import ThreatIntelligence
+    intel = ThreatIntelligence(ctx.config(threat_intelligence=True))
+    buffers = []
+    for path in files:
+        with open(path, 'rb') as f:
+            buffers.append((path, f.read()))
+
+    def run():
+        for path, data in buffers:
+            intel.scan_file(path, data)
+    return {'seconds': measure(run, ctx.args.repeat), 'ops': len(files), 'bytes': total,
+            'rules': ctx.args.rules}
+
+
+@benchmark('network.process_packet')
+def bench_process_packet(ctx):
+    """NetworkAnalyzer._process_packet over a synthetic packet stream"""
+    packets = ctx.packets
+    from zerohunter.detection.network import NetworkAnalyzer
+    analyzer = NetworkAnalyzer(ctx.config(network_analysis=True))
+    total = sum(len(pkt) for _, pkt in packets)
+
+    def run():
+        process = analyzer._process_packet
+        for ts, pkt in packets:
+            process(ts, pkt, 'bench0')
+    return {'seconds': measure(run, ctx.args.repeat), 'ops': len(packets), 'bytes': total}
+
+
+@benchmark('network.decode_packet')
+def bench_decode_packet(ctx):
+    """PacketDecoder.decode on one core over a mixed IPv4/IPv6/VLAN stream"""
+    from zerohunter.detection.packet import PacketDecoder
+    packets = corpus.make_packets(ctx.args.packets, seed=ctx.args.seed, ipv6_rate=0.2, vlan_rate=0.2)
+    decoder = PacketDecoder()
+    total = sum(len(pkt) for _, pkt in packets)
+
+    def run():
+        decode = decoder.decode
+        for ts, pkt in packets:
+            decode(ts, pkt)
+    return {'seconds': measure(run, ctx.args.repeat), 'ops': len(packets), 'bytes': total}
+
+
+@benchmark('network.replay_pcap')
+def bench_replay_pcap(ctx):
+    """NetworkAnalyzer.replay_pcap over the generated capture file"""
+    packets = ctx.packets
+    path = os.path.join(ctx.work_dir, 'bench.pcap')
+    from zerohunter.detection.network import NetworkAnalyzer
+    analyzer = NetworkAnalyzer(ctx.config(network_analysis=True))
+    seconds = measure(lambda: analyzer.replay_pcap(path, jobs=ctx.args.jobs), ctx.args.repeat)
+    return {'seconds': seconds, 'ops': len(packets), 'bytes': os.path.getsize(path), 'jobs': ctx.args.jobs}
+
+
+@benchmark('ml.predict')
+def bench_predict(ctx):
+    """ModelManager.predict for the system and network models"""
+    require('sklearn')
+    import numpy as np
+    from zerohunter.ml import ModelManager
+    manager = ModelManager(ctx.config())
+    rng = np.random.default_rng(ctx.args.seed)
+    train = rng.normal(size=(2000, 8))
+    batch = rng.normal(size=(ctx.args.lookups, 8))
+    for name in ('system_if', 'network_svm'):
+        manager.train_model(name, train)
+
+    def run():
+        for name in ('system_if', 'network_svm'):
+            manager.predict(name, batch)
+    return {'seconds': measure(run, ctx.args.repeat), 'ops': 2 * len(batch)}
+
+
+@benchmark('proc.process_iter')
+def bench_process_iter(ctx):
+    """psutil process listing over a fake /proc snapshot, as used by scan_system"""
+    require('psutil')
+    import psutil
+    if not hasattr(psutil, 'PROCFS_PATH'):
+        raise SkipBenchmark("psutil has no PROCFS_PATH on this platform")
+    root = os.path.join(ctx.work_dir, 'proc')
+    count = corpus.make_proc_snapshot(root, processes=ctx.args.processes, seed=ctx.args.seed)
+    previous = psutil.PROCFS_PATH
+    psutil.PROCFS_PATH = root
+
+    def run():
+        for proc in psutil.process_iter(['pid', 'name', 'username']):
+            proc.info
+    try:
+        seconds = measure(run, ctx.args.repeat)
+    finally:
+        psutil.PROCFS_PATH = previous
+    return {'seconds': seconds, 'ops': count}
+
+
+def git_commit():
+    """Return the current git commit, if any"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def run_benchmarks(args):
+    """Run the selected benchmarks and return the results"""
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Keep the user's configuration, rules and caches out of the measurements
+        home = os.path.join(work_dir, 'home')
+        os.makedirs(home)
+        os.environ['HOME'] = home
+        ctx = Context(work_dir, args)
+
+        for name in args.only or BENCHMARKS:
+            func = BENCHMARKS[name]
+            try:
+                result = func(ctx)
+            except SkipBenchmark as e:
+                results[name] = {'status': 'skipped', 'reason': str(e)}
+                print(f"{name:<40} skipped ({e})", file=sys.stderr)
+                continue
+            except Exception as e:
+                results[name] = {'status': 'error', 'reason': repr(e)}
+                print(f"{name:<40} error ({e!r})", file=sys.stderr)
+                continue
+
+            result['status'] = 'ok'
+            result['ops_per_s'] = result['ops'] / result['seconds'] if result['seconds'] else 0.0
+            if 'bytes' in result:
+                result['mb_per_s'] = result['bytes'] / (1024 * 1024) / result['seconds'] if result['seconds'] else 0.0
+            results[name] = result
+            print(f"{name:<40} {result['ops_per_s']:>14.1f} ops/s", file=sys.stderr)
+    return results
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Run the ZeroHunter benchmark suite')
+    parser.add_argument('--only', action='append', choices=sorted(BENCHMARKS), help='Benchmark to run (repeatable)')
+    parser.add_argument('--quick', action='store_true', help='Use a small corpus')
+    parser.add_argument('--seed', type=int, default=1, help='Corpus seed')
+    parser.add_argument('--files', type=int, default=2000, help='Files in the generated tree')
+    parser.add_argument('--max-file-size', type=int, default=4 * 1024 * 1024, help='Largest generated file')
+    parser.add_argument('--packets', type=int, default=200000, help='Packets in the generated stream')
+    parser.add_argument('--iocs', type=int, default=1000000, help='Total IOCs (10k to 10M)')
+    parser.add_argument('--networks', type=int, default=300000, help='Network IOCs (CIDR prefixes)')
+    parser.add_argument('--rules', type=int, default=200, help='YARA rules')
+    parser.add_argument('--lookups', type=int, default=100000, help='Lookups / predictions per run')
+    parser.add_argument('--processes', type=int, default=1000, help='Processes in the fake /proc')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='Scan workers')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per benchmark (best is kept)')
+    parser.add_argument('--output', type=str, help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    if args.quick:
+        args.files, args.max_file_size, args.packets = 200, 256 * 1024, 20000
+        args.iocs, args.lookups, args.processes, args.repeat = 10000, 10000, 200, 1
+        args.networks = 10000
+
+    logging.basicConfig(level=logging.ERROR)
+
+    output = json.dumps({
+        'suite': 'zerohunter',
+        'commit': git_commit(),
+        'timestamp': corpus.timestamp(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'params': {key: value for key, value in vars(args).items() if key not in ('only', 'output')},
+        'results': run_benchmarks(args),
+    }, indent=4)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -33,6 +33,44 @@ class Config:
                 'analyze_email': True,
                 'analyze_ftp': True,
                 'analyze_ssh': True,
+                'capture_other_traffic': False,  # also capture ports not analyzed above
+                'ignore_peers': [],  # hosts or networks excluded from capture (e.g. backups)
+                'capture_filter': '',  # extra BPF expression, ANDed with the generated one
+                'poll_batch': 1000,  # packets processed per handle before moving on
+                'capture_timeout_ms': 50,  # kernel buffer timeout
+                'capture_immediate': False,  # deliver every packet at once (more wakeups)
+                'capture_backend': 'pcap',  # or 'afpacket' (Linux TPACKET_V3 ring, no libpcap copy)
+                'capture_fanout': 1,  # afpacket sockets per interface, sharing flows by hash
+                'afpacket_block_size': 1024 * 1024,  # bytes, a multiple of the page size
+                'afpacket_block_count': 64,
+                'afpacket_frame_size': 2048,  # block_size must be a multiple of it
+                'stats_interval': 10.0,  # seconds between capture drop counter updates
+                'analysis_workers': 1,  # packet analysis threads (or processes), one ring each
+                'analysis_processes': False,  # analyze in forked processes sharing the rings
+                'ring_slots': 16384,  # packets buffered between capture and analysis per worker
+                'ring_slot_size': 2048,  # longer packets are truncated in the ring
+                'overload_control': True,  # shed load when analysis falls behind capture
+                'overload_interval': 1.0,  # seconds between overload checks
+                'overload_high_watermark': 0.5,  # ring fill that triggers shedding
+                'overload_low_watermark': 0.1,  # ring fill below which load is restored
+                'overload_max_latency': 1.0,  # seconds to drain the queued packets
+                'overload_min_sample_rate': 1 / 64,  # smallest share of flows analyzed
+                'overload_recover_after': 5,  # calm checks before each recovery step
+                'low_priority_protocols': ['http'],  # analyzed header-only under overload
+                'max_flows': 200000,  # least recently seen flows are evicted beyond this
+                'flow_idle_timeout': 60.0,  # seconds
+                'flow_active_timeout': 300.0,  # long-lived flows are exported this often
+                'flow_export_interval': 10.0,  # seconds
+                'max_flow_batches': 64,  # exported batches kept for the anomaly detector
+                'reassembly': True,  # rebuild HTTP/SMTP/FTP streams for the protocol analyzers
+                'reassembly_depth': 64 * 1024,  # bytes reassembled per stream direction
+                'reassembly_max_streams': 50000,
+                'reassembly_max_pending': 256 * 1024,  # out-of-order bytes buffered per direction
+                'reassembly_max_memory': 128 * 1024 * 1024,  # out-of-order bytes buffered in total
+                'reassembly_window': 1024 * 1024,  # segments further ahead are dropped
+                'reassembly_idle_timeout': 120.0,  # seconds
+                'max_line': 8192,  # longest protocol line buffered by the analyzers
+                'max_events': 10000,  # protocol events kept
             },
             'system': {
                 'monitor_processes': True,
@@ -49,18 +87,71 @@ class Config:
                 'machine_learning': True,
                 'threat_intelligence': True,
             },
+            'scan': {
+                'jobs': 0,  # 0 = one worker per CPU
+                'batch_size': 64,  # files per worker task
+                'max_file_size': 64 * 1024 * 1024,  # bytes read into memory
+                'max_map_size': 2 * 1024 * 1024 * 1024,  # bytes memory-mapped, larger files are streamed
+                'queue_size': 1024,  # findings buffered ahead of the consumer
+                'cache': True,
+                'cache_file': os.path.expanduser('~/.zerohunter/data/scan_cache.db'),
+                'max_cpu_percent': 0,  # share of total host CPU, 0 = unlimited
+                'max_read_mb_per_s': 0,  # 0 = unlimited
+                'max_processes_per_s': 0,  # process inspections, 0 = unlimited
+                'nice': 10,
+                'ionice_class': 'best-effort',  # realtime, best-effort, idle or none
+                'ionice_level': 7,
+                'load_threshold': 1.0,  # 1-minute load average per CPU
+                'pressure_threshold': 10.0,  # /proc/pressure 'some avg10' percent
+                'adapt_interval': 1.0,
+                'min_throttle_factor': 0.05,
+            },
+            'distributed': {
+                'listen': '127.0.0.1:7643',  # coordinator address
+                'connect': '127.0.0.1:7643',  # worker's coordinator address
+                'token': '',  # shared secret between coordinator and workers
+                'shard_files': 256,
+                'shard_bytes': 256 * 1024 * 1024,
+                'max_retries': 3,
+                'shard_timeout': 300.0,  # seconds without progress
+                'progress_interval': 32,  # files between progress reports
+                'min_steal': 16,  # smallest half-shard given to an idle worker
+            },
+            'scheduler': {
+                'max_workers': 2,
+                'jitter': 0.1,  # fraction of the interval
+                'behavioral_interval': 1.0,  # seconds
+                'anomaly_interval': 5.0,  # seconds
+                'threat_intel_interval': 60.0,  # seconds
+            },
+            'metrics': {
+                'enabled': True,
+                'export_interval': 60.0,  # seconds
+                'prometheus_file': os.path.expanduser('~/.zerohunter/data/metrics.prom'),
+            },
             'ml': {
                 'models_dir': os.path.expanduser('~/.zerohunter/models'),
                 'auto_train': True,
                 'training_interval': 7,  # days
                 'detection_threshold': 0.8,
+                'max_buffered_samples': 100000,  # per metric source
             },
             'threat_intelligence': {
                 'update_interval': 24,  # hours
-                'sources': [
-                    'https://threatintel.example.com/feed1',
-                    'https://threatintel.example.com/feed2',
-                ],
+                'bloom_fp_rate': 0.01,  # false positives let through to the exact IOC lookup
+                'domain_subdomains': True,  # listed domains also match their subdomains
+                # Feed URLs, or dicts with url, format (text, csv, json or stix),
+                # type (forced IOC type) and column (CSV column of the indicator)
+                'sources': [],
+                'feed_workers': 4,  # feeds fetched at once
+                'feed_timeout': 60.0,  # seconds
+                'feed_max_size': 512 * 1024 * 1024,  # bytes; larger feeds are rejected
+                'yara_timeout': 60,  # seconds per file
+                'yara_max_scan_size': 0,  # bytes matched per file, 0 = whole file
+                # Files above scan.max_map_size are matched in overlapping windows;
+                # matches longer than the overlap can be missed at window edges
+                'yara_chunk_size': 64 * 1024 * 1024,
+                'yara_chunk_overlap': 1024 * 1024,
             },
             'ui': {
                 'dashboard_refresh_interval': 5,  # seconds
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Resource governor for ZeroHunter scans
+
+Keeps scans from starving the workload of the host they run on: applies
+nice/ionice, rate-limits file reads and process inspection with token
+buckets, caps CPU usage with a duty cycle, and backs off further while
+the host's load average or pressure stall information (/proc/pressure)
+is high.
+"""
+
+import os
+import time
+import logging
+import threading
+
+from zerohunter.core.metrics import get_registry
+
+logger = logging.getLogger('zerohunter.core.governor')
+
+IONICE_CLASSES = ('realtime', 'best-effort', 'idle')
+
+class TokenBucket:
+    """Token bucket rate limiter holding up to one second of tokens; a rate of 0 means unlimited"""
+
+    def __init__(self, rate):
+        """Initialize token bucket"""
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        """Change the refill rate"""
+        with self._lock:
+            self._refill()
+            self.rate = rate
+            self.tokens = min(self.tokens, rate)
+
+    def acquire(self, tokens=1):
+        """Take tokens, sleeping until the bucket can pay for them; returns the wait"""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            self._refill()
+            # Large requests go into debt rather than waiting for a full bucket
+            self.tokens -= tokens
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def _refill(self):
+        """Add the tokens earned since the last update (lock held)"""
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+class ResourceGovernor:
+    """Throttles scan I/O and CPU usage according to the scan configuration"""
+
+    def __init__(self, config):
+        """Initialize resource governor"""
+        self.cpus = os.cpu_count() or 1
+        self.max_cpu_percent = config.get('scan.max_cpu_percent', 0)
+        self.max_read_rate = config.get('scan.max_read_mb_per_s', 0) * 1024 * 1024
+        self.max_process_rate = config.get('scan.max_processes_per_s', 0)
+        self.nice = config.get('scan.nice', 10)
+        self.ionice_class = config.get('scan.ionice_class', 'best-effort')
+        self.ionice_level = config.get('scan.ionice_level', 7)
+        self.load_threshold = config.get('scan.load_threshold', 1.0)
+        self.pressure_threshold = config.get('scan.pressure_threshold', 10.0)
+        self.adapt_interval = config.get('scan.adapt_interval', 1.0)
+        self.min_factor = config.get('scan.min_throttle_factor', 0.05)
+        self.cpu_window = 0.1
+        self.metrics = get_registry()
+
+        # Share of the budget owned by this process (see share())
+        self.share_count = 1
+        self.factor = 1.0
+        self.load = 0.0
+        self.pressure = {}
+        self.throttled = 0.0
+        self.priority_applied = False
+        self.read_bucket = TokenBucket(self.max_read_rate)
+        self.process_bucket = TokenBucket(self.max_process_rate)
+        self._last_adapt = 0.0
+        self._cpu_mark = time.process_time()
+        self._wall_mark = time.monotonic()
+        self._lock = threading.Lock()
+
+    def share(self, count):
+        """Give this process 1/count of the budgets, e.g. in one of count scan workers"""
+        self.share_count = max(count, 1)
+        self._apply_factor()
+
+    def apply_priority(self):
+        """Lower the CPU and I/O priority of the current process"""
+        # os.nice() is relative, and forked workers inherit the priority
+        if self.priority_applied:
+            return
+        self.priority_applied = True
+        
+        if self.nice:
+            try:
+                os.nice(self.nice)
+            except OSError as e:
+                logger.warning(f"Could not change scan niceness: {e}")
+
+        if self.ionice_class in IONICE_CLASSES:
+            try:
+                import psutil
+                ioclass = {
+                    'realtime': psutil.IOPRIO_CLASS_RT,
+                    'best-effort': psutil.IOPRIO_CLASS_BE,
+                    'idle': psutil.IOPRIO_CLASS_IDLE,
+                }[self.ionice_class]
+                value = None if self.ionice_class == 'idle' else self.ionice_level
+                psutil.Process().ionice(ioclass, value)
+            except (ImportError, AttributeError, OSError) as e:
+                logger.warning(f"Could not change scan I/O priority: {e}")
+
+    def throttle_read(self, nbytes):
+        """Wait until reading nbytes fits in the budget"""
+        self._adapt()
+        waited = self.read_bucket.acquire(nbytes)
+        waited += self._throttle_cpu()
+        self._record(waited)
+
+    def throttle_process(self):
+        """Wait until inspecting one more process fits in the budget"""
+        self._adapt()
+        waited = self.process_bucket.acquire(1)
+        waited += self._throttle_cpu()
+        self._record(waited)
+
+    def stats(self):
+        """Return the current throttling state"""
+        return {
+            'factor': self.factor,
+            'load_per_cpu': self.load,
+            'pressure': dict(self.pressure),
+            'throttled_seconds': self.throttled,
+        }
+
+    def _record(self, waited):
+        """Account time spent throttled"""
+        if waited > 0:
+            self.throttled += waited
+            self.metrics.observe('ResourceGovernor', 'throttle', waited)
+
+    def _cpu_limit(self):
+        """Return the CPU time this process may use per second of wall time"""
+        if self.max_cpu_percent:
+            limit = self.max_cpu_percent / 100.0 * self.cpus / self.share_count
+        elif self.factor < 1.0:
+            # Unlimited scans are still throttled while the host is busy
+            limit = 1.0
+        else:
+            return None
+        return limit * self.factor
+
+    def _throttle_cpu(self):
+        """Sleep long enough to keep CPU usage under the limit"""
+        limit = self._cpu_limit()
+        if limit is None:
+            return 0.0
+
+        now = time.monotonic()
+        elapsed = now - self._wall_mark
+        if elapsed < self.cpu_window:
+            return 0.0
+
+        used = time.process_time() - self._cpu_mark
+        wait = used / limit - elapsed
+        if wait > 0:
+            time.sleep(wait)
+        self._cpu_mark = time.process_time()
+        self._wall_mark = time.monotonic()
+        return max(wait, 0.0)
+
+    def _adapt(self):
+        """Back off while the host is loaded, recover when it is not"""
+        now = time.monotonic()
+        if now - self._last_adapt < self.adapt_interval:
+            return
+        with self._lock:
+            if now - self._last_adapt < self.adapt_interval:
+                return
+            self._last_adapt = now
+
+            self.load = self._read_load()
+            self.pressure = {resource: self._read_pressure(resource) for resource in ('cpu', 'io')}
+            overloaded = self.load > self.load_threshold or \
+                any(value > self.pressure_threshold for value in self.pressure.values())
+
+            # Multiplicative decrease, additive increase
+            previous = self.factor
+            if overloaded:
+                self.factor = max(self.min_factor, self.factor * 0.5)
+            else:
+                self.factor = min(1.0, self.factor + 0.1)
+            if self.factor != previous:
+                logger.debug(f"Scan throttle factor {previous:.2f} -> {self.factor:.2f} "
+                             f"(load {self.load:.2f}/cpu, pressure {self.pressure})")
+                self._apply_factor()
+
+    def _apply_factor(self):
+        """Scale the token bucket rates by the share and the backoff factor"""
+        scale = self.factor / self.share_count
+        self.read_bucket.set_rate(self.max_read_rate * scale)
+        self.process_bucket.set_rate(self.max_process_rate * scale)
+
+    def _read_load(self):
+        """Return the 1-minute load average per CPU, without the scan's own processes"""
+        try:
+            # Every one of the share_count scan processes adds about 1 to the
+            # load; counting them would make a scan with one worker per CPU
+            # back off from the load it causes itself
+            return max(os.getloadavg()[0] - self.share_count, 0.0) / self.cpus
+        except OSError:
+            return 0.0
+
+    def _read_pressure(self, resource):
+        """Return the 'some avg10' stall percentage from /proc/pressure"""
+        try:
+            with open(f'/proc/pressure/{resource}', 'r') as f:
+                for line in f:
+                    if line.startswith('some '):
+                        for field in line.split()[1:]:
+                            key, _, value = field.partition('=')
+                            if key == 'avg10':
+                                return float(value)
+        except (OSError, ValueError):
+            pass
+        return 0.0
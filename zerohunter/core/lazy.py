@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Lazy import helpers for ZeroHunter
+
+Heavy optional dependencies (TensorFlow, scikit-learn, PyQt5, yara, pcap)
+are only imported when they are first used, so short CLI invocations do
+not pay for modules they never touch.
+"""
+
+import importlib
+import threading
+import types
+
+_lock = threading.RLock()
+
+class LazyModule(types.ModuleType):
+    """Module placeholder that imports the real module on first attribute access"""
+
+    def __init__(self, name):
+        """Initialize lazy module"""
+        super().__init__(name)
+        self.__dict__['_lazy_loaded'] = False
+
+    def _load(self):
+        """Import the real module and take over its namespace"""
+        with _lock:
+            if not self.__dict__['_lazy_loaded']:
+                module = importlib.import_module(self.__name__)
+                # Later attribute lookups hit the instance dict directly
+                self.__dict__.update(module.__dict__)
+                self.__dict__['_lazy_loaded'] = True
+
+    def __getattr__(self, name):
+        """Load the module and return the requested attribute"""
+        if self.__dict__['_lazy_loaded']:
+            raise AttributeError(f"module '{self.__name__}' has no attribute '{name}'")
+        self._load()
+        return getattr(self, name)
+
+    def __dir__(self):
+        """List the attributes of the real module"""
+        self._load()
+        return list(self.__dict__)
+
+    def __repr__(self):
+        """Return a representation showing whether the module is loaded"""
+        state = 'loaded' if self.__dict__['_lazy_loaded'] else 'not loaded'
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+
+def lazy_import(name):
+    """Return a module that is imported when one of its attributes is used"""
+    return LazyModule(name)
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Metrics module for ZeroHunter
+
+Collects call counts, latency histograms, bytes processed and error counts
+for every detector operation, and exports them as a Prometheus text file.
+"""
+
+import os
+import time
+import bisect
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger('zerohunter.core.metrics')
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+           0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+class OperationStats:
+    """Statistics for one detector operation"""
+
+    __slots__ = ('calls', 'errors', 'bytes', 'seconds', 'buckets', 'min', 'max', '_lock')
+
+    def __init__(self):
+        """Initialize operation statistics"""
+        self.calls = 0
+        self.errors = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        # Fastest and slowest call, bounding the quantile estimates
+        self.min = float('inf')
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, nbytes=0, error=False, count=1):
+        """Record count calls that took seconds in total"""
+        # Batched calls are filed under their mean latency
+        latency = seconds / count if count else seconds
+        index = bisect.bisect_left(BUCKETS, latency)
+        with self._lock:
+            self.calls += count
+            self.bytes += nbytes
+            self.seconds += seconds
+            self.buckets[index] += count
+            if latency < self.min:
+                self.min = latency
+            if latency > self.max:
+                self.max = latency
+            if error:
+                self.errors += 1
+
+    def quantile(self, q):
+        """Estimate a latency quantile from the histogram"""
+        if not self.calls:
+            return 0.0
+        rank = q * self.calls
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(BUCKETS, self.buckets):
+            if count and seen + count >= rank:
+                # Interpolate linearly inside the bucket, narrowed to the
+                # fastest and slowest calls seen
+                low = max(lower, self.min)
+                high = min(bound, self.max)
+                if high <= low:
+                    return high
+                return low + (high - low) * max(rank - seen, 0) / count
+            seen += count
+            lower = bound
+        return self.max
+
+    def snapshot(self):
+        """Return the statistics as a dictionary"""
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'errors': self.errors,
+                'bytes': self.bytes,
+                'seconds': self.seconds,
+                'buckets': list(self.buckets),
+                'min': self.min if self.calls else 0.0,
+                'max': self.max,
+            }
+
+    def merge(self, data):
+        """Add statistics from a snapshot"""
+        with self._lock:
+            self.calls += data['calls']
+            self.errors += data['errors']
+            self.bytes += data['bytes']
+            self.seconds += data['seconds']
+            for i, count in enumerate(data['buckets']):
+                self.buckets[i] += count
+            if data['calls']:
+                self.min = min(self.min, data['min'])
+                self.max = max(self.max, data['max'])
+
+class MetricsRegistry:
+    """Registry of detector operation statistics"""
+
+    def __init__(self):
+        """Initialize metrics registry"""
+        self.enabled = True
+        self._operations = {}
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def operation(self, detector, operation):
+        """Return the statistics for a detector operation"""
+        key = (detector, operation)
+        stats = self._operations.get(key)
+        if stats is None:
+            with self._lock:
+                stats = self._operations.setdefault(key, OperationStats())
+        return stats
+
+    def observe(self, detector, operation, seconds, nbytes=0, error=False, count=1):
+        """Record a detector call"""
+        if self.enabled:
+            self.operation(detector, operation).observe(seconds, nbytes, error, count)
+
+    def set_counter(self, name, value, **labels):
+        """Record the current value of a counter maintained elsewhere, e.g. by the kernel"""
+        if self.enabled:
+            key = (name, tuple(sorted(labels.items())))
+            with self._lock:
+                self._counters[key] = value
+
+    def counters(self):
+        """Return the external counters as (name, labels, value) tuples"""
+        with self._lock:
+            items = sorted(self._counters.items())
+        return [(name, dict(labels), value) for (name, labels), value in items]
+
+    def set_gauge(self, name, value, **labels):
+        """Record the current value of a quantity that can go up and down"""
+        if self.enabled:
+            key = (name, tuple(sorted(labels.items())))
+            with self._lock:
+                self._gauges[key] = value
+
+    def gauges(self):
+        """Return the gauges as (name, labels, value) tuples"""
+        with self._lock:
+            items = sorted(self._gauges.items())
+        return [(name, dict(labels), value) for (name, labels), value in items]
+
+    @contextmanager
+    def timed(self, detector, operation, nbytes=0):
+        """Time the enclosed block as one call of a detector operation"""
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.observe(detector, operation, time.perf_counter() - start, nbytes, error)
+
+    def snapshot(self):
+        """Return all statistics keyed by 'detector.operation'"""
+        with self._lock:
+            operations = list(self._operations.items())
+        return {f"{detector}.{operation}": stats.snapshot()
+                for (detector, operation), stats in sorted(operations)}
+
+    def merge(self, snapshot):
+        """Add statistics collected elsewhere, e.g. in a scan worker"""
+        for name, data in snapshot.items():
+            detector, operation = name.split('.', 1)
+            self.operation(detector, operation).merge(data)
+
+    def reset(self):
+        """Drop all statistics"""
+        with self._lock:
+            self._operations = {}
+            self._counters = {}
+            self._gauges = {}
+
+    def summary(self):
+        """Return a human-readable summary table"""
+        lines = [f"{'operation':<40} {'calls':>10} {'errors':>7} {'MB':>10} "
+                 f"{'mean ms':>9} {'p50 ms':>8} {'p99 ms':>8}"]
+        with self._lock:
+            operations = sorted(self._operations.items())
+        for (detector, operation), stats in operations:
+            if not stats.calls:
+                continue
+            lines.append(
+                f"{detector + '.' + operation:<40} {stats.calls:>10} {stats.errors:>7} "
+                f"{stats.bytes / (1024 * 1024):>10.1f} {stats.seconds / stats.calls * 1000:>9.3f} "
+                f"{stats.quantile(0.5) * 1000:>8.2f} {stats.quantile(0.99) * 1000:>8.2f}"
+            )
+        return '\n'.join(lines)
+
+    def to_prometheus(self):
+        """Render all statistics in the Prometheus text format"""
+        lines = [
+            '# HELP zerohunter_detector_latency_seconds Latency of detector operations',
+            '# TYPE zerohunter_detector_latency_seconds histogram',
+        ]
+        counters = []
+        with self._lock:
+            operations = sorted(self._operations.items())
+        for (detector, operation), stats in operations:
+            data = stats.snapshot()
+            labels = f'detector="{detector}",operation="{operation}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS, data['buckets']):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'zerohunter_detector_latency_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'zerohunter_detector_latency_seconds_sum{{{labels}}} {data["seconds"]}')
+            lines.append(f'zerohunter_detector_latency_seconds_count{{{labels}}} {data["calls"]}')
+            counters.append((labels, data))
+
+        lines.append('# HELP zerohunter_detector_errors_total Failed detector operations')
+        lines.append('# TYPE zerohunter_detector_errors_total counter')
+        for labels, data in counters:
+            lines.append(f'zerohunter_detector_errors_total{{{labels}}} {data["errors"]}')
+        lines.append('# HELP zerohunter_detector_bytes_total Bytes processed by detector operations')
+        lines.append('# TYPE zerohunter_detector_bytes_total counter')
+        for labels, data in counters:
+            lines.append(f'zerohunter_detector_bytes_total{{{labels}}} {data["bytes"]}')
+
+        declared = set()
+        for kind, values in (('counter', self.counters()), ('gauge', self.gauges())):
+            for name, labels, value in values:
+                if name not in declared:
+                    lines.append(f'# TYPE zerohunter_{name} {kind}')
+                    declared.add(name)
+                rendered = ','.join(f'{key}="{label}"' for key, label in labels.items())
+                lines.append(f'zerohunter_{name}{{{rendered}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """Atomically write the Prometheus text file (for node_exporter's textfile collector)"""
+        try:
+            directory = os.path.dirname(path) or '.'
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.metrics-')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write(self.to_prometheus())
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            return True
+        except Exception as e:
+            logger.error(f"Error writing metrics to {path}: {e}")
+            return False
+
+_registry = MetricsRegistry()
+
+
+def get_registry():
+    """Return the process-wide metrics registry"""
+    return _registry
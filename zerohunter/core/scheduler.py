@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Task scheduler for ZeroHunter
+
+Detectors register periodic or event-driven tasks here instead of running
+their own polling threads. A single dispatcher thread sleeps until the next
+task is due and hands it to a bounded worker pool.
+"""
+
+import time
+import heapq
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger('zerohunter.core.scheduler')
+
+# Task priorities, lower values run first when several tasks are due
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+PRIORITY_LOW = 20
+
+class Task:
+    """A task registered with the scheduler"""
+
+    __slots__ = ('name', 'func', 'interval', 'priority', 'jitter', 'deadline',
+                 'base_run', 'next_run', 'seq', 'pending', 'running', 'cancelled',
+                 'runs', 'missed', 'errors', 'last_duration')
+
+    def __init__(self, name, func, interval=None, priority=PRIORITY_NORMAL, jitter=0.0, deadline=None):
+        """Initialize task"""
+        self.name = name
+        self.func = func
+        self.interval = interval  # None for event-driven tasks
+        self.priority = priority
+        self.jitter = jitter
+        self.deadline = deadline
+        self.base_run = None  # due time before jitter
+        self.next_run = None
+        self.seq = None  # queue entry currently in effect
+        self.pending = False
+        self.running = False
+        self.cancelled = False
+        self.runs = 0
+        self.missed = 0
+        self.errors = 0
+        self.last_duration = 0.0
+
+    def stats(self):
+        """Return task statistics"""
+        return {
+            'interval': self.interval,
+            'priority': self.priority,
+            'runs': self.runs,
+            'missed': self.missed,
+            'errors': self.errors,
+            'last_duration': self.last_duration,
+        }
+
+class Scheduler:
+    """Runs periodic and event-driven tasks on a bounded worker pool"""
+
+    def __init__(self, max_workers=2, jitter=0.1):
+        """Initialize scheduler"""
+        self.max_workers = max_workers
+        self.jitter = jitter
+        self.running = False
+        self.thread = None
+        self.executor = None
+        self.tasks = {}
+        self._queue = []
+        self._seq = 0
+        self._cond = threading.Condition()
+
+    def start(self):
+        """Start the dispatcher thread and worker pool"""
+        with self._cond:
+            if self.running:
+                logger.warning("Scheduler already running")
+                return
+            self.running = True
+
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='zerohunter-task')
+        self.thread = threading.Thread(target=self._dispatch_loop, name='zerohunter-scheduler')
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info(f"Scheduler started with {self.max_workers} workers")
+
+    def stop(self):
+        """Stop the scheduler, waiting for running tasks to finish"""
+        with self._cond:
+            if not self.running:
+                logger.warning("Scheduler not running")
+                return
+            self.running = False
+            self._cond.notify_all()
+
+        if self.thread:
+            self.thread.join(timeout=5.0)
+        self.executor.shutdown(wait=True)
+        logger.info("Scheduler stopped")
+
+    def add_periodic(self, name, func, interval, priority=PRIORITY_NORMAL, jitter=None, deadline=None, delay=0.0):
+        """Register a task that runs every interval seconds
+
+        jitter is the fraction of the interval by which each run is randomly
+        shifted, so tasks from different detectors do not wake up together.
+        A run that cannot start within deadline seconds of its due time is
+        skipped and counted as missed.
+        """
+        task = Task(name, func, interval, priority,
+                    self.jitter if jitter is None else jitter, deadline)
+        with self._cond:
+            self._replace(task)
+            self._schedule(task, time.monotonic() + delay, self._jitter(task))
+        return task
+
+    def add_event(self, name, func, priority=PRIORITY_NORMAL, deadline=None):
+        """Register a task that runs each time it is triggered"""
+        task = Task(name, func, None, priority, 0.0, deadline)
+        with self._cond:
+            self._replace(task)
+        return task
+
+    def trigger(self, name):
+        """Run a registered task as soon as possible
+
+        A periodic task is moved forward to now and keeps its interval from
+        there on.
+        """
+        with self._cond:
+            task = self.tasks.get(name)
+            if task is None:
+                logger.error(f"Unknown scheduler task: {name}")
+                return False
+            now = time.monotonic()
+            # Triggers that arrive while the task is already due are coalesced
+            if not task.pending or task.next_run > now:
+                self._schedule(task, now)
+            return True
+
+    def remove(self, name):
+        """Unregister a task"""
+        with self._cond:
+            task = self.tasks.pop(name, None)
+            if task is not None:
+                task.cancelled = True
+                self._cond.notify_all()
+
+    def stats(self):
+        """Return statistics for all tasks"""
+        with self._cond:
+            return {name: task.stats() for name, task in self.tasks.items()}
+
+    def _replace(self, task):
+        """Register a task, cancelling any task with the same name"""
+        previous = self.tasks.get(task.name)
+        if previous is not None:
+            previous.cancelled = True
+        self.tasks[task.name] = task
+
+    def _schedule(self, task, base, offset=0.0):
+        """Queue a task to run offset seconds after a monotonic base time, replacing its queued run"""
+        when = base + offset
+        task.base_run = base
+        task.next_run = when
+        task.pending = True
+        self._seq += 1
+        task.seq = self._seq
+        heapq.heappush(self._queue, (when, task.priority, self._seq, task))
+        self._cond.notify_all()
+
+    def _jitter(self, task):
+        """Return a random offset for a periodic task"""
+        if not task.interval or not task.jitter:
+            return 0.0
+        return random.uniform(-task.jitter, task.jitter) * task.interval
+
+    def _dispatch_loop(self):
+        """Wait for tasks to become due and submit them to the worker pool"""
+        with self._cond:
+            while self.running:
+                now = time.monotonic()
+                if not self._queue:
+                    self._cond.wait()
+                    continue
+                if self._queue[0][0] > now:
+                    # Sleep until the next task is due or the queue changes
+                    self._cond.wait(self._queue[0][0] - now)
+                    continue
+
+                # Collect everything that is due and run it in priority order
+                due = []
+                while self._queue and self._queue[0][0] <= now:
+                    due.append(heapq.heappop(self._queue))
+                due.sort(key=lambda item: (item[1], item[2]))
+
+                for when, _, seq, task in due:
+                    # Entries superseded by a later _schedule() are dropped
+                    if seq != task.seq:
+                        continue
+                    self._dispatch(task, when, now)
+
+    def _dispatch(self, task, when, now):
+        """Submit a due task, or skip it if it is late or still running"""
+        task.pending = False
+        if task.cancelled:
+            return
+
+        if task.running or (task.deadline is not None and now - when > task.deadline):
+            task.missed += 1
+        else:
+            task.running = True
+            self.executor.submit(self._run, task)
+
+        if task.interval is not None:
+            # Drift-free schedule, but never try to catch up on missed runs;
+            # jitter shifts single runs, never the base they are counted from
+            next_run = task.base_run + task.interval
+            if next_run <= now:
+                next_run = now + task.interval
+            self._schedule(task, next_run, self._jitter(task))
+
+    def _run(self, task):
+        """Run a task in a worker thread"""
+        start = time.monotonic()
+        try:
+            task.func()
+        except Exception as e:
+            task.errors += 1
+            logger.error(f"Error in scheduled task {task.name}: {e}")
+        finally:
+            task.last_duration = time.monotonic() - start
+            task.runs += 1
+            task.running = False
+
+
+def create_scheduler(config):
+    """Create a scheduler from the configuration"""
+    return Scheduler(
+        max_workers=config.get('scheduler.max_workers', 2),
+        jitter=config.get('scheduler.jitter', 0.1),
+    )
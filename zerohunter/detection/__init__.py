@@ -5,17 +5,102 @@
 Core module for ZeroHunter detection functionality
 """
 
+import os
+import mmap
+import time
+import queue
+import hashlib
 import logging
+import threading
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from zerohunter.core.governor import ResourceGovernor
+from zerohunter.core.metrics import get_registry
+from zerohunter.core.scheduler import create_scheduler, PRIORITY_LOW
 
 logger = logging.getLogger('zerohunter.detection')
 
+# Engine inherited by forked scan workers (see DetectionEngine.iter_scan_directory)
+_worker_engine = None
+
+# Marks the end of a detector's findings in the result queue
+_DONE = object()
+
+
+def iter_files(directory_path):
+    """Walk a directory tree once, yielding os.DirEntry objects for regular files"""
+    stack = [directory_path]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            yield entry
+                    except OSError as e:
+                        logger.error(f"Error reading directory entry {entry.path}: {e}")
+        except OSError as e:
+            logger.error(f"Error scanning directory {current}: {e}")
+
+
+def _init_scan_worker(engine, jobs):
+    """Install the parent's detection engine in a forked scan worker"""
+    global _worker_engine
+    _worker_engine = engine
+    # The scan's CPU and I/O budgets are split between the workers
+    engine.governor.share(jobs)
+    engine.governor.apply_priority()
+    # Workers only report what they measured themselves
+    get_registry().reset()
+
+
+def _scan_batch(paths):
+    """Scan a batch of files inside a scan worker"""
+    results = _worker_engine._scan_paths(paths)
+    
+    # Hand the batch's metrics to the parent and start afresh
+    registry = get_registry()
+    metrics = registry.snapshot()
+    registry.reset()
+    return results, metrics
+
+
 class DetectionEngine:
     """Main detection engine for ZeroHunter"""
     
-    def __init__(self, config):
+    def __init__(self, config, use_cache=None):
         """Initialize detection engine"""
         self.config = config
         self.detectors = []
+        self.jobs = config.get('scan.jobs', 0) or os.cpu_count() or 1
+        self.batch_size = config.get('scan.batch_size', 64)
+        self.max_file_size = config.get('scan.max_file_size', 64 * 1024 * 1024)
+        self.max_map_size = config.get('scan.max_map_size', 2 * 1024 * 1024 * 1024)
+        self.queue_size = config.get('scan.queue_size', 1024)
+        self.scheduler = None
+        
+        # Keeps scans within their CPU and I/O budgets
+        self.governor = ResourceGovernor(config)
+        
+        # Per-detector latency, throughput and error statistics
+        self.metrics_registry = get_registry()
+        self.metrics_registry.enabled = config.get('metrics.enabled', True)
+        self.metrics_file = config.get(
+            'metrics.prometheus_file', os.path.expanduser('~/.zerohunter/data/metrics.prom'))
+        
+        # Persistent index of previous scan results
+        self.scan_cache = None
+        if use_cache is None:
+            use_cache = config.get('scan.cache', True)
+        if use_cache:
+            from zerohunter.detection.scan_cache import ScanCache
+            self.scan_cache = ScanCache(config.get(
+                'scan.cache_file', os.path.expanduser('~/.zerohunter/data/scan_cache.db')))
         
         # Initialize detectors based on configuration
         if config.get('detection.behavioral_analysis', True):
@@ -33,95 +118,352 @@ class DetectionEngine:
         if config.get('detection.threat_intelligence', True):
             from zerohunter.detection.threat_intel import ThreatIntelligence
             self.detectors.append(ThreatIntelligence(config))
+        
+        network = next((detector for detector in self.detectors
+                        if hasattr(detector, 'pop_flow_features')), None)
+        intel = next((detector for detector in self.detectors
+                      if hasattr(detector, 'match_domain')), None)
+        for detector in self.detectors:
+            if hasattr(detector, 'governor'):
+                detector.governor = self.governor
+            if hasattr(detector, 'flow_source'):
+                detector.flow_source = network
+            if hasattr(detector, 'ioc_source'):
+                detector.ioc_source = intel
             
         logger.info(f"Detection engine initialized with {len(self.detectors)} detectors")
         
     def start(self):
         """Start all detectors"""
+        # Detectors register their periodic work with one shared scheduler
+        self.scheduler = create_scheduler(self.config)
+        self.scheduler.start()
         for detector in self.detectors:
-            detector.start()
+            detector.start(self.scheduler)
+        if self.metrics_file:
+            self.scheduler.add_periodic('metrics.export', self.export_metrics,
+                                        self.config.get('metrics.export_interval', 60.0),
+                                        priority=PRIORITY_LOW)
         logger.info("All detectors started")
         
     def stop(self):
         """Stop all detectors"""
         for detector in self.detectors:
             detector.stop()
+        if self.scheduler is not None:
+            self.scheduler.stop()
+            self.scheduler = None
+        if self.metrics_file:
+            self.export_metrics()
         logger.info("All detectors stopped")
         
-    def scan_file(self, file_path):
+    def metrics(self):
+        """Return detector and scheduler statistics"""
+        return {
+            'detectors': self.metrics_registry.snapshot(),
+            'scheduler': self.scheduler.stats() if self.scheduler is not None else {},
+        }
+        
+    def export_metrics(self):
+        """Write the metrics as a Prometheus text file, if one is configured"""
+        if not self.metrics_file:
+            return False
+        return self.metrics_registry.write_prometheus(self.metrics_file)
+        
+    def scan_file(self, file_path, data=None):
         """Scan a file for threats"""
-        logger.info(f"Scanning file: {file_path}")
+        logger.debug(f"Scanning file: {file_path}")
+        results = self._scan_cached(file_path, data)
+        if self.scan_cache is not None:
+            self.scan_cache.commit()
+        return results
+    
+    def _scan_cached(self, file_path, data=None):
+        """Scan a file, reusing cached findings where possible"""
+        if self.scan_cache is None:
+            return self._scan_file(file_path, data)
+        
+        try:
+            stat = os.stat(file_path)
+        except OSError as e:
+            logger.error(f"Error reading file {file_path}: {e}")
+            return []
+        
+        # Skip files whose metadata did not change since the last scan
+        self.scan_cache.set_version(self.ruleset_version())
+        results = self.scan_cache.lookup(file_path, stat)
+        if results is not None:
+            return results
+        
+        with self._file_data(file_path, data) as data:
+            sha256 = self._hash_file(file_path, data)
+            if sha256 is None:
+                return self._scan_file(file_path, data)
+            
+            # Reuse the findings for content that was already scanned
+            results = self.scan_cache.lookup_content(file_path, sha256)
+            if results is None:
+                results = self._scan_file(file_path, data)
+        self.scan_cache.store(file_path, stat, sha256, results)
+        
+        return results
+    
+    def _scan_file(self, file_path, data=None):
+        """Run every file detector on a file"""
         results = []
         
-        for detector in self.detectors:
-            if hasattr(detector, 'scan_file'):
-                result = detector.scan_file(file_path)
-                if result:
-                    results.extend(result)
+        # Read the file once and share the buffer with every detector
+        with self._file_data(file_path, data) as data:
+            nbytes = len(data) if data is not None else 0
+            for detector in self.detectors:
+                if hasattr(detector, 'scan_file'):
+                    with self.metrics_registry.timed(type(detector).__name__, 'scan_file', nbytes):
+                        result = detector.scan_file(file_path, data)
+                    if result:
+                        results.extend(result)
                     
         return results
     
-    def scan_directory(self, directory_path):
+    def ruleset_version(self):
+        """Return a version string covering the rules of all detectors"""
+        digest = hashlib.sha256()
+        for detector in self.detectors:
+            version = getattr(detector, 'ruleset_version', None)
+            if version:
+                digest.update(f"{type(detector).__name__}:{version};".encode())
+        return digest.hexdigest()
+    
+    def scan_directory(self, directory_path, jobs=None):
         """Scan a directory for threats"""
+        return list(self.iter_scan_directory(directory_path, jobs))
+    
+    def iter_scan_directory(self, directory_path, jobs=None):
+        """Scan a directory for threats, yielding findings as they are found"""
         logger.info(f"Scanning directory: {directory_path}")
-        results = []
+        jobs = jobs or self.jobs
+        # Paths walked, so the cache can forget deleted files once the walk is complete
+        seen = set() if self.scan_cache is not None else None
+        batches = self._iter_batches(directory_path, seen)
         
-        for detector in self.detectors:
-            if hasattr(detector, 'scan_directory'):
-                result = detector.scan_directory(directory_path)
-                if result:
-                    results.extend(result)
-                    
+        if jobs <= 1:
+            for batch in batches:
+                yield from self._scan_paths(batch)
+            self._forget_missing(directory_path, seen)
+            return
+        
+        # Workers are forked so they inherit the already initialized detectors
+        # (compiled YARA rules, loaded IOCs) instead of rebuilding them
+        context = multiprocessing.get_context('fork')
+        executor = ProcessPoolExecutor(max_workers=jobs, mp_context=context,
+                                       initializer=_init_scan_worker, initargs=(self, jobs))
+        pending = set()
+        try:
+            for batch in batches:
+                # Keep a bounded number of batches in flight; the walk pauses
+                # while the consumer is not taking results
+                if len(pending) >= jobs * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from self._collect(done)
+                pending.add(executor.submit(_scan_batch, batch))
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from self._collect(done)
+            self._forget_missing(directory_path, seen)
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+    
+    def _scan_paths(self, paths):
+        """Scan a batch of files"""
+        results = []
+        for path in paths:
+            results.extend(self._scan_cached(path))
+        if self.scan_cache is not None:
+            self.scan_cache.commit()
         return results
     
+    def _collect(self, futures):
+        """Yield the results of finished scan batches"""
+        for future in futures:
+            try:
+                results, metrics = future.result()
+            except Exception as e:
+                logger.error(f"Error in scan worker: {e}")
+                continue
+            self.metrics_registry.merge(metrics)
+            yield from results
+    
+    def _forget_missing(self, directory_path, seen):
+        """Drop cache entries of files under a fully walked directory that no longer exist"""
+        if self.scan_cache is not None:
+            self.scan_cache.remove_missing(directory_path, seen)
+    
+    def _iter_batches(self, directory_path, seen=None):
+        """Group the files of a directory tree into scan batches, adding their paths to seen"""
+        batch = []
+        for entry in iter_files(directory_path):
+            batch.append(entry.path)
+            if seen is not None:
+                seen.add(entry.path)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    
+    @contextlib.contextmanager
+    def _file_data(self, file_path, data=None):
+        """Provide a file's contents to share between detectors, or None if it is too large
+        
+        Files up to scan.max_file_size are read into memory and files up to
+        scan.max_map_size are memory-mapped; detectors stream larger ones
+        themselves.
+        """
+        if data is not None:
+            yield data
+            return
+        
+        mapped = None
+        try:
+            with open(file_path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size <= self.max_file_size:
+                    self.governor.throttle_read(size)
+                    start = time.perf_counter()
+                    data = f.read()
+                    self.metrics_registry.observe('DetectionEngine', 'read_file',
+                                                  time.perf_counter() - start, len(data))
+                elif size <= self.max_map_size:
+                    self.governor.throttle_read(size)
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            logger.error(f"Error reading file {file_path}: {e}")
+        
+        try:
+            yield mapped if mapped is not None else data
+        finally:
+            if mapped is not None:
+                try:
+                    mapped.close()
+                except BufferError:
+                    # A detector kept a view of the mapping; it is unmapped with that view
+                    pass
+    
+    def _hash_file(self, file_path, data=None):
+        """Return the SHA-256 of a file's contents"""
+        if data is not None:
+            return hashlib.sha256(data).hexdigest()
+        
+        # Large files are hashed without loading them into memory
+        digest = hashlib.sha256()
+        try:
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    self.governor.throttle_read(len(chunk))
+                    digest.update(chunk)
+        except OSError as e:
+            logger.error(f"Error hashing file {file_path}: {e}")
+            return None
+        return digest.hexdigest()
+    
     def scan_process(self, process_id):
         """Scan a process for threats"""
+        return list(self.iter_scan_process(process_id))
+    
+    def iter_scan_process(self, process_id):
+        """Scan a process for threats, yielding findings as they are found"""
         logger.info(f"Scanning process: {process_id}")
-        results = []
-        
-        for detector in self.detectors:
-            if hasattr(detector, 'scan_process'):
-                result = detector.scan_process(process_id)
-                if result:
-                    results.extend(result)
-                    
-        return results
+        return self._iter_detectors('scan_process', process_id)
     
     def scan_memory(self):
         """Scan system memory for threats"""
+        return list(self.iter_scan_memory())
+    
+    def iter_scan_memory(self):
+        """Scan system memory for threats, yielding findings as they are found"""
         logger.info("Scanning memory")
-        results = []
-        
-        for detector in self.detectors:
-            if hasattr(detector, 'scan_memory'):
-                result = detector.scan_memory()
-                if result:
-                    results.extend(result)
-                    
-        return results
+        return self._iter_detectors('scan_memory')
     
     def scan_system(self):
         """Scan the entire system for threats"""
+        return list(self.iter_scan_system())
+    
+    def iter_scan_system(self):
+        """Scan the entire system for threats, yielding findings as they are found"""
         logger.info("Scanning system")
-        results = []
-        
-        for detector in self.detectors:
-            if hasattr(detector, 'scan_system'):
-                result = detector.scan_system()
-                if result:
-                    results.extend(result)
-                    
-        return results
+        return self._iter_detectors('scan_system')
     
     def scan_network(self):
         """Scan the network for threats"""
+        return list(self.iter_scan_network())
+    
+    def iter_scan_network(self):
+        """Scan the network for threats, yielding findings as they are found"""
         logger.info("Scanning network")
-        results = []
-        
+        return self._iter_detectors('scan_network')
+    
+    def replay_pcap(self, file_path, jobs=None):
+        """Run a pcap or pcapng file through the network analyzer, returning replay statistics"""
         for detector in self.detectors:
-            if hasattr(detector, 'scan_network'):
-                result = detector.scan_network()
-                if result:
-                    results.extend(result)
-                    
-        return results
+            if hasattr(detector, 'replay_pcap'):
+                return detector.replay_pcap(file_path, jobs or self.jobs)
+        logger.error("Network analysis is disabled, cannot replay capture file")
+        return None
+    
+    def _iter_detectors(self, method, *args):
+        """Run a scan on all detectors concurrently and yield their findings"""
+        detectors = [detector for detector in self.detectors if hasattr(detector, method)]
+        findings = queue.Queue(maxsize=self.queue_size)
+        stopped = threading.Event()
+        
+        def produce(detector):
+            name = type(detector).__name__
+            # Time spent blocked on a slow consumer is not charged to the detector
+            elapsed = 0.0
+            error = False
+            try:
+                # Prefer a detector's own generator so findings stream out
+                scan = getattr(detector, 'iter_' + method, None)
+                if scan is None:
+                    scan = getattr(detector, method)
+                start = time.perf_counter()
+                for finding in scan(*args) or []:
+                    elapsed += time.perf_counter() - start
+                    if not self._put(findings, finding, stopped):
+                        return
+                    start = time.perf_counter()
+                elapsed += time.perf_counter() - start
+            except Exception as e:
+                error = True
+                logger.error(f"Error in {name}.{method}: {e}")
+            finally:
+                self.metrics_registry.observe(name, method, elapsed, error=error)
+                self._put(findings, _DONE, stopped)
+        
+        threads = [threading.Thread(target=produce, args=(detector,), daemon=True)
+                   for detector in detectors]
+        for thread in threads:
+            thread.start()
+            
+        try:
+            remaining = len(threads)
+            while remaining:
+                finding = findings.get()
+                if finding is _DONE:
+                    remaining -= 1
+                else:
+                    yield finding
+        finally:
+            # Unblock producers if the consumer stops early
+            stopped.set()
+    
+    def _put(self, findings, item, stopped):
+        """Put an item in a bounded queue, giving up once the scan is stopped"""
+        while not stopped.is_set():
+            try:
+                findings.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+AF_PACKET capture backend for ZeroHunter (Linux)
+
+Captures with an AF_PACKET socket and a TPACKET_V3 receive ring mapped
+into the process: the kernel fills blocks of packets and flips each block
+to user ownership when it is full or its timeout expires, and packets are
+read in place as memoryviews over the mapping, without libpcap or a copy
+into userspace. Several sockets can join a PACKET_FANOUT group, so the
+kernel spreads an interface's flows over several rings.
+
+The handle mimics the subset of the pypcap API that NetworkAnalyzer uses
+(fileno, dispatch, setfilter, stats, datalink, close).
+"""
+
+import os
+import mmap
+import ctypes
+import ctypes.util
+import socket
+import struct
+import logging
+
+from zerohunter.detection.packet import LINKTYPE_ETHERNET, LINKTYPE_RAW
+
+logger = logging.getLogger('zerohunter.detection.afpacket')
+
+# <linux/if_packet.h>
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+PACKET_FANOUT = 18
+TPACKET_V3 = 2
+PACKET_FANOUT_HASH = 0
+PACKET_FANOUT_FLAG_DEFRAG = 0x8000
+PACKET_OUTGOING = 4
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+ETH_P_ALL = 0x0003
+SO_ATTACH_FILTER = 26
+
+ARPHRD_ETHER = 1
+ARPHRD_LOOPBACK = 772
+
+_REQ3 = struct.Struct('7I')
+_STATS = struct.Struct('3I')
+# tpacket_block_desc: status, packet count and first packet offset after version and priv offset
+_BLOCK_OFFSET = 8
+_BLOCK = struct.Struct('=III')
+_STATUS = struct.Struct('=I')
+# tpacket3_hdr: next offset, sec, nsec, snaplen, len, status, mac offset
+_FRAME = struct.Struct('=IIIII4xH')
+# sll_pkttype of the sockaddr_ll that follows the 48-byte tpacket3_hdr
+_PKTTYPE_OFFSET = 48 + 10
+
+class _BpfProgram(ctypes.Structure):
+    """struct bpf_program"""
+    _fields_ = [('bf_len', ctypes.c_uint), ('bf_insns', ctypes.c_void_p)]
+
+def compile_filter(expression, linktype=LINKTYPE_ETHERNET, snaplen=65535):
+    """Compile a BPF expression to classic BPF instructions with libpcap, via ctypes"""
+    path = ctypes.util.find_library('pcap')
+    if path is None:
+        raise OSError("libpcap is not installed, cannot compile capture filter")
+    libpcap = ctypes.CDLL(path)
+    libpcap.pcap_open_dead.restype = ctypes.c_void_p
+    libpcap.pcap_geterr.restype = ctypes.c_char_p
+    libpcap.pcap_geterr.argtypes = [ctypes.c_void_p]
+    libpcap.pcap_compile.argtypes = [ctypes.c_void_p, ctypes.POINTER(_BpfProgram), ctypes.c_char_p,
+                                     ctypes.c_int, ctypes.c_uint32]
+    libpcap.pcap_freecode.argtypes = [ctypes.POINTER(_BpfProgram)]
+    libpcap.pcap_close.argtypes = [ctypes.c_void_p]
+
+    handle = libpcap.pcap_open_dead(linktype, snaplen)
+    program = _BpfProgram()
+    try:
+        if libpcap.pcap_compile(handle, ctypes.byref(program), expression.encode(), 1, 0xffffffff) != 0:
+            raise ValueError(f"Invalid capture filter: {libpcap.pcap_geterr(handle).decode()}")
+        # struct bpf_insn and struct sock_filter share the same 8-byte layout
+        code = ctypes.string_at(program.bf_insns, program.bf_len * 8)
+        libpcap.pcap_freecode(ctypes.byref(program))
+        return code
+    finally:
+        libpcap.pcap_close(handle)
+
+def interface_type(interface):
+    """Return the ARPHRD_* hardware type of an interface"""
+    try:
+        with open(f'/sys/class/net/{interface}/type') as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return ARPHRD_ETHER
+
+class AfPacketHandle:
+    """Capture handle on one AF_PACKET socket with a TPACKET_V3 receive ring"""
+
+    def __init__(self, interface, block_size=1024 * 1024, block_count=64, frame_size=2048,
+                 timeout_ms=50, fanout_group=None):
+        """Open the socket, map its ring and bind it to the interface"""
+        self.interface = interface
+        self.block_size = block_size
+        self.block_count = block_count
+        self.snaplen = 65535
+        hardware = interface_type(interface)
+        # Link types other than Ethernet are captured cooked, from the network header on
+        if hardware in (ARPHRD_ETHER, ARPHRD_LOOPBACK):
+            kind, self.linktype = socket.SOCK_RAW, LINKTYPE_ETHERNET
+        else:
+            kind, self.linktype = socket.SOCK_DGRAM, LINKTYPE_RAW
+        # The loopback interface shows every packet twice, outgoing and incoming
+        self.skip_outgoing = hardware == ARPHRD_LOOPBACK
+
+        self.socket = socket.socket(socket.AF_PACKET, kind, socket.htons(ETH_P_ALL))
+        self.buffer = None
+        self.view = None
+        try:
+            self.socket.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+            frames = block_size // frame_size * block_count
+            self.socket.setsockopt(SOL_PACKET, PACKET_RX_RING, _REQ3.pack(
+                block_size, block_count, frame_size, frames, timeout_ms, 0, 0))
+            self.buffer = mmap.mmap(self.socket.fileno(), block_size * block_count,
+                                    mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            self.view = memoryview(self.buffer)
+            self.socket.bind((interface, ETH_P_ALL))
+            if fanout_group is not None:
+                # Hash on the defragmented flow, so every packet of a flow reaches one socket
+                mode = PACKET_FANOUT_HASH | PACKET_FANOUT_FLAG_DEFRAG
+                self.socket.setsockopt(SOL_PACKET, PACKET_FANOUT, struct.pack('I', fanout_group | mode << 16))
+        except Exception:
+            self.close()
+            raise
+
+        # Position in the ring: current block and the packets left in it
+        self.block = 0
+        self.remaining = None
+        self.offset = 0
+        self.received = 0
+        self.dropped = 0
+
+    def fileno(self):
+        """Return the socket's descriptor; it is readable when a block is ready"""
+        return self.socket.fileno()
+
+    def datalink(self):
+        """Return the pcap link type of the captured packets"""
+        return self.linktype
+
+    def setnonblock(self, nonblock=True):
+        """Reading the ring never blocks"""
+
+    def setfilter(self, expression):
+        """Attach a BPF filter expression to the socket"""
+        code = compile_filter(expression, self.linktype, self.snaplen)
+        instructions = ctypes.create_string_buffer(code, len(code))
+        program = struct.pack('HP', len(code) // 8, ctypes.addressof(instructions))
+        self.socket.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, program)
+
+    def dispatch(self, count, callback, *args):
+        """Call callback(ts, data, *args) for up to count ready packets (all if count <= 0)
+
+        data is a memoryview into the ring and is only valid during the call.
+        Returns the number of packets passed to the callback.
+        """
+        buffer = self.buffer
+        view = self.view
+        processed = 0
+        while count <= 0 or processed < count:
+            if self.remaining is None:
+                base = self.block * self.block_size
+                status, packets, first = _BLOCK.unpack_from(buffer, base + _BLOCK_OFFSET)
+                if not status & TP_STATUS_USER:
+                    break
+                self.remaining = packets
+                self.offset = base + first
+            if not self.remaining:
+                # Hand the block back to the kernel and move on to the next one
+                _STATUS.pack_into(buffer, self.block * self.block_size + _BLOCK_OFFSET, TP_STATUS_KERNEL)
+                self.block = (self.block + 1) % self.block_count
+                self.remaining = None
+                continue
+
+            offset = self.offset
+            next_offset, sec, nsec, snaplen, _, mac = _FRAME.unpack_from(buffer, offset)
+            self.remaining -= 1
+            self.offset = offset + next_offset
+            if self.skip_outgoing and buffer[offset + _PKTTYPE_OFFSET] == PACKET_OUTGOING:
+                continue
+            start = offset + mac
+            callback(sec + nsec * 1e-9, view[start:start + snaplen], *args)
+            processed += 1
+        return processed
+
+    def stats(self):
+        """Return (received, dropped, interface dropped) like pcap's stats()"""
+        # The kernel resets its counters on every read
+        packets, drops, _ = _STATS.unpack(self.socket.getsockopt(SOL_PACKET, PACKET_STATISTICS, _STATS.size))
+        self.received += packets
+        self.dropped += drops
+        return self.received, self.dropped, 0
+
+    def close(self):
+        """Unmap the ring and close the socket"""
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+        if self.buffer is not None:
+            try:
+                self.buffer.close()
+            except BufferError:
+                logger.warning(f"Packets of interface {self.interface} are still referenced, "
+                               "leaving the capture ring mapped")
+            self.buffer = None
+        self.socket.close()
+
+def open_fanout(interface, count=1, **options):
+    """Open count handles on an interface that share its packets by flow"""
+    group = None
+    if count > 1:
+        group = (os.getpid() + socket.if_nametoindex(interface)) & 0xffff
+    handles = []
+    try:
+        for _ in range(count):
+            handles.append(AfPacketHandle(interface, fanout_group=group, **options))
+    except Exception:
+        for handle in handles:
+            handle.close()
+        raise
+    return handles
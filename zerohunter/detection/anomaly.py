@@ -5,13 +5,10 @@
 Anomaly detection module for ZeroHunter
 """
 
-import os
-import time
 import logging
-import threading
-import numpy as np
-from sklearn.ensemble import IsolationForest
-from sklearn.svm import OneClassSVM
+from collections import deque
+
+from zerohunter.core.scheduler import create_scheduler, PRIORITY_LOW
 
 logger = logging.getLogger('zerohunter.detection.anomaly')
 
@@ -22,53 +19,29 @@ class AnomalyDetector:
         """Initialize anomaly detector"""
         self.config = config
         self.running = False
-        self.thread = None
-        self.models = {}
+        self.scheduler = None
+        self.owns_scheduler = False
         self.data_buffer = {}
-        
-        # Load or create models
-        self._load_models()
+        self.max_buffered = config.get('ml.max_buffered_samples', 100000)
+        # Set by the detection engine to the network analyzer exporting flows
+        self.flow_source = None
         
         logger.info("Anomaly detector initialized")
         
-    def _load_models(self):
-        """Load machine learning models"""
-        models_dir = self.config.get('ml.models_dir', os.path.expanduser('~/.zerohunter/models'))
-        
-        # Create models directory if it doesn't exist
-        if not os.path.exists(models_dir):
-            os.makedirs(models_dir)
-            
-        # Initialize models
-        # In a real implementation, these would be loaded from disk if they exist
-        # or created and trained if they don't
-        
-        # Isolation Forest for system metrics
-        self.models['system_if'] = IsolationForest(
-            n_estimators=100,
-            contamination=0.01,
-            random_state=42
-        )
-        
-        # One-Class SVM for network traffic
-        self.models['network_svm'] = OneClassSVM(
-            nu=0.01,
-            kernel="rbf",
-            gamma=0.1
-        )
-        
-        logger.info(f"Loaded {len(self.models)} anomaly detection models")
-        
-    def start(self):
+    def start(self, scheduler=None):
         """Start anomaly detection"""
         if self.running:
             logger.warning("Anomaly detector already running")
             return
             
         self.running = True
-        self.thread = threading.Thread(target=self._monitor_loop)
-        self.thread.daemon = True
-        self.thread.start()
+        self.owns_scheduler = scheduler is None
+        self.scheduler = scheduler or create_scheduler(self.config)
+        self.scheduler.add_periodic('anomaly.monitor', self._monitor,
+                                    self.config.get('scheduler.anomaly_interval', 5.0),
+                                    priority=PRIORITY_LOW)
+        if self.owns_scheduler:
+            self.scheduler.start()
         logger.info("Anomaly detector started")
         
     def stop(self):
@@ -78,27 +51,22 @@ class AnomalyDetector:
             return
             
         self.running = False
-        if self.thread:
-            self.thread.join(timeout=5.0)
+        self.scheduler.remove('anomaly.monitor')
+        if self.owns_scheduler:
+            self.scheduler.stop()
+        self.scheduler = None
         logger.info("Anomaly detector stopped")
         
-    def _monitor_loop(self):
-        """Main monitoring loop"""
-        while self.running:
-            try:
-                # Collect system metrics
-                self._collect_system_metrics()
-                
-                # Collect network metrics
-                self._collect_network_metrics()
-                
-                # Detect anomalies
-                self._detect_anomalies()
-                
-                # Sleep for a bit
-                time.sleep(5.0)
-            except Exception as e:
-                logger.error(f"Error in anomaly detection loop: {e}")
+    def _monitor(self):
+        """Run one round of anomaly detection"""
+        # Collect system metrics
+        self._collect_system_metrics()
+        
+        # Collect network metrics
+        self._collect_network_metrics()
+        
+        # Detect anomalies
+        self._detect_anomalies()
                 
     def _collect_system_metrics(self):
         """Collect system metrics for anomaly detection"""
@@ -108,9 +76,16 @@ class AnomalyDetector:
                 
     def _collect_network_metrics(self):
         """Collect network metrics for anomaly detection"""
-        # This is a placeholder for actual implementation
-        # In a real implementation, this would collect network traffic metrics
-        pass
+        if self.flow_source is None:
+            return
+        
+        # Feature batches of finished flows, for the network_svm model
+        buffer = self.data_buffer.setdefault('network', deque())
+        for batch in self.flow_source.pop_flow_features():
+            buffer.append(batch)
+        buffered = sum(len(batch) for batch in buffer)
+        while buffer and buffered > self.max_buffered:
+            buffered -= len(buffer.popleft())
                 
     def _detect_anomalies(self):
         """Detect anomalies in collected metrics"""
@@ -6,11 +6,11 @@ Behavioral analysis module for ZeroHunter
 """
 
 import os
-import time
 import logging
-import threading
 import psutil
 
+from zerohunter.core.scheduler import create_scheduler, PRIORITY_NORMAL
+
 logger = logging.getLogger('zerohunter.detection.behavioral')
 
 class BehavioralAnalyzer:
@@ -20,7 +20,10 @@ class BehavioralAnalyzer:
         """Initialize behavioral analyzer"""
         self.config = config
         self.running = False
-        self.thread = None
+        self.scheduler = None
+        self.owns_scheduler = False
+        # Set by the detection engine to rate-limit process inspection
+        self.governor = None
         self.suspicious_behaviors = {
             'process_injection': {
                 'description': 'Process memory injection detected',
@@ -49,16 +52,20 @@ class BehavioralAnalyzer:
         }
         logger.info("Behavioral analyzer initialized")
         
-    def start(self):
+    def start(self, scheduler=None):
         """Start behavioral analysis"""
         if self.running:
             logger.warning("Behavioral analyzer already running")
             return
             
         self.running = True
-        self.thread = threading.Thread(target=self._monitor_loop)
-        self.thread.daemon = True
-        self.thread.start()
+        self.owns_scheduler = scheduler is None
+        self.scheduler = scheduler or create_scheduler(self.config)
+        self.scheduler.add_periodic('behavioral.monitor', self._monitor,
+                                    self.config.get('scheduler.behavioral_interval', 1.0),
+                                    priority=PRIORITY_NORMAL)
+        if self.owns_scheduler:
+            self.scheduler.start()
         logger.info("Behavioral analyzer started")
         
     def stop(self):
@@ -68,27 +75,22 @@ class BehavioralAnalyzer:
             return
             
         self.running = False
-        if self.thread:
-            self.thread.join(timeout=5.0)
+        self.scheduler.remove('behavioral.monitor')
+        if self.owns_scheduler:
+            self.scheduler.stop()
+        self.scheduler = None
         logger.info("Behavioral analyzer stopped")
         
-    def _monitor_loop(self):
-        """Main monitoring loop"""
-        while self.running:
-            try:
-                # Monitor processes
-                self._monitor_processes()
-                
-                # Monitor file access
-                self._monitor_file_access()
-                
-                # Monitor network connections
-                self._monitor_network()
-                
-                # Sleep for a bit
-                time.sleep(1.0)
-            except Exception as e:
-                logger.error(f"Error in behavioral monitoring loop: {e}")
+    def _monitor(self):
+        """Run one round of behavioral monitoring"""
+        # Monitor processes
+        self._monitor_processes()
+        
+        # Monitor file access
+        self._monitor_file_access()
+        
+        # Monitor network connections
+        self._monitor_network()
                 
     def _monitor_processes(self):
         """Monitor process behavior"""
@@ -111,9 +113,9 @@ class BehavioralAnalyzer:
         # using system-specific APIs
         pass
                 
-    def scan_file(self, file_path):
+    def scan_file(self, file_path, data=None):
         """Scan a file for suspicious behavior patterns"""
-        logger.info(f"Scanning file for behavioral patterns: {file_path}")
+        logger.debug(f"Scanning file for behavioral patterns: {file_path}")
         results = []
         
         # This is a placeholder for actual implementation
@@ -126,6 +128,9 @@ class BehavioralAnalyzer:
         logger.info(f"Scanning process for behavioral patterns: {process_id}")
         results = []
         
+        if self.governor is not None:
+            self.governor.throttle_process()
+        
         try:
             process = psutil.Process(process_id)
             
@@ -165,16 +170,26 @@ class BehavioralAnalyzer:
     
     def scan_system(self):
         """Scan the entire system for suspicious behavior"""
+        return list(self.iter_scan_system())
+    
+    def iter_scan_system(self):
+        """Scan the entire system for suspicious behavior, yielding findings"""
         logger.info("Scanning system for behavioral patterns")
-        results = []
         
         # Scan all processes
         for proc in psutil.process_iter(['pid', 'name', 'username']):
+            if self.governor is not None:
+                self.governor.throttle_process()
             try:
-                # This is a placeholder for actual implementation
-                # In a real implementation, this would analyze each process for suspicious behavior
-                pass
+                yield from self._analyze_process(proc)
             except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
                 pass
+    
+    def _analyze_process(self, proc):
+        """Analyze a running process for suspicious behavior"""
+        results = []
+        
+        # This is a placeholder for actual implementation
+        # In a real implementation, this would analyze the process for suspicious behavior
         
         return results
@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Distributed scanning for ZeroHunter
+
+A coordinator splits a directory tree or file list into shards and hands
+them to worker processes over TCP. Workers scan each file with the normal
+DetectionEngine.scan_file path, report progress while they go and return
+their findings per shard. When workers sit idle the coordinator steals the
+unscanned half of a busy worker's shard, failed shards are retried, and
+findings are deduplicated before they are reported.
+
+Messages are JSON objects prefixed with their length as a 4-byte
+big-endian integer. All nodes must see the files under the same paths.
+"""
+
+import os
+import json
+import time
+import hmac
+import queue
+import socket
+import struct
+import logging
+import threading
+import socketserver
+from collections import deque
+
+from zerohunter.detection import iter_files
+
+logger = logging.getLogger('zerohunter.detection.distributed')
+
+# Largest message accepted from the network
+MAX_MESSAGE_SIZE = 256 * 1024 * 1024
+
+# Marks the end of the coordinator's findings
+_DONE = object()
+
+
+def parse_address(address, default_port=7643):
+    """Parse 'host:port' into a (host, port) tuple"""
+    host, _, port = address.rpartition(':')
+    if not host:
+        return address, default_port
+    return host.strip('[]'), int(port)
+
+
+def send_message(sock, message):
+    """Send a length-prefixed JSON message"""
+    data = json.dumps(message, default=str).encode('utf-8')
+    sock.sendall(struct.pack('!I', len(data)) + data)
+
+
+def recv_message(sock):
+    """Receive a length-prefixed JSON message, or None if the peer closed"""
+    header = _recv_exactly(sock, 4)
+    if header is None:
+        return None
+    (length,) = struct.unpack('!I', header)
+    if length > MAX_MESSAGE_SIZE:
+        raise ValueError(f"Message too large: {length} bytes")
+    data = _recv_exactly(sock, length)
+    if data is None:
+        return None
+    return json.loads(data.decode('utf-8'))
+
+
+def _recv_exactly(sock, size):
+    """Read exactly size bytes from a socket"""
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(size - len(buffer))
+        if not chunk:
+            return None
+        buffer.extend(chunk)
+    return bytes(buffer)
+
+
+class Shard:
+    """A batch of files handed to one worker"""
+
+    __slots__ = ('id', 'paths', 'worker', 'done', 'retries')
+
+    def __init__(self, shard_id, paths):
+        """Initialize shard"""
+        self.id = shard_id
+        self.paths = paths
+        self.worker = None
+        self.done = 0
+        self.retries = 0
+
+
+class _CoordinatorHandler(socketserver.BaseRequestHandler):
+    """Serves one worker connection"""
+
+    def handle(self):
+        """Hand out shards to a worker until the scan is complete"""
+        self.server.coordinator._serve_worker(self.request, self.client_address)
+
+
+class _CoordinatorServer(socketserver.ThreadingTCPServer):
+    """TCP server for scan workers"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class ScanCoordinator:
+    """Splits scans into shards and distributes them to scan workers"""
+
+    def __init__(self, config, address=None):
+        """Initialize scan coordinator"""
+        self.config = config
+        self.address = parse_address(address or config.get('distributed.listen', '127.0.0.1:7643'))
+        self.token = config.get('distributed.token', '') or ''
+        self.shard_files = config.get('distributed.shard_files', 256)
+        self.shard_bytes = config.get('distributed.shard_bytes', 256 * 1024 * 1024)
+        self.max_retries = config.get('distributed.max_retries', 3)
+        self.shard_timeout = config.get('distributed.shard_timeout', 300.0)
+        self.min_steal = config.get('distributed.min_steal', 16)
+        self.server = None
+        self.failed = []
+        # Set when the file walk aborts, leaving the rest of the tree unscanned
+        self.planning_failed = False
+        self._lock = threading.Lock()
+        self._queue = deque()
+        self._inflight = {}
+        self._waiting = set()
+        self._next_id = 0
+        self._planning = False
+        self._finished = False
+        self._seen = set()
+        self._findings = None
+
+    def iter_scan_directory(self, directory_path):
+        """Distribute a directory scan, yielding deduplicated findings"""
+        entries = ((entry.path, self._entry_size(entry)) for entry in iter_files(directory_path))
+        return self._run(entries)
+
+    def iter_scan_files(self, paths):
+        """Distribute a scan of a list of files, yielding deduplicated findings"""
+        return self._run((path, self._size(path)) for path in paths)
+
+    def scan_directory(self, directory_path):
+        """Distribute a directory scan"""
+        return list(self.iter_scan_directory(directory_path))
+
+    def stats(self):
+        """Return the state of the distributed scan"""
+        with self._lock:
+            return {
+                'queued': len(self._queue),
+                'inflight': len(self._inflight),
+                'waiting_workers': len(self._waiting),
+                'failed': len(self.failed),
+                'findings': len(self._seen),
+            }
+
+    def listen(self):
+        """Bind the listening socket and return the (host, port) it is bound to"""
+        if self.server is None:
+            self.server = _CoordinatorServer(self.address, _CoordinatorHandler)
+            self.server.coordinator = self
+            self.address = self.server.server_address[:2]
+        return self.address
+
+    def _run(self, entries):
+        """Plan shards from (path, size) pairs and serve workers until done"""
+        self._findings = queue.Queue(maxsize=self.config.get('scan.queue_size', 1024))
+        self._planning = True
+        self._finished = False
+        self.planning_failed = False
+
+        self.listen()
+        server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        server_thread.start()
+        planner = threading.Thread(target=self._plan, args=(entries,), daemon=True)
+        planner.start()
+        logger.info(f"Scan coordinator listening on {self.address[0]}:{self.address[1]}")
+
+        try:
+            while True:
+                finding = self._findings.get()
+                if finding is _DONE:
+                    break
+                yield finding
+        finally:
+            with self._lock:
+                self._finished = True
+            # Give workers a moment to receive their 'done' reply
+            time.sleep(0.1)
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+        if self.failed:
+            logger.error(f"{len(self.failed)} shards failed after {self.max_retries} retries")
+        logger.info("Distributed scan complete")
+
+    def _plan(self, entries):
+        """Group files into shards by count and size"""
+        paths = []
+        size = 0
+        try:
+            for path, file_size in entries:
+                paths.append(path)
+                size += file_size
+                if len(paths) >= self.shard_files or size >= self.shard_bytes:
+                    self._add_shard(paths)
+                    paths = []
+                    size = 0
+        except Exception as e:
+            logger.error(f"Error planning scan shards, the scan is incomplete: {e}")
+            self.planning_failed = True
+        finally:
+            if paths:
+                self._add_shard(paths)
+            with self._lock:
+                self._planning = False
+                self._check_complete()
+
+    def _add_shard(self, paths):
+        """Queue a new shard"""
+        with self._lock:
+            self._queue.append(Shard(self._next_id, paths))
+            self._next_id += 1
+
+    def _size(self, path):
+        """Return a file's size, or 0 if it cannot be read"""
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def _entry_size(self, entry):
+        """Return a directory entry's size, or 0 if it vanished or cannot be read"""
+        try:
+            return entry.stat(follow_symlinks=False).st_size
+        except OSError:
+            return 0
+
+    def _serve_worker(self, sock, client_address):
+        """Hand out shards to one worker connection"""
+        sock.settimeout(self.shard_timeout)
+        worker = f"{client_address[0]}:{client_address[1]}"
+        shard = None
+        try:
+            hello = recv_message(sock)
+            if not hello or hello.get('type') != 'hello' or \
+                    not hmac.compare_digest(str(hello.get('token', '')), self.token):
+                logger.error(f"Rejected scan worker {worker}")
+                send_message(sock, {'type': 'error', 'error': 'authentication failed'})
+                return
+            worker = f"{hello.get('worker', '')}@{worker}"
+            logger.info(f"Scan worker connected: {worker}")
+
+            while True:
+                message = recv_message(sock)
+                if message is None:
+                    break
+                kind = message.get('type')
+                if kind == 'request':
+                    reply, shard = self._next_shard(worker)
+                    send_message(sock, reply)
+                    if reply['type'] == 'done':
+                        break
+                elif kind == 'progress' and shard is not None:
+                    send_message(sock, self._progress(shard, message.get('done', 0)))
+                elif kind == 'result' and shard is not None:
+                    if message.get('error'):
+                        self._fail(shard, worker, message['error'])
+                    else:
+                        self._complete(shard, message.get('findings', []))
+                    shard = None
+                    send_message(sock, {'type': 'ack'})
+                else:
+                    raise ValueError(f"Unexpected message: {kind}")
+        except (OSError, ValueError) as e:
+            logger.error(f"Error serving scan worker {worker}: {e}")
+        finally:
+            with self._lock:
+                self._waiting.discard(worker)
+            if shard is not None:
+                self._fail(shard, worker, 'worker disconnected')
+            logger.info(f"Scan worker disconnected: {worker}")
+
+    def _next_shard(self, worker):
+        """Return the next message for a worker asking for work"""
+        with self._lock:
+            if self._finished:
+                return {'type': 'done'}, None
+            if self._queue:
+                shard = self._queue.popleft()
+                shard.worker = worker
+                shard.done = 0
+                self._inflight[shard.id] = shard
+                self._waiting.discard(worker)
+                return {'type': 'shard', 'id': shard.id, 'paths': shard.paths}, shard
+            self._waiting.add(worker)
+            return {'type': 'wait', 'delay': 0.5}, None
+
+    def _progress(self, shard, done):
+        """Record a worker's progress, stealing half of its shard for idle workers"""
+        with self._lock:
+            shard.done = done
+            remaining = len(shard.paths) - done
+            if self._waiting and not self._queue and remaining >= 2 * self.min_steal:
+                keep = done + remaining // 2
+                self._queue.append(Shard(self._next_id, shard.paths[keep:]))
+                self._next_id += 1
+                shard.paths = shard.paths[:keep]
+                logger.debug(f"Split shard {shard.id} of {shard.worker} at {keep}")
+                return {'type': 'split', 'keep': keep}
+            return {'type': 'continue'}
+
+    def _complete(self, shard, findings):
+        """Merge the findings of a finished shard"""
+        with self._lock:
+            if shard.id not in self._inflight:
+                return
+            new = []
+            for finding in findings:
+                key = json.dumps(finding, sort_keys=True, default=str)
+                if key not in self._seen:
+                    self._seen.add(key)
+                    new.append(finding)
+                    
+        # The shard stays in flight until its findings are queued, so the
+        # end of the scan cannot be signalled ahead of them
+        for finding in new:
+            self._findings.put(finding)
+        with self._lock:
+            del self._inflight[shard.id]
+            self._check_complete()
+
+    def _fail(self, shard, worker, reason):
+        """Requeue a failed shard, or give up after max_retries"""
+        with self._lock:
+            if self._inflight.pop(shard.id, None) is None:
+                return
+            shard.retries += 1
+            if shard.retries > self.max_retries:
+                logger.error(f"Shard {shard.id} failed on {worker} ({reason}), giving up")
+                self.failed.append(shard)
+            else:
+                logger.warning(f"Shard {shard.id} failed on {worker} ({reason}), retrying")
+                self._queue.appendleft(shard)
+            self._check_complete()
+
+    def _check_complete(self):
+        """Signal the end of the scan once all shards are done (lock held)"""
+        if not self._finished and not self._planning and not self._queue and not self._inflight:
+            self._finished = True
+            self._findings.put(_DONE)
+
+
+class ScanWorker:
+    """Scans shards handed out by a scan coordinator"""
+
+    def __init__(self, config, address=None, engine=None, name=None):
+        """Initialize scan worker"""
+        self.config = config
+        self.address = parse_address(address or config.get('distributed.connect', '127.0.0.1:7643'))
+        self.token = config.get('distributed.token', '') or ''
+        self.progress_interval = config.get('distributed.progress_interval', 32)
+        self.connect_timeout = config.get('distributed.connect_timeout', 30.0)
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.engine = engine
+        self.shards = 0
+        self.files = 0
+
+    def run(self):
+        """Process shards until the coordinator reports the scan is done"""
+        if self.engine is None:
+            from zerohunter.detection import DetectionEngine
+            self.engine = DetectionEngine(self.config)
+
+        sock = self._connect()
+        try:
+            send_message(sock, {'type': 'hello', 'worker': self.name, 'token': self.token})
+            while True:
+                send_message(sock, {'type': 'request'})
+                reply = recv_message(sock)
+                if reply is None or reply['type'] == 'done':
+                    break
+                if reply['type'] == 'error':
+                    logger.error(f"Coordinator refused worker: {reply.get('error')}")
+                    return False
+                if reply['type'] == 'wait':
+                    time.sleep(reply.get('delay', 0.5))
+                    continue
+                self._scan_shard(sock, reply)
+        finally:
+            sock.close()
+
+        logger.info(f"Scan worker finished: {self.shards} shards, {self.files} files")
+        return True
+
+    def _connect(self):
+        """Connect to the coordinator, retrying until connect_timeout"""
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                sock = socket.create_connection(self.address, timeout=10.0)
+                sock.settimeout(None)
+                return sock
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.5)
+
+    def _scan_shard(self, sock, shard):
+        """Scan the files of one shard and send back the findings"""
+        paths = shard['paths']
+        end = len(paths)
+        findings = []
+        error = None
+        i = 0
+        try:
+            while i < end:
+                findings.extend(self.engine.scan_file(paths[i]))
+                i += 1
+                if i % self.progress_interval == 0 and i < end:
+                    send_message(sock, {'type': 'progress', 'id': shard['id'], 'done': i})
+                    reply = recv_message(sock)
+                    if reply is None:
+                        raise OSError("Coordinator closed the connection")
+                    if reply['type'] == 'split':
+                        # The coordinator gave the rest of the shard to an idle worker
+                        end = reply['keep']
+        except OSError:
+            raise
+        except Exception as e:
+            logger.error(f"Error scanning shard {shard['id']}: {e}")
+            error = str(e)
+
+        send_message(sock, {'type': 'result', 'id': shard['id'], 'findings': findings, 'error': error})
+        if recv_message(sock) is None:
+            raise OSError("Coordinator closed the connection")
+        self.shards += 1
+        self.files += i
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+DNS message parser for ZeroHunter
+
+Decodes the question and the answer records of DNS messages carried over
+UDP, following name compression pointers, so that the network analyzer
+can check queried names and CNAME targets against domain IOCs. Only the
+records it needs (A, AAAA, CNAME) are decoded; malformed messages give
+None rather than an exception.
+"""
+
+import socket
+import struct
+import logging
+
+logger = logging.getLogger('zerohunter.detection.dns')
+
+TYPE_A = 1
+TYPE_CNAME = 5
+TYPE_AAAA = 28
+
+_HEADER = struct.Struct('!HHHHHH')
+_QUESTION = struct.Struct('!HH')
+_RECORD = struct.Struct('!HHIH')
+
+# Longest name and most compression pointers followed per name
+_MAX_NAME = 255
+_MAX_POINTERS = 32
+
+class DnsError(ValueError):
+    """Raised for malformed DNS messages"""
+
+def read_name(data, offset):
+    """Return the name at offset (lowercase) and the offset after it"""
+    labels = []
+    length = 0
+    end = None
+    pointers = 0
+    while True:
+        if offset >= len(data):
+            raise DnsError("name runs past the message")
+        size = data[offset]
+        if size & 0xc0 == 0xc0:
+            if offset + 1 >= len(data) or pointers >= _MAX_POINTERS:
+                raise DnsError("bad compression pointer")
+            if end is None:
+                end = offset + 2
+            offset = (size & 0x3f) << 8 | data[offset + 1]
+            pointers += 1
+            continue
+        if size & 0xc0:
+            raise DnsError("unsupported label type")
+        offset += 1
+        if not size:
+            break
+        length += size + 1
+        if length > _MAX_NAME or offset + size > len(data):
+            raise DnsError("name too long")
+        labels.append(bytes(data[offset:offset + size]).decode('latin-1').lower())
+        offset += size
+    return '.'.join(labels), end if end is not None else offset
+
+def parse_message(data, max_answers=32):
+    """Return the question and answers of a DNS message, or None if it is malformed
+
+    The result has id, response (bool), rcode, query, qtype and answers, a
+    list of (name, type, value) with addresses and CNAME targets as strings.
+    """
+    try:
+        ident, flags, questions, answers, _, _ = _HEADER.unpack_from(data, 0)
+        if questions != 1:
+            return None
+        query, offset = read_name(data, _HEADER.size)
+        qtype, _ = _QUESTION.unpack_from(data, offset)
+        offset += _QUESTION.size
+
+        records = []
+        for _ in range(min(answers, max_answers)):
+            name, offset = read_name(data, offset)
+            rtype, _, _, size = _RECORD.unpack_from(data, offset)
+            offset += _RECORD.size
+            if offset + size > len(data):
+                raise DnsError("record runs past the message")
+            if rtype == TYPE_A and size == 4:
+                records.append((name, rtype, socket.inet_ntop(socket.AF_INET, bytes(data[offset:offset + 4]))))
+            elif rtype == TYPE_AAAA and size == 16:
+                records.append((name, rtype, socket.inet_ntop(socket.AF_INET6, bytes(data[offset:offset + 16]))))
+            elif rtype == TYPE_CNAME:
+                records.append((name, rtype, read_name(data, offset)[0]))
+            offset += size
+    except (DnsError, struct.error):
+        return None
+    return {'id': ident, 'response': bool(flags & 0x8000), 'rcode': flags & 0x000f,
+            'query': query, 'qtype': qtype, 'answers': records}
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Domain name normalization for ZeroHunter
+
+Domain IOCs and observed names are compared in one canonical form:
+lowercase ASCII without the trailing root dot, with internationalized
+labels in their punycode (IDNA) form. A listed domain covers itself and
+every name below it; a listed '*.domain' covers only the names below it.
+
+Suffix matching uses the hashed IOC store instead of a trie. The keys of
+a name are the name itself and, for every parent domain, the parent and
+its wildcard, all computed in one pass over the labels. Every key is
+then checked in the store (in one batch for many names).
+"""
+
+import logging
+
+logger = logging.getLogger('zerohunter.detection.domains')
+
+def normalize_domain(value):
+    """Return the canonical form of a domain name or '*.' wildcard"""
+    value = value.strip().rstrip('.').lower()
+    wildcard = value.startswith('*.')
+    if wildcard:
+        value = value[2:]
+    if not value.isascii():
+        try:
+            value = value.encode('idna').decode('ascii')
+        except UnicodeError:
+            # Not a valid IDN; it can still match names seen in the same form
+            pass
+    return '*.' + value if wildcard else value
+
+def domain_keys(name, subdomains=True):
+    """Return the IOC keys that cover a normalized name, most specific first"""
+    if not subdomains:
+        return [name]
+    keys = [name]
+    position = name.find('.')
+    while position >= 0:
+        parent = name[position + 1:]
+        if parent:
+            keys.append(parent)
+            keys.append('*.' + parent)
+        position = name.find('.', position + 1)
+    return keys
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Threat feed updates for ZeroHunter
+
+Fetches the configured threat feeds concurrently over one pooled HTTP
+session. Requests are conditional (If-None-Match / If-Modified-Since),
+so an unchanged feed costs a 304 and no download. Changed feeds are
+parsed while they stream in (plain text or CSV, JSON, JSON lines and
+STIX 2 bundles), straight into hashed store sections.
+
+Each feed's indicators from its last applied version are kept as a small
+store of their own (a snapshot). Comparing a new version with the
+snapshot gives the indicators the feed added and removed, and only those
+changes are applied to the IOC store. An indicator is removed only when
+no other feed, and no local addition, still lists it.
+"""
+
+import os
+import re
+import json
+import time
+import codecs
+import hashlib
+import logging
+import tempfile
+import ipaddress
+from concurrent.futures import ThreadPoolExecutor
+
+from zerohunter.core.lazy import lazy_import
+from zerohunter.detection.ioc_store import (NETWORK_TYPE, IocStore, IocStoreError, SectionBuilder,
+                                            write_store)
+from zerohunter.detection.prefixes import parse_networks
+
+np = lazy_import('numpy')
+requests = lazy_import('requests')
+
+logger = logging.getLogger('zerohunter.detection.feeds')
+
+IOC_TYPES = ('ip', 'domain', 'url', 'file_hash', NETWORK_TYPE)
+
+# Snapshot of the indicators added locally rather than by a feed
+LOCAL_FEED = 'local'
+
+_HASH_LENGTHS = frozenset((32, 40, 64, 128))
+_HEX = re.compile(r'^[0-9a-fA-F]+$')
+_DOMAIN = re.compile(r'^(\*\.)?([a-z0-9_-]+\.)+[a-z0-9-]{2,}$')
+# STIX 2 pattern comparisons on the observables that map to IOC types
+_STIX_COMPARISON = re.compile(
+    r"(ipv4-addr|ipv6-addr|domain-name|url|file):(value|hashes\.(?:'[^']+'|[\w-]+))\s*=\s*'((?:[^'\\]|\\.)*)'")
+# Keys of JSON feed objects that hold the indicator
+_VALUE_KEYS = ('value', 'indicator', 'ioc')
+
+class FeedError(Exception):
+    """Raised for feeds that cannot be fetched or parsed completely"""
+
+def classify_indicator(value):
+    """Return the IOC type of an indicator string, or None if it is not one"""
+    if '://' in value:
+        return 'url'
+    try:
+        ipaddress.ip_address(value)
+        return 'ip'
+    except ValueError:
+        pass
+    if '/' in value or '-' in value and value[:1].isdigit():
+        try:
+            parse_networks(value)
+            return NETWORK_TYPE
+        except ValueError:
+            pass
+    if len(value) in _HASH_LENGTHS and _HEX.match(value):
+        return 'file_hash'
+    if _DOMAIN.match(value.lower()) or not value.isascii() and '.' in value:
+        return 'domain'
+    return None
+
+def _iter_lines(chunks):
+    """Yield the decoded lines of a stream of byte chunks"""
+    decoder = codecs.getincrementaldecoder('utf-8')('replace')
+    rest = ''
+    for chunk in chunks:
+        lines = (rest + decoder.decode(chunk)).split('\n')
+        rest = lines.pop()
+        yield from lines
+    rest += decoder.decode(b'', True)
+    if rest:
+        yield rest
+
+class _JsonStream:
+    """Incremental reader of JSON values from a stream of byte chunks"""
+
+    def __init__(self, chunks):
+        """Initialize JSON stream"""
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        self.json = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        """Read the next chunk into the buffer; returns False at the end of the stream"""
+        if self.eof:
+            return False
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.eof = True
+            text = self.decoder.decode(b'', True)
+        else:
+            text = self.decoder.decode(chunk)
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it ('' at the end)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def take(self, expected):
+        """Consume the next non-whitespace character, which must be one of expected"""
+        char = self.peek()
+        if not char or char not in expected:
+            raise FeedError(f"Malformed JSON feed: expected {expected!r}, found {char!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decode the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.json.raw_decode(self.buffer, self.pos)
+                # A number at the end of the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof or not isinstance(value, (int, float)):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise FeedError(f"Malformed JSON feed: {e}")
+            self._fill()
+
+    def items(self):
+        """Yield (key, item) for the items of top-level arrays and of the arrays in top-level objects
+
+        A top-level object without arrays is an item itself, as in JSON lines.
+        """
+        while True:
+            char = self.peek()
+            if not char:
+                return
+            if char == '[':
+                yield from ((None, item) for item in self._array())
+            elif char == '{':
+                self.pos += 1
+                fields = {}
+                streamed = False
+                while self.peek() != '}':
+                    key = self.value()
+                    self.take(':')
+                    if self.peek() == '[':
+                        streamed = True
+                        yield from ((key, item) for item in self._array())
+                    else:
+                        fields[key] = self.value()
+                    if self.take(',}') == '}':
+                        self.pos -= 1
+                        break
+                self.pos += 1
+                if not streamed:
+                    yield None, fields
+            else:
+                yield None, self.value()
+
+    def _array(self):
+        """Yield the items of the array at the current position"""
+        self.take('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.take(',]') == ']':
+                return
+
+def _stix_indicators(item):
+    """Yield the (type, value) indicators of a STIX 2 indicator object's pattern"""
+    if item.get('revoked'):
+        return
+    for kind, prop, value in _STIX_COMPARISON.findall(item.get('pattern', '')):
+        value = value.replace("\\'", "'").replace('\\\\', '\\')
+        if kind == 'file':
+            if prop.startswith('hashes.'):
+                yield 'file_hash', value.lower()
+        elif kind in ('ipv4-addr', 'ipv6-addr'):
+            yield (NETWORK_TYPE if '/' in value else 'ip'), value
+        elif kind == 'domain-name':
+            yield 'domain', value
+        else:
+            yield 'url', value
+
+def parse_feed(chunks, format='text', ioc_type=None, column=0):
+    """Yield the (type, value) indicators of a feed streamed as byte chunks
+
+    format is 'text' (one indicator per line, or CSV with the indicator in
+    column), 'json' (an array, an object of arrays or JSON lines) or 'stix'
+    (a STIX 2 bundle). ioc_type forces the type of every indicator, which
+    is otherwise taken from the feed or guessed from the value.
+    """
+    if format in ('text', 'csv'):
+        for line in _iter_lines(chunks):
+            line = line.strip()
+            if not line or line[0] in '#;':
+                continue
+            if ',' in line or column:
+                fields = line.split(',')
+                if column >= len(fields):
+                    continue
+                line = fields[column].strip().strip('"').strip()
+            kind = ioc_type or classify_indicator(line)
+            if kind is not None:
+                yield kind, line
+        return
+
+    for key, item in _JsonStream(chunks).items():
+        if isinstance(item, str):
+            kind = ioc_type or (key if key in IOC_TYPES else classify_indicator(item))
+            if kind is not None:
+                yield kind, item
+        elif isinstance(item, dict):
+            if item.get('type') == 'indicator' and 'pattern' in item:
+                yield from _stix_indicators(item)
+                continue
+            value = next((item[name] for name in _VALUE_KEYS if isinstance(item.get(name), str)), None)
+            if value is None:
+                continue
+            kind = ioc_type or (item.get('type') if item.get('type') in IOC_TYPES else classify_indicator(value))
+            if kind is not None:
+                yield kind, value
+
+def _feed_format(source, content_type=''):
+    """Return the format of a feed from its configuration, URL or content type"""
+    if source.get('format'):
+        return source['format']
+    url = source['url'].lower().split('?', 1)[0]
+    if 'stix' in content_type or url.endswith(('.stix', '.stix2')):
+        return 'stix'
+    if 'json' in content_type or url.endswith(('.json', '.jsonl', '.ndjson')):
+        return 'json'
+    return 'text'
+
+class FeedManager:
+    """Concurrent, conditional threat feed fetching with per-feed change tracking"""
+
+    def __init__(self, sources, state_dir, workers=4, timeout=60.0, max_size=512 * 1024 * 1024):
+        """Initialize feed manager; sources are URLs or dicts with url, format, type and column"""
+        self.sources = [source if isinstance(source, dict) else {'url': source} for source in sources]
+        self.state_dir = state_dir
+        self.state_file = os.path.join(state_dir, 'state.json')
+        self.workers = max(workers, 1)
+        self.timeout = timeout
+        self.max_size = max_size
+        self.session = None
+        # Time of the last update and the validators of every feed's snapshot
+        self.state = {'fetched': 0, 'feeds': {}}
+        self.pending = None
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'r') as f:
+                    self.state = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"Error loading threat feed state from {self.state_file}: {e}")
+
+    @property
+    def last_fetch(self):
+        """Time of the last applied feed update"""
+        return self.state.get('fetched', 0)
+
+    def _session(self):
+        """Return the HTTP session, whose connections are reused across feeds and updates"""
+        if self.session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers,
+                                                    max_retries=2)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['User-Agent'] = 'ZeroHunter'
+            self.session = session
+        return self.session
+
+    def close(self):
+        """Close the pooled connections"""
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+    def fetch(self, local=None, fetch=True, rebuild=False):
+        """Fetch every feed and return the (added, removed) sections since the last commit
+
+        local holds the sections of indicators added locally; with fetch
+        False only those are returned. With rebuild True, added holds every
+        current indicator instead, for a store written from scratch. The
+        changes are recorded as applied only by commit(), once the store is
+        written.
+        """
+        results = [None] * len(self.sources)
+        if fetch and self.sources:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(self.sources)),
+                                    thread_name_prefix='zerohunter-feed') as executor:
+                results = list(executor.map(self._fetch, self.sources))
+
+        # Sections of every feed as of this update: new versions, else the snapshots
+        current = {}
+        changed = {}
+        for source, result in zip(self.sources, results):
+            url = source['url']
+            if result is not None:
+                changed[url] = result
+                current[url] = result['sections']
+            else:
+                current[url] = self._snapshot(url)
+        # Feeds no longer configured withdraw their indicators
+        for url in self.state['feeds']:
+            if url not in current:
+                changed[url] = {'sections': {}, 'etag': None, 'last_modified': None, 'count': 0}
+                current[url] = {}
+        local_sections = self._snapshot(LOCAL_FEED)
+        for name, items in (local or {}).items():
+            local_sections[name] = np.union1d(local_sections.get(name, items[:0]), items)
+        current[LOCAL_FEED] = local_sections
+
+        added = {}
+        removed = {}
+        for url, result in changed.items():
+            previous = self._snapshot(url)
+            sections = result['sections']
+            for name in set(previous) | set(sections):
+                old = previous.get(name)
+                new = sections.get(name)
+                if new is not None and len(new):
+                    items = np.setdiff1d(new, old, assume_unique=True) if old is not None else new
+                    if len(items):
+                        added[name] = np.union1d(added.get(name, items[:0]), items)
+                if old is not None and len(old):
+                    items = np.setdiff1d(old, new, assume_unique=True) if new is not None else old
+                    for other, other_sections in current.items():
+                        if other != url and name in other_sections and len(items):
+                            items = np.setdiff1d(items, other_sections[name], assume_unique=True)
+                    if len(items):
+                        removed[name] = np.union1d(removed.get(name, items[:0]), items)
+        for name, items in (local or {}).items():
+            added[name] = np.union1d(added.get(name, items[:0]), items)
+        if rebuild:
+            added = {}
+            removed = {}
+            for sections in current.values():
+                for name, items in sections.items():
+                    added[name] = np.union1d(added.get(name, items[:0]), items)
+
+        self.pending = (changed, local_sections if local else None)
+        return added, removed
+
+    def commit(self):
+        """Record the changes returned by the last fetch() as applied"""
+        if self.pending is None:
+            return
+        changed, local_sections = self.pending
+        self.pending = None
+        os.makedirs(self.state_dir, exist_ok=True)
+        configured = {source['url'] for source in self.sources}
+        feeds = self.state['feeds']
+        for url, result in changed.items():
+            if url in configured:
+                write_store(self._snapshot_file(url), result['sections'])
+                feeds[url] = {'etag': result['etag'], 'last_modified': result['last_modified'],
+                              'count': result['count'], 'fetched': time.time()}
+            else:
+                feeds.pop(url, None)
+                try:
+                    os.unlink(self._snapshot_file(url))
+                except FileNotFoundError:
+                    pass
+        if local_sections is not None:
+            write_store(self._snapshot_file(LOCAL_FEED), local_sections)
+        self.state['fetched'] = time.time()
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.state_dir, prefix='.state-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.state, f, indent=1)
+            os.replace(tmp_path, self.state_file)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _snapshot_file(self, url):
+        """Return the path of a feed's snapshot"""
+        name = url if url == LOCAL_FEED else hashlib.sha256(url.encode()).hexdigest()[:16]
+        return os.path.join(self.state_dir, f'{name}.store')
+
+    def _snapshot(self, url):
+        """Return the sections of a feed as last applied"""
+        path = self._snapshot_file(url)
+        if not os.path.exists(path):
+            return {}
+        try:
+            return IocStore(path, fp_rate=0).arrays()
+        except (OSError, IocStoreError) as e:
+            logger.error(f"Error loading threat feed snapshot {path}: {e}")
+            return {}
+
+    def _fetch(self, source):
+        """Fetch and parse one feed; returns None if it is unchanged or failed"""
+        url = source['url']
+        state = self.state['feeds'].get(url, {})
+        headers = {}
+        # Validators only count while the snapshot they describe exists
+        if os.path.exists(self._snapshot_file(url)):
+            if state.get('etag'):
+                headers['If-None-Match'] = state['etag']
+            if state.get('last_modified'):
+                headers['If-Modified-Since'] = state['last_modified']
+        start = time.perf_counter()
+        try:
+            with self._session().get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                if response.status_code == 304:
+                    logger.debug(f"Threat feed {url} is unchanged")
+                    return None
+                response.raise_for_status()
+                builder = SectionBuilder()
+                count = 0
+                fmt = _feed_format(source, response.headers.get('Content-Type', ''))
+                for ioc_type, value in parse_feed(self._limited(response.iter_content(65536), url), fmt,
+                                                  source.get('type'), source.get('column', 0)):
+                    builder.add(ioc_type, value)
+                    count += 1
+                sections = builder.sections()
+            logger.info(f"Fetched {count} IOCs from threat feed {url} in {time.perf_counter() - start:.1f}s")
+            return {'sections': sections, 'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'), 'count': count}
+        except Exception as e:
+            # A partial feed would withdraw indicators, so failures change nothing
+            logger.error(f"Error fetching threat feed {url}: {e}")
+            return None
+
+    def _limited(self, chunks, url):
+        """Pass chunks through, failing once a feed exceeds the size limit"""
+        size = 0
+        for chunk in chunks:
+            size += len(chunk)
+            if size > self.max_size:
+                raise FeedError(f"Threat feed {url} is larger than {self.max_size} bytes")
+            yield chunk
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Flow table for ZeroHunter
+
+Tracks per-connection state (5-tuple, packet and byte counters per
+direction, first and last seen, TCP flags) for decoded packets. Flows are
+__slots__ records in an LRU-ordered hash index with a hard size cap, idle
+and active timeouts, and a bounded queue of finished flows that is
+exported as NumPy feature batches for the anomaly models.
+"""
+
+import logging
+import threading
+from collections import OrderedDict, deque
+
+from zerohunter.core.lazy import lazy_import
+
+np = lazy_import('numpy')
+
+logger = logging.getLogger('zerohunter.detection.flows')
+
+# Columns of the exported feature batches
+FLOW_FEATURES = ('duration', 'packets', 'bytes', 'reverse_packets', 'reverse_bytes',
+                 'bytes_per_packet', 'protocol', 'dst_port', 'tcp_flags')
+
+def flow_key(header):
+    """Return the key of a packet's flow; both directions share one key"""
+    src, sport, dst, dport = header.src, header.sport, header.dst, header.dport
+    if (src, sport) <= (dst, dport):
+        return (header.protocol, src, sport, dst, dport)
+    return (header.protocol, dst, dport, src, sport)
+
+class Flow:
+    """State of one bidirectional flow; src is the endpoint that sent the first packet"""
+
+    __slots__ = ('key', 'ip_version', 'protocol', 'src', 'sport', 'dst', 'dport', 'first_seen',
+                 'last_seen', 'packets', 'bytes', 'reverse_packets', 'reverse_bytes', 'tcp_flags')
+
+    def __init__(self, key, header):
+        """Initialize flow from its first packet"""
+        self.key = key
+        self.ip_version = header.ip_version
+        self.protocol = header.protocol
+        self.src = header.src
+        self.sport = header.sport
+        self.dst = header.dst
+        self.dport = header.dport
+        self.first_seen = header.ts
+        self.last_seen = header.ts
+        self.packets = 0
+        self.bytes = 0
+        self.reverse_packets = 0
+        self.reverse_bytes = 0
+        self.tcp_flags = 0
+
+    def features(self):
+        """Return the flow's feature vector (see FLOW_FEATURES)"""
+        packets = self.packets + self.reverse_packets
+        size = self.bytes + self.reverse_bytes
+        return (self.last_seen - self.first_seen, self.packets, self.bytes, self.reverse_packets,
+                self.reverse_bytes, size / packets if packets else 0.0, self.protocol, self.dport,
+                self.tcp_flags)
+
+    def as_dict(self):
+        """Return the flow as a dictionary"""
+        return {name: getattr(self, name) for name in self.__slots__ if name != 'key'}
+
+class FlowTable:
+    """Bounded table of active flows with LRU eviction"""
+
+    def __init__(self, max_flows=200000, idle_timeout=60.0, active_timeout=300.0, max_finished=None):
+        """Initialize flow table"""
+        self.max_flows = max_flows
+        self.idle_timeout = idle_timeout
+        self.active_timeout = active_timeout
+
+        # Least recently seen flows first, so idle flows are found at the front
+        self.flows = OrderedDict()
+        self.finished = deque(maxlen=max_finished or max_flows)
+        self.last_ts = 0.0
+        self.counts = {'created': 0, 'evicted': 0, 'idle': 0, 'active': 0, 'dropped': 0}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of active flows"""
+        return len(self.flows)
+
+    def update(self, header):
+        """Account a decoded packet to its flow"""
+        src, sport = header.src, header.sport
+        key = flow_key(header)
+        ts = header.ts
+        with self._lock:
+            self.last_ts = ts
+            flow = self.flows.get(key)
+            if flow is not None and ts - flow.first_seen > self.active_timeout:
+                # Long-lived flows are reported periodically, like NetFlow
+                del self.flows[key]
+                self._finish(flow, 'active')
+                flow = None
+
+            if flow is None:
+                if len(self.flows) >= self.max_flows:
+                    self._finish(self.flows.popitem(last=False)[1], 'evicted')
+                flow = self.flows[key] = Flow(key, header)
+                self.counts['created'] += 1
+            else:
+                self.flows.move_to_end(key)
+
+            flow.last_seen = ts
+            flow.tcp_flags |= header.tcp_flags
+            if src == flow.src and sport == flow.sport:
+                flow.packets += 1
+                flow.bytes += header.length
+            else:
+                flow.reverse_packets += 1
+                flow.reverse_bytes += header.length
+            return flow
+
+    def expire(self, now=None):
+        """Finish the flows idle for longer than the idle timeout, returning how many"""
+        now = self.last_ts if now is None else now
+        expired = 0
+        with self._lock:
+            while self.flows:
+                flow = next(iter(self.flows.values()))
+                if now - flow.last_seen <= self.idle_timeout:
+                    break
+                del self.flows[flow.key]
+                self._finish(flow, 'idle')
+                expired += 1
+        return expired
+
+    def flush(self):
+        """Finish every active flow"""
+        with self._lock:
+            while self.flows:
+                self._finish(self.flows.popitem(last=False)[1], 'idle')
+
+    def drain(self):
+        """Return and forget the finished flows"""
+        with self._lock:
+            flows = list(self.finished)
+            self.finished.clear()
+        return flows
+
+    def export(self):
+        """Return the finished flows as a NumPy feature batch, or None if there are none"""
+        flows = self.drain()
+        if not flows:
+            return None
+        return np.array([flow.features() for flow in flows], dtype=np.float64)
+
+    def stats(self):
+        """Return the table's size and counters"""
+        with self._lock:
+            return dict(self.counts, active_flows=len(self.flows), finished_flows=len(self.finished))
+
+    def _finish(self, flow, reason):
+        """Queue a finished flow for export (lock held)"""
+        if len(self.finished) == self.finished.maxlen:
+            # The oldest unexported flow falls off the queue
+            self.counts['dropped'] += 1
+        self.finished.append(flow)
+        self.counts[reason] += 1
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Memory-mapped IOC store for ZeroHunter
+
+Indicators of compromise are kept as sorted arrays of 64-bit hashes, one
+array per IOC type, in a single file that is mapped read-only. Opening
+the store only parses a small header, lookups binary-search the mapped
+arrays without deserializing anything, and every process that maps the
+file shares the same page cache pages.
+
+Only the hashes are stored, so indicators cannot be listed back. With
+64-bit hashes the chance that a lookup falsely matches is about n / 2**64,
+under 1 in 10**11 per lookup for 10**8 indicators.
+
+Network IOCs (the 'network' type: CIDR prefixes and address ranges) are
+kept as exact network addresses instead, one sorted section per IP version
+and prefix length, and matched by the prefix index in prefixes.py. Domain
+IOCs are hashed in their canonical form (see domains.py).
+
+Batches of lookups are vectorized with NumPy. Since nearly all lookups
+miss, each IOC type gets an in-memory Bloom filter (built on first use)
+that rejects most misses before the binary search touches the mapping.
+"""
+
+import os
+import sys
+import math
+import mmap
+import struct
+import hashlib
+import logging
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left
+
+from zerohunter.core.lazy import lazy_import
+from zerohunter.detection.domains import normalize_domain
+from zerohunter.detection.prefixes import PrefixIndex, network_tables
+
+np = lazy_import('numpy')
+
+logger = logging.getLogger('zerohunter.detection.ioc_store')
+
+MAGIC = b'ZHIOCST\x00'
+VERSION = 1
+
+# Magic, version, number of sections, SHA-256 of the sections
+_HEADER = struct.Struct('<8sHH32s4x')
+# IOC type, offset and number of items of one section
+_SECTION = struct.Struct('<16sQQ')
+
+# IOC type whose indicators are networks, stored in 'net4/<length>' and
+# 'net6/<length>' sections of network addresses (8 and 16 bytes each)
+NETWORK_TYPE = 'network'
+# IOC type whose indicators are stored in canonical form (see domains.py)
+DOMAIN_TYPE = 'domain'
+
+# Odd 64-bit constant that spreads a key's bits before the filter bits are picked
+_MIX = 0x9e3779b97f4a7c15
+_MASK64 = 0xffffffffffffffff
+
+class IocStoreError(Exception):
+    """Raised for files that are not IOC stores"""
+
+def ioc_hash(value):
+    """Return the 64-bit hash an indicator is stored under"""
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8', 'surrogateescape'),
+                                          digest_size=8).digest(), 'little')
+
+class BloomFilter:
+    """Register-blocked Bloom filter over 64-bit indicator hashes
+
+    All bits of a key are in one 64-bit word, so a lookup reads a single
+    word and batches are checked with a few NumPy array operations.
+    """
+
+    def __init__(self, capacity, fp_rate=0.01):
+        """Size the filter for capacity keys at the given false-positive rate"""
+        capacity = max(capacity, 1)
+        self.hashes = max(1, min(round(-math.log2(fp_rate)), 8))
+        # Start from the size of a classic Bloom filter; keeping a key's bits
+        # in one word costs accuracy, so grow it until the rate is met
+        words = int(-capacity * math.log(fp_rate) / math.log(2) ** 2 / 64) + 1
+        while self.expected_fp_rate(capacity, words, self.hashes) > fp_rate:
+            words = words * 21 // 20 + 1
+        self.words = np.zeros(words, dtype=np.uint64)
+        # Single lookups read the words through a memoryview, whose items are plain ints
+        self.view = memoryview(self.words)
+        self.fp_rate = fp_rate
+
+    @staticmethod
+    def expected_fp_rate(capacity, words, hashes):
+        """Return the false-positive rate of a filter of words words holding capacity keys"""
+        # Keys per word are Poisson distributed
+        mean = capacity / words
+        probability = math.exp(-mean)
+        rate = 0.0
+        load = 0
+        while load < mean + 10 * math.sqrt(mean) + 20:
+            rate += probability * (1 - (1 - 1 / 64) ** (hashes * load)) ** hashes
+            load += 1
+            probability *= mean / load
+        return rate
+
+    def add(self, keys, chunk=1 << 20):
+        """Add a NumPy array of 64-bit keys"""
+        for start in range(0, len(keys), chunk):
+            index, masks = self._locate(keys[start:start + chunk])
+            np.bitwise_or.at(self.words, index, masks)
+
+    def contains(self, keys):
+        """Return a boolean mask of the keys that may be in the filter"""
+        index, masks = self._locate(keys)
+        return self.words[index] & masks == masks
+
+    def contains_one(self, key):
+        """Return whether a single key may be in the filter"""
+        view = self.view
+        word = view[(key >> 32) * len(view) >> 32]
+        mixed = key * _MIX & _MASK64
+        # About half the bits are set, so misses end after a bit or two
+        for shift in range(0, 6 * self.hashes, 6):
+            if not word >> (mixed >> shift & 63) & 1:
+                return False
+        return True
+
+    def _locate(self, keys):
+        """Return the word index and bit mask of every key"""
+        keys = np.asarray(keys, dtype=np.uint64)
+        # Multiply-shift maps the high half of the key onto the words without a division
+        index = (keys >> np.uint64(32)) * np.uint64(len(self.words)) >> np.uint64(32)
+        mixed = keys * np.uint64(_MIX)
+        masks = np.zeros(len(keys), dtype=np.uint64)
+        for i in range(self.hashes):
+            masks |= np.uint64(1) << (mixed >> np.uint64(6 * i) & np.uint64(63))
+        return index.astype(np.intp), masks
+
+class IocStore:
+    """Read-only view of an IOC store file"""
+
+    def __init__(self, path, fp_rate=0.01):
+        """Map the store; only the header is read"""
+        self.path = path
+        self.fp_rate = fp_rate
+        self.filters = {}
+        self._lock = threading.Lock()
+        with open(path, 'rb') as f:
+            # mmap cannot map empty files
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                raise IocStoreError(f"{path} is truncated")
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.buffer)
+        magic, version, count, digest = _HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != VERSION:
+            raise IocStoreError(f"{path} is not a version {VERSION} IOC store")
+        if _HEADER.size + count * _SECTION.size > len(view):
+            raise IocStoreError(f"{path} is truncated")
+        self.digest = digest.hex()
+
+        self.sections = {}
+        networks = {}
+        for index in range(count):
+            name, offset, length = _SECTION.unpack_from(view, _HEADER.size + index * _SECTION.size)
+            name = name.rstrip(b'\0').decode()
+            size = 16 if name.startswith('net6/') else 8
+            if offset + length * size > len(view):
+                raise IocStoreError(f"{path} is truncated")
+            if name.startswith(('net4/', 'net6/')):
+                version, prefix = int(name[3]), int(name[5:])
+                section = view[offset:offset + length * size]
+                networks[version, prefix] = np.frombuffer(section, dtype='<u8' if version == 4 else 'S16')
+                continue
+            hashes = view[offset:offset + length * 8].cast('Q')
+            if sys.byteorder != 'little':
+                # Stores are little-endian; big-endian hosts pay for a swapped copy
+                hashes = array('Q', hashes)
+                hashes.byteswap()
+            self.sections[name] = hashes
+        self.networks = PrefixIndex(networks)
+
+    def __len__(self):
+        """Return the number of indicators"""
+        return sum(len(hashes) for hashes in self.sections.values()) + len(self.networks)
+
+    @property
+    def types(self):
+        """Return the IOC types in the store, except networks"""
+        return list(self.sections)
+
+    def count(self, ioc_type):
+        """Return the number of indicators of a type"""
+        if ioc_type == NETWORK_TYPE:
+            return len(self.networks)
+        hashes = self.sections.get(ioc_type)
+        return len(hashes) if hashes is not None else 0
+
+    def contains(self, ioc_type, value):
+        """Return whether an indicator is in the store"""
+        return self.contains_hash(ioc_type, ioc_hash(value))
+
+    def contains_hash(self, ioc_type, key):
+        """Return whether an indicator hash is in the store"""
+        hashes = self.sections.get(ioc_type)
+        if hashes is None:
+            return False
+        # Single lookups use the filter once a batch has built it
+        bloom = self.filters.get(ioc_type)
+        if bloom is not None and not bloom.contains_one(key):
+            return False
+        index = bisect_left(hashes, key)
+        return index < len(hashes) and hashes[index] == key
+
+    def contains_hashes(self, ioc_type, keys):
+        """Return a boolean mask of the hashes in a NumPy array that are in the store"""
+        keys = np.asarray(keys, dtype=np.uint64)
+        matches = np.zeros(len(keys), dtype=bool)
+        hashes = self.hashes(ioc_type)
+        if not len(hashes) or not len(keys):
+            return matches
+        if self.fp_rate:
+            candidates = np.flatnonzero(self.prefilter(ioc_type).contains(keys))
+        else:
+            candidates = np.arange(len(keys))
+        found = keys[candidates]
+        index = np.searchsorted(hashes, found)
+        index[index == len(hashes)] = 0
+        matches[candidates[hashes[index] == found]] = True
+        return matches
+
+    def prefilter(self, ioc_type):
+        """Return the Bloom filter of an IOC type, building it on first use"""
+        bloom = self.filters.get(ioc_type)
+        if bloom is None:
+            with self._lock:
+                bloom = self.filters.get(ioc_type)
+                if bloom is None:
+                    hashes = self.hashes(ioc_type)
+                    bloom = BloomFilter(len(hashes), self.fp_rate)
+                    bloom.add(hashes)
+                    self.filters[ioc_type] = bloom
+        return bloom
+
+    def hashes(self, ioc_type):
+        """Return the sorted hashes of a type as a NumPy array over the mapping"""
+        hashes = self.sections.get(ioc_type)
+        if hashes is None:
+            return np.empty(0, dtype='<u8')
+        return np.frombuffer(hashes, dtype=np.uint64).astype('<u8', copy=False)
+
+    def arrays(self):
+        """Return every section (name -> sorted NumPy array), networks included"""
+        sections = {name: self.hashes(name) for name in self.sections}
+        for version, index in self.networks.tables.items():
+            for length, networks, _ in index:
+                sections[f'net{version}/{length}'] = networks
+        return sections
+
+class SectionBuilder:
+    """Collects indicators into store sections, keeping hashes rather than strings"""
+
+    def __init__(self, types=()):
+        """Initialize section builder; types get a section even when empty"""
+        self.hashes = {ioc_type: array('Q') for ioc_type in types if ioc_type != NETWORK_TYPE}
+        self.networks = []
+
+    def add(self, ioc_type, value):
+        """Add one indicator"""
+        if ioc_type == NETWORK_TYPE:
+            self.networks.append(value)
+            return
+        if ioc_type == DOMAIN_TYPE:
+            value = normalize_domain(value)
+        hashes = self.hashes.get(ioc_type)
+        if hashes is None:
+            hashes = self.hashes[ioc_type] = array('Q')
+        hashes.append(ioc_hash(value))
+
+    def sections(self):
+        """Return the sections (name -> sorted unique NumPy array) of the indicators"""
+        sections = {name: np.unique(np.frombuffer(hashes, dtype=np.uint64)) for name, hashes in self.hashes.items()}
+        for (version, length), networks in network_tables(self.networks).items():
+            sections[f'net{version}/{length}'] = networks
+        return sections
+
+def store_sections(iocs):
+    """Return the sections holding the indicators of iocs (type -> strings)"""
+    builder = SectionBuilder(iocs)
+    for ioc_type, values in iocs.items():
+        for value in values:
+            builder.add(ioc_type, value)
+    return builder.sections()
+
+def _empty_section(name):
+    """Return an empty array of the kind a section holds"""
+    return np.empty(0, dtype='S16' if name.startswith('net6/') else np.uint64)
+
+def build_store(path, iocs, base=None):
+    """Write a store holding the indicators of iocs (type -> strings) and of a base store
+
+    The file is replaced atomically, so processes that still map the
+    previous version keep a consistent view of it.
+    """
+    return apply_changes(path, base, added=store_sections(iocs))
+
+def apply_changes(path, base=None, added=None, removed=None):
+    """Write a store holding a base store's sections with added and removed section items"""
+    sections = base.arrays() if base is not None else {}
+    for name, items in (removed or {}).items():
+        if name in sections and len(items):
+            sections[name] = np.setdiff1d(sections[name], items, assume_unique=True)
+    for name, items in (added or {}).items():
+        sections[name] = np.union1d(sections.get(name, _empty_section(name)), items)
+    return write_store(path, sections)
+
+def write_store(path, sections):
+    """Write sections (name -> sorted unique NumPy array) as a store, returning the item count"""
+    for name in sections:
+        if len(name.encode()) > 16:
+            raise ValueError(f"IOC type name is too long: {name}")
+    sections = [(name, items.astype('S16' if name.startswith('net6/') else '<u8'))
+                for name, items in sorted(sections.items())]
+    offset = _HEADER.size + len(sections) * _SECTION.size
+    table = []
+    digest = hashlib.sha256()
+    for name, hashes in sections:
+        table.append(_SECTION.pack(name.encode(), offset, len(hashes)))
+        digest.update(f"{name}:{len(hashes)}\n".encode())
+        digest.update(hashes.tobytes())
+        offset += hashes.nbytes
+
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.iocs-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, len(sections), digest.digest()))
+            f.write(b''.join(table))
+            for _, hashes in sections:
+                f.write(hashes.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return sum(len(hashes) for _, hashes in sections)
@@ -6,15 +6,121 @@ Network analysis module for ZeroHunter
 """
 
 import os
+import sys
 import time
+import queue
 import logging
-import threading
 import socket
 import struct
-import pcap
+import ipaddress
+import selectors
+import threading
+import multiprocessing
+from array import array
+from functools import partial
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from zerohunter.core.lazy import lazy_import
+from zerohunter.core.metrics import get_registry
+from zerohunter.core.scheduler import create_scheduler, PRIORITY_LOW
+from zerohunter.detection.afpacket import open_fanout
+from zerohunter.detection.dns import parse_message, TYPE_CNAME
+from zerohunter.detection.flows import FlowTable
+from zerohunter.detection.overload import OverloadController, SLOT_HEADER_ONLY
+from zerohunter.detection.packet import PacketDecoder, IPV6_EXTENSIONS, IPV6_FRAGMENT, PROTO_TCP, PROTO_UDP
+from zerohunter.detection.pcapfile import PcapReader
+from zerohunter.detection.protocols import HttpAnalyzer, SmtpAnalyzer, FtpAnalyzer
+from zerohunter.detection.reassembly import Reassembler
+from zerohunter.detection.ringbuffer import PacketRing
+
+pcap = lazy_import('pcap')
 
 logger = logging.getLogger('zerohunter.detection.network')
 
+# Analyzer and packet index inherited by forked replay workers (see NetworkAnalyzer.replay_pcap)
+_replay_analyzer = None
+_replay_index = None
+
+# Ports captured for each network.analyze_* flag
+ANALYZED_PORTS = {
+    'analyze_dns': (None, (53,)),  # DNS also runs over TCP
+    'analyze_http': ('tcp', (80, 8000, 8080)),
+    'analyze_https': ('tcp', (443, 8443)),
+    'analyze_email': ('tcp', (25, 110, 143, 465, 587, 993, 995)),
+    'analyze_ftp': ('tcp', (20, 21)),
+    'analyze_ssh': ('tcp', (22,)),
+}
+
+# Server ports whose TCP streams are reassembled, per network.analyze_* flag
+STREAM_ANALYZERS = (
+    ('analyze_http', (80, 8000, 8080), HttpAnalyzer),
+    ('analyze_email', (25, 587), SmtpAnalyzer),
+    ('analyze_ftp', (21,), FtpAnalyzer),
+)
+
+
+def build_capture_filter(config):
+    """Compile the network.* settings into a BPF expression; '' captures everything, None nothing"""
+    clauses = []
+    if not config.get('network.capture_other_traffic', False):
+        ports = []
+        for flag, (protocol, numbers) in ANALYZED_PORTS.items():
+            if config.get(f'network.{flag}', True):
+                prefix = f'{protocol} ' if protocol else ''
+                ports.extend(f'{prefix}port {number}' for number in numbers)
+        if not ports:
+            return None
+        # Non-first IPv4 fragments carry no ports but belong to analyzed traffic
+        ports.append('(ip[6:2] & 0x1fff != 0)')
+        # 'port' does not look past IPv6 extension or fragment headers; the
+        # decoder does, so those (rare) packets are all captured
+        extensions = sorted(IPV6_EXTENSIONS | {IPV6_FRAGMENT})
+        ports.append('(ip6 and (' + ' or '.join(f'ip6[6] == {value}' for value in extensions) + '))')
+        clauses.append('(' + ' or '.join(ports) + ')')
+
+    ignored = []
+    for peer in config.get('network.ignore_peers', []):
+        try:
+            network = ipaddress.ip_network(peer, strict=False)
+        except ValueError:
+            logger.error(f"Ignoring invalid peer address in network.ignore_peers: {peer}")
+            continue
+        if network.num_addresses == 1:
+            ignored.append(f'host {network.network_address}')
+        else:
+            ignored.append(f'net {network}')
+    if ignored:
+        clauses.append('not (' + ' or '.join(ignored) + ')')
+
+    expression = config.get('network.capture_filter', '')
+    if expression:
+        clauses.append(f'({expression})')
+    expression = ' and '.join(clauses)
+    if not expression:
+        return expression
+    # Offsets in the expression assume untagged frames; 'vlan' moves them past
+    # one 802.1Q/802.1ad tag, so tagged and QinQ frames are matched again
+    return f'({expression}) or (vlan and (({expression}) or (vlan and ({expression}))))'
+
+def _init_replay_worker(analyzer, index):
+    """Install the parent's network analyzer and packet index in a forked replay worker"""
+    global _replay_analyzer, _replay_index
+    _replay_analyzer = analyzer
+    _replay_index = index
+    get_registry().reset()
+
+
+def _replay_shard(path, shard):
+    """Replay one flow-hash shard of a capture file inside a replay worker"""
+    with PcapReader(path) as reader:
+        stats = _replay_analyzer._replay(reader.packets_at(*_replay_index[shard]))
+    registry = get_registry()
+    metrics = registry.snapshot()
+    registry.reset()
+    return stats, metrics, _replay_analyzer.pop_flow_features(), list(_replay_analyzer.events)
+
+
 class NetworkAnalyzer:
     """Network analysis module for ZeroHunter"""
     
@@ -22,7 +128,23 @@ class NetworkAnalyzer:
         """Initialize network analyzer"""
         self.config = config
         self.running = False
-        self.thread = None
+        self.scheduler = None
+        self.owns_scheduler = False
+        self.poll_batch = config.get('network.poll_batch', 1000)
+        self.capture_timeout = config.get('network.capture_timeout_ms', 50)
+        self.immediate = config.get('network.capture_immediate', False)
+        self.stats_interval = config.get('network.stats_interval', 10.0)
+        self.capture_backend = config.get('network.capture_backend', 'pcap')
+        if self.capture_backend == 'afpacket' and not sys.platform.startswith('linux'):
+            logger.warning("The afpacket capture backend needs Linux, capturing with pcap")
+            self.capture_backend = 'pcap'
+        self.capture_fanout = max(config.get('network.capture_fanout', 1), 1)
+        self.afpacket_options = {
+            'block_size': config.get('network.afpacket_block_size', 1024 * 1024),
+            'block_count': config.get('network.afpacket_block_count', 64),
+            'frame_size': config.get('network.afpacket_frame_size', 2048),
+        }
+        self.metrics = get_registry()
         self.interfaces = config.get('network.interfaces', [])
         self.monitor_all = config.get('network.monitor_all', True)
         self.capture_packets = config.get('network.capture_packets', True)
@@ -32,13 +154,88 @@ class NetworkAnalyzer:
         self.analyze_email = config.get('network.analyze_email', True)
         self.analyze_ftp = config.get('network.analyze_ftp', True)
         self.analyze_ssh = config.get('network.analyze_ssh', True)
+        self.capture_filter = build_capture_filter(config)
         
         # Initialize packet capture
         self.pcap_handles = {}
+        self.capture_thread = None
+        self.wakeup = None
+        self.drops = {}
+        
+        # Captured packets are copied into rings and analyzed by worker
+        # threads (or forked processes), so slow analysis never stalls capture
+        self.analysis_workers = max(config.get('network.analysis_workers', 1), 1)
+        self.analysis_processes = config.get('network.analysis_processes', False)
+        self.ring_slots = config.get('network.ring_slots', 16384)
+        self.ring_slot_size = config.get('network.ring_slot_size', 2048)
+        self.rings = []
+        self.workers = []
+        self.worker_results = None
+        self.is_worker = False
+        self.interface_index = {}
+        self.ring_drops = {}
+        self.header_only_counts = [0] * self.analysis_workers
+        # Header-only packets already counted in a coverage report
+        self.header_only_reported = 0
+        
+        # When analysis falls behind, payloads of low-priority protocols are
+        # skipped and then flows are sampled, instead of dropping at random
+        self.overload_control = config.get('network.overload_control', True)
+        self.overload_interval = config.get('network.overload_interval', 1.0)
+        self.overload = OverloadController(
+            high_watermark=config.get('network.overload_high_watermark', 0.5),
+            low_watermark=config.get('network.overload_low_watermark', 0.1),
+            max_latency=config.get('network.overload_max_latency', 1.0),
+            min_sample_rate=config.get('network.overload_min_sample_rate', 1 / 64),
+            recover_after=config.get('network.overload_recover_after', 5),
+        )
+        self.low_priority_protocols = config.get('network.low_priority_protocols', ['http'])
+        self.low_priority_ports = frozenset(port for _, ports, analyzer in STREAM_ANALYZERS
+                                            if analyzer.protocol in self.low_priority_protocols
+                                            for port in ports)
+        
+        # Each decoder reuses its header record; interfaces without a decoder
+        # for their link type use the Ethernet one
+        self.decoder = PacketDecoder()
+        self.decoders = {}
+        
+        # Per-connection state; finished flows are exported as feature batches
+        self.flow_table = FlowTable(
+            max_flows=config.get('network.max_flows', 200000),
+            idle_timeout=config.get('network.flow_idle_timeout', 60.0),
+            active_timeout=config.get('network.flow_active_timeout', 300.0),
+        )
+        self.flow_export_interval = config.get('network.flow_export_interval', 10.0)
+        self.flow_batches = deque(maxlen=config.get('network.max_flow_batches', 64))
+        
+        # TCP streams of the analyzed protocols are reassembled for the
+        # stream analyzers, which report protocol events
+        self.events = deque(maxlen=config.get('network.max_events', 10000))
+        self.reassembler = None
+        self.stream_lock = threading.Lock()
+        if config.get('network.reassembly', True):
+            max_line = config.get('network.max_line', 8192)
+            analyzers = {}
+            for flag, ports, analyzer in STREAM_ANALYZERS:
+                if config.get(f'network.{flag}', True):
+                    for port in ports:
+                        analyzers[port] = partial(analyzer, emit=self.events.append, max_line=max_line)
+            self.reassembler = Reassembler(
+                analyzers,
+                depth=config.get('network.reassembly_depth', 64 * 1024),
+                max_streams=config.get('network.reassembly_max_streams', 50000),
+                max_pending=config.get('network.reassembly_max_pending', 256 * 1024),
+                max_memory=config.get('network.reassembly_max_memory', 128 * 1024 * 1024),
+                window=config.get('network.reassembly_window', 1024 * 1024),
+                idle_timeout=config.get('network.reassembly_idle_timeout', 120.0),
+            )
+        
+        # Threat intelligence that DNS names are checked against; set by the detection engine
+        self.ioc_source = None
         
         logger.info("Network analyzer initialized")
         
-    def start(self):
+    def start(self, scheduler=None):
         """Start network analysis"""
         if self.running:
             logger.warning("Network analyzer already running")
@@ -46,9 +243,25 @@ class NetworkAnalyzer:
             
         self.running = True
         self._init_packet_capture()
-        self.thread = threading.Thread(target=self._monitor_loop)
-        self.thread.daemon = True
-        self.thread.start()
+        self.owns_scheduler = scheduler is None
+        self.scheduler = scheduler or create_scheduler(self.config)
+        self.scheduler.add_periodic('network.capture_stats', self._update_capture_stats,
+                                    self.stats_interval, priority=PRIORITY_LOW)
+        self.scheduler.add_periodic('network.flows', self._export_flows,
+                                    self.flow_export_interval, priority=PRIORITY_LOW)
+        if self.owns_scheduler:
+            self.scheduler.start()
+        
+        # Packets are drained by a thread that sleeps until a handle is readable
+        if self.pcap_handles:
+            self._start_analysis()
+            if self.overload_control:
+                self.scheduler.add_periodic('network.overload', self._update_overload,
+                                            self.overload_interval)
+            self.wakeup = os.pipe()
+            self.capture_thread = threading.Thread(target=self._capture_loop, name='network-capture')
+            self.capture_thread.daemon = True
+            self.capture_thread.start()
         logger.info("Network analyzer started")
         
     def stop(self):
@@ -58,13 +271,28 @@ class NetworkAnalyzer:
             return
             
         self.running = False
-        if self.thread:
-            self.thread.join(timeout=5.0)
+        if self.capture_thread:
+            os.write(self.wakeup[1], b'\0')
+            self.capture_thread.join()
+            self.capture_thread = None
+            for fd in self.wakeup:
+                os.close(fd)
+            self.wakeup = None
+        self._stop_analysis()
+        
+        self.scheduler.remove('network.capture_stats')
+        self.scheduler.remove('network.flows')
+        self.scheduler.remove('network.overload')
+        if self.owns_scheduler:
+            self.scheduler.stop()
+        self.scheduler = None
             
         # Close pcap handles
+        self._update_capture_stats()
         for handle in self.pcap_handles.values():
             handle.close()
         self.pcap_handles = {}
+        self.decoders = {}
             
         logger.info("Network analyzer stopped")
         
@@ -72,51 +300,402 @@ class NetworkAnalyzer:
         """Initialize packet capture"""
         if not self.capture_packets:
             return
+        if self.capture_filter is None:
+            logger.info("No network protocols selected for analysis, not capturing packets")
+            return
             
         # Get all interfaces if monitor_all is True
         if self.monitor_all and not self.interfaces:
-            self.interfaces = pcap.findalldevs()
+            if self.capture_backend == 'afpacket':
+                self.interfaces = [name for _, name in socket.if_nameindex()]
+            else:
+                self.interfaces = pcap.findalldevs()
             
-        # Initialize pcap handles for each interface
+        # Initialize capture handles for each interface
         for interface in self.interfaces:
             try:
-                self.pcap_handles[interface] = pcap.pcap(name=interface, promisc=True, immediate=True)
-                logger.info(f"Initialized packet capture on interface: {interface}")
+                if self.capture_backend == 'afpacket':
+                    # Fanout sockets split the interface's flows between them
+                    handles = open_fanout(interface, self.capture_fanout,
+                                          timeout_ms=self.capture_timeout, **self.afpacket_options)
+                else:
+                    # Without immediate mode the kernel hands over packets in
+                    # blocks, waking the capture thread at most every timeout_ms
+                    handle = pcap.pcap(name=interface, promisc=True, immediate=self.immediate,
+                                       timeout_ms=self.capture_timeout)
+                    handle.setnonblock(True)
+                    handles = [handle]
+                for index, handle in enumerate(handles):
+                    name = interface if len(handles) == 1 else f'{interface}#{index}'
+                    # Traffic that is not analyzed is dropped in the kernel
+                    if self.capture_filter:
+                        try:
+                            handle.setfilter(self.capture_filter)
+                        except Exception as e:
+                            logger.error(f"Error setting capture filter on interface {interface}, "
+                                         f"capturing all traffic: {e}")
+                    self.pcap_handles[name] = handle
+                    self.decoders[name] = PacketDecoder(handle.datalink())
+                logger.info(f"Initialized {self.capture_backend} packet capture on interface: {interface}")
             except Exception as e:
                 logger.error(f"Error initializing packet capture on interface {interface}: {e}")
         
-    def _monitor_loop(self):
-        """Main monitoring loop"""
-        while self.running:
+    def _capture_loop(self):
+        """Wait on all pcap handles with epoll and drain the readable ones"""
+        selector = selectors.DefaultSelector()
+        selector.register(self.wakeup[0], selectors.EVENT_READ)
+        unselectable = []
+        for interface, handle in self.pcap_handles.items():
+            fd = handle.fileno()
+            if fd >= 0:
+                selector.register(fd, selectors.EVENT_READ, interface)
+            else:
+                unselectable.append(interface)
+        
+        # Handles without a selectable descriptor are polled every timeout
+        timeout = self.capture_timeout / 1000.0 if unselectable else None
+        try:
+            while self.running:
+                ready = [key.data for key, _ in selector.select(timeout) if key.data is not None]
+                for interface in ready + unselectable:
+                    if not self.running:
+                        break
+                    self._drain(interface)
+        finally:
+            selector.close()
+    
+    def _drain(self, interface):
+        """Process the packets available on an interface, one batch at a time"""
+        handle = self.pcap_handles[interface]
+        try:
+            # Handles are non-blocking, so this stops once the buffer is empty;
+            # batches are bounded so a busy interface cannot starve the others
+            start = time.perf_counter()
+            count = handle.dispatch(self.poll_batch, self._enqueue_packet, interface)
+            if count:
+                self.metrics.observe('NetworkAnalyzer', '_enqueue_packet',
+                                     time.perf_counter() - start, count=count)
+        except Exception as e:
+            logger.error(f"Error processing packets on interface {interface}: {e}")
+    
+    def _enqueue_packet(self, ts, pkt, interface):
+        """Copy a captured packet into the ring of its analysis worker"""
+        rings = self.rings
+        overload = self.overload
+        flow_hash = 0
+        if len(rings) > 1 or overload.sampling:
+            flow_hash = self.decoders[interface].address_hash(pkt)
+        # Sampling and worker assignment both go by address pair, so all
+        # packets of a flow are either analyzed by one worker or skipped
+        if not overload.admit(flow_hash):
+            return
+        ring = rings[flow_hash % len(rings)]
+        ring.push(ts, pkt, self.interface_index[interface], overload.flags)
+    
+    def _start_analysis(self):
+        """Create the packet rings and start one analysis worker per ring"""
+        interfaces = list(self.pcap_handles)
+        self.interface_index = {interface: index for index, interface in enumerate(interfaces)}
+        linktypes = [self.decoders[interface].linktype for interface in interfaces]
+        if self.analysis_processes:
+            context = multiprocessing.get_context('fork')
+            self.worker_results = context.Queue()
+        
+        for index in range(self.analysis_workers):
+            ring = PacketRing(self.ring_slots, self.ring_slot_size)
+            self.rings.append(ring)
+            name = f'network-analysis-{index}'
+            if self.analysis_processes:
+                worker = context.Process(target=self._analysis_process, args=(index, ring, linktypes), name=name)
+            else:
+                worker = threading.Thread(target=self._analysis_loop, args=(index, ring, linktypes), name=name)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+        logger.info(f"Started {self.analysis_workers} packet analysis "
+                    f"{'processes' if self.analysis_processes else 'threads'}")
+    
+    def _stop_analysis(self):
+        """Let the analysis workers finish the queued packets and stop them"""
+        for ring in self.rings:
+            ring.close()
+        for worker in self.workers:
+            while worker.is_alive():
+                # Worker processes cannot exit before their results are read
+                if self.worker_results is not None:
+                    self._collect_worker_results()
+                worker.join(0.1)
+        if self.worker_results is not None:
+            self._collect_worker_results()
+        self._update_capture_stats()
+        for ring in self.rings:
+            ring.release()
+        self.rings = []
+        self.workers = []
+        self.worker_results = None
+    
+    def _analysis_loop(self, index, ring, linktypes, report=None):
+        """Analyze the packets queued in a ring until it is closed"""
+        # Decoders reuse their header record, so every worker has its own
+        decoders = [PacketDecoder(linktype) for linktype in linktypes]
+        low_priority_ports = self.low_priority_ports
+        header_only_counts = self.header_only_counts
+        
+        def process(ts, data, interface, flags):
             try:
-                # Process packets from all interfaces
-                for interface, handle in self.pcap_handles.items():
-                    try:
-                        # Process up to 100 packets at a time
-                        for i in range(100):
-                            if not self.running:
-                                break
-                                
-                            # Get next packet (non-blocking)
-                            try:
-                                ts, pkt = next(handle)
-                                self._process_packet(ts, pkt, interface)
-                            except StopIteration:
-                                # No more packets available
-                                break
-                    except Exception as e:
-                        logger.error(f"Error processing packets on interface {interface}: {e}")
-                
-                # Sleep for a bit
-                time.sleep(0.01)
+                header = decoders[interface].decode(ts, data)
+                if header is None:
+                    return
+                if flags & SLOT_HEADER_ONLY and (header.dport in low_priority_ports or
+                                                 header.sport in low_priority_ports):
+                    header_only_counts[index] += 1
+                    self._analyze_packet(header, data, payload=False)
+                else:
+                    self._analyze_packet(header, data)
             except Exception as e:
-                logger.error(f"Error in network monitoring loop: {e}")
-                
+                logger.error(f"Error analyzing packet: {e}")
+        
+        last_report = time.monotonic()
+        while True:
+            start = time.perf_counter()
+            count = ring.pop_batch(process, self.poll_batch)
+            if count:
+                self.metrics.observe('NetworkAnalyzer', '_process_packet',
+                                     time.perf_counter() - start, count=count)
+            elif ring.closed:
+                break
+            else:
+                ring.wait(0.1)
+            if report is not None and time.monotonic() - last_report >= self.flow_export_interval:
+                report()
+                last_report = time.monotonic()
+        if report is not None:
+            report()
+    
+    def _analysis_process(self, index, ring, linktypes):
+        """Run an analysis loop in a forked process"""
+        self.is_worker = True
+        get_registry().reset()
+        self._analysis_loop(index, ring, linktypes, partial(self._report_results, index))
+        self.worker_results.close()
+        self.worker_results.join_thread()
+    
+    def _report_results(self, index):
+        """Send a worker process's finished flows, events and metrics to the parent"""
+        self._export_flows()
+        events = list(self.events)
+        self.events.clear()
+        registry = get_registry()
+        metrics = registry.snapshot()
+        counters = registry.counters()
+        registry.reset()
+        self.worker_results.put((index, self.pop_flow_features(), events, metrics, counters,
+                                 self.header_only_counts[index]))
+    
+    def _collect_worker_results(self):
+        """Merge the results sent by the analysis processes"""
+        while True:
+            try:
+                index, batches, events, metrics, counters, header_only = self.worker_results.get_nowait()
+            except queue.Empty:
+                return
+            # Each process counts only its own worker's packets, cumulatively
+            self.header_only_counts[index] = header_only
+            self.flow_batches.extend(batches)
+            self.events.extend(events)
+            self.metrics.merge(metrics)
+            for name, labels, value in counters:
+                self.metrics.set_counter(name, value, worker=str(index), **labels)
+    
+    def _update_capture_stats(self):
+        """Export the kernel's receive and drop counters for every interface"""
+        for interface, handle in list(self.pcap_handles.items()):
+            try:
+                received, dropped, ifdropped = handle.stats()
+            except Exception as e:
+                logger.error(f"Error reading capture statistics on interface {interface}: {e}")
+                continue
+            
+            self.metrics.set_counter('capture_packets_received_total', received, interface=interface)
+            self.metrics.set_counter('capture_packets_dropped_total', dropped, interface=interface)
+            self.metrics.set_counter('capture_packets_ifdropped_total', ifdropped, interface=interface)
+            previous = self.drops.get(interface, 0)
+            if dropped > previous:
+                logger.warning(f"Kernel dropped {dropped - previous} packets on interface {interface}")
+            self.drops[interface] = dropped
+        
+        # Packets dropped between capture and analysis
+        for index, ring in enumerate(self.rings):
+            stats = ring.stats()
+            for name in ('pushed', 'dropped', 'truncated'):
+                self.metrics.set_counter(f'ring_packets_{name}_total', stats[name], ring=str(index))
+            previous = self.ring_drops.get(index, 0)
+            if stats['dropped'] > previous:
+                logger.warning(f"Analysis ring {index} was full, dropped {stats['dropped'] - previous} packets")
+            self.ring_drops[index] = stats['dropped']
+    
+    def _update_overload(self):
+        """Adjust load shedding to the analysis backlog and export its state"""
+        self.overload.update(self.rings)
+        stats = self.overload.stats()
+        for name in ('level', 'sample_rate', 'queue_fill', 'queue_latency_seconds'):
+            self.metrics.set_gauge(f'overload_{name}', stats[name])
+        self.metrics.set_counter('overload_sampled_out_packets_total', stats['sampled_out_packets'])
+        self.metrics.set_counter('overload_transitions_total', stats['transitions'])
+    
     def _process_packet(self, ts, pkt, interface):
         """Process a captured packet"""
-        # This is a placeholder for actual implementation
-        # In a real implementation, this would parse and analyze the packet
-        pass
+        header = self.decoders.get(interface, self.decoder).decode(ts, pkt)
+        if header is not None:
+            self._analyze_packet(header, pkt)
+    
+    def _analyze_packet(self, header, pkt, payload=True):
+        """Analyze a decoded packet; payload=False skips stream reassembly"""
+        self.flow_table.update(header)
+        if payload and self.reassembler is not None and header.protocol == PROTO_TCP and not header.fragment:
+            data = memoryview(pkt)[header.payload_offset:header.payload_offset + header.payload_length]
+            with self.stream_lock:
+                self.reassembler.process(header, data)
+        elif (self.analyze_dns and header.protocol == PROTO_UDP and header.sport == 53
+              and header.payload_length and not header.fragment):
+            self._analyze_dns(header, pkt)
+    
+    def _analyze_dns(self, header, pkt):
+        """Report a DNS response, with the domain IOC covering its names if any"""
+        message = parse_message(memoryview(pkt)[header.payload_offset:header.payload_offset + header.payload_length])
+        if message is None or not message['response']:
+            return
+        ioc = None
+        if self.ioc_source is not None:
+            # CNAME targets reveal the real destination of innocent-looking names
+            names = [message['query']] + [value for _, rtype, value in message['answers'] if rtype == TYPE_CNAME]
+            for name in names:
+                ioc = self.ioc_source.match_domain(name)
+                if ioc is not None:
+                    break
+        self.events.append({
+            'protocol': 'dns', 'type': 'response', 'ts': header.ts, 'client': header.dst,
+            'client_port': header.dport, 'server': header.src, 'server_port': header.sport,
+            'query': message['query'], 'qtype': message['qtype'], 'rcode': message['rcode'],
+            'answers': [value for _, _, value in message['answers']], 'ioc': ioc,
+        })
+    
+    def replay_pcap(self, path, jobs=1):
+        """Push a pcap or pcapng file through the packet pipeline as fast as possible"""
+        logger.info(f"Replaying capture file: {path}")
+        start = time.perf_counter()
+        if jobs <= 1:
+            with PcapReader(path) as reader:
+                shards = [self._replay(reader)]
+            packets = shards[0]['packets']
+            nbytes = shards[0]['bytes']
+        else:
+            # One pass assigns every packet to a shard by its flow's 5-tuple
+            # hash, so all packets of a flow meet in one worker, and every
+            # worker then reads only its own packets
+            index, packets, nbytes = self._index_capture(path, jobs)
+            context = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(max_workers=jobs, mp_context=context,
+                                     initializer=_init_replay_worker, initargs=(self, index)) as executor:
+                futures = [executor.submit(_replay_shard, path, shard) for shard in range(jobs)]
+                shards = []
+                for future in futures:
+                    stats, metrics, batches, events = future.result()
+                    self.metrics.merge(metrics)
+                    self.flow_batches.extend(batches)
+                    self.events.extend(events)
+                    shards.append(stats)
+        seconds = time.perf_counter() - start
+        
+        stats = {
+            'file': path,
+            'packets': packets,
+            'bytes': nbytes,
+            'analyzed': sum(shard['analyzed'] for shard in shards),
+            'flows': sum(shard['flows'] for shard in shards),
+            'jobs': len(shards),
+            'seconds': seconds,
+            'packets_per_s': packets / seconds if seconds else 0.0,
+        }
+        self.metrics.observe('NetworkAnalyzer', 'replay_pcap', seconds, stats['bytes'])
+        logger.info(f"Replayed {packets} packets from {path} in {seconds:.2f}s "
+                    f"({stats['packets_per_s']:.0f} packets/s)")
+        return stats
+    
+    def _index_capture(self, path, shards):
+        """Return the (times, offsets, lengths, link types) of each shard's packets, and the totals"""
+        index = [(array('d'), array('Q'), array('I'), array('H')) for _ in range(shards)]
+        decoders = {}
+        packets = nbytes = 0
+        with PcapReader(path) as reader:
+            data = reader.buffer
+            for ts, offset, length, linktype in reader.locate():
+                packets += 1
+                nbytes += length
+                decoder = decoders.get(linktype)
+                if decoder is None:
+                    decoder = decoders[linktype] = PacketDecoder(linktype)
+                times, offsets, lengths, linktypes = index[decoder.flow_hash(data, offset) % shards]
+                times.append(ts)
+                offsets.append(offset)
+                lengths.append(length)
+                linktypes.append(linktype)
+        return index, packets, nbytes
+    
+    def _replay(self, packets):
+        """Analyze (ts, data, linktype) packets read from a capture file"""
+        decoders = {}
+        count = nbytes = analyzed = 0
+        created = self.flow_table.counts['created']
+        for ts, data, linktype in packets:
+            count += 1
+            nbytes += len(data)
+            decoder = decoders.get(linktype)
+            if decoder is None:
+                decoder = decoders[linktype] = PacketDecoder(linktype)
+            header = decoder.decode(ts, data)
+            if header is None:
+                continue
+            self._analyze_packet(header, data)
+            analyzed += 1
+            
+            # Expire flows by capture time, not wall time
+            if not analyzed % 65536:
+                self._export_flows(now=ts)
+        
+        flows = self.flow_table.counts['created'] - created
+        self.flow_table.flush()
+        if self.reassembler is not None:
+            with self.stream_lock:
+                self.reassembler.flush()
+        self._export_flows(now=self.flow_table.last_ts)
+        return {'packets': count, 'bytes': nbytes, 'analyzed': analyzed, 'flows': flows}
+                
+    def _export_flows(self, now=None):
+        """Expire idle flows and queue the finished ones as a feature batch"""
+        if self.worker_results is not None and not self.is_worker:
+            self._collect_worker_results()
+        now = time.time() if now is None else now
+        self.flow_table.expire(now)
+        if self.reassembler is not None:
+            with self.stream_lock:
+                self.reassembler.expire(now)
+            for name, value in dict(self.reassembler.counts).items():
+                self.metrics.set_counter(f'reassembly_{name}_total', value)
+        batch = self.flow_table.export()
+        if batch is not None:
+            self.flow_batches.append(batch)
+        
+        for name, value in dict(self.flow_table.counts).items():
+            self.metrics.set_counter(f'flows_{name}_total', value)
+        self.metrics.set_counter('overload_header_only_packets_total', sum(self.header_only_counts))
+    
+    def pop_flow_features(self):
+        """Return and forget the exported flow feature batches"""
+        batches = []
+        while self.flow_batches:
+            batches.append(self.flow_batches.popleft())
+        return batches
                 
     def scan_network(self):
         """Scan the network for threats"""
@@ -126,4 +705,16 @@ class NetworkAnalyzer:
         # This is a placeholder for actual implementation
         # In a real implementation, this would analyze network traffic and connections
         
+        # Tell the analyst when part of the traffic was not analyzed
+        if self.worker_results is not None:
+            self._collect_worker_results()
+        header_only = sum(self.header_only_counts)
+        coverage = self.overload.coverage()
+        if coverage is not None:
+            coverage['type'] = 'partial_coverage'
+            coverage['header_only_packets'] = header_only - self.header_only_reported
+            coverage['low_priority_protocols'] = list(self.low_priority_protocols)
+            results.append(coverage)
+        self.header_only_reported = header_only
+        
         return results
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Overload control for ZeroHunter network analysis
+
+Watches the backlog between packet capture and analysis (how full the
+packet rings are and how long the queued packets will take to drain at
+the rate the workers currently manage) and sheds load in steps when
+analysis falls behind, rather than letting full rings drop packets at
+random. The first step skips payload analysis for low-priority protocols
+(header-only mode); every further step halves the share of flows that
+are analyzed. Flows are sampled by a hash of their address pair, so a
+sampled flow is analyzed completely. Load is restored one step at a time
+once the backlog has stayed low for a few updates.
+"""
+
+import time
+import logging
+
+logger = logging.getLogger('zerohunter.detection.overload')
+
+LEVEL_FULL = 0
+LEVEL_HEADER_ONLY = 1
+# Levels above LEVEL_HEADER_ONLY also analyze only 1 / 2 ** (level - 1) of the flows
+
+# Ring slot flag telling the analysis worker to skip low-priority payloads
+SLOT_HEADER_ONLY = 0x01
+
+_HASH_MULTIPLIER = 0x9e3779b1
+
+class OverloadController:
+    """Chooses how much of the captured traffic is analyzed from the analysis backlog"""
+
+    def __init__(self, high_watermark=0.5, low_watermark=0.1, max_latency=1.0,
+                 min_sample_rate=1 / 64, recover_after=5):
+        """Initialize overload controller"""
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.max_latency = max_latency
+        self.recover_after = recover_after
+        self.max_level = LEVEL_HEADER_ONLY
+        while 1 / 2 ** self.max_level >= min_sample_rate:
+            self.max_level += 1
+
+        # Read by the capture thread for every packet
+        self.level = LEVEL_FULL
+        self.flags = 0
+        self.threshold = None
+        self.sampled_out = 0
+
+        self.transitions = 0
+        self.calm = 0
+        self.fill = 0.0
+        self.latency = 0.0
+        self.dropped = 0
+        self.previous = {}
+
+        # Shedding since the last coverage report
+        self.shed_since = None
+        self.shed_max_level = LEVEL_FULL
+        self.shed_sampled_out = 0
+        self.shed_dropped = 0
+
+    @property
+    def sample_rate(self):
+        """Share of the flows currently analyzed"""
+        return 1 / 2 ** max(self.level - LEVEL_HEADER_ONLY, 0)
+
+    @property
+    def sampling(self):
+        """Whether flows are currently sampled"""
+        return self.threshold is not None
+
+    def admit(self, flow_hash):
+        """Return whether a packet with the given address-pair hash is analyzed"""
+        threshold = self.threshold
+        if threshold is None or (flow_hash * _HASH_MULTIPLIER) & 0xffffffff < threshold:
+            return True
+        self.sampled_out += 1
+        return False
+
+    def update(self, rings, now=None):
+        """Re-evaluate the shedding level from the rings' backlog, returning the level"""
+        now = time.monotonic() if now is None else now
+        fill = latency = 0.0
+        dropped = 0
+        for index, ring in enumerate(rings):
+            stats = ring.stats()
+            fill = max(fill, stats['queued'] / ring.slots)
+            previous = self.previous.get(index)
+            self.previous[index] = (now, stats['consumed'], stats['dropped'])
+            if previous is None:
+                continue
+            elapsed = now - previous[0]
+            rate = (stats['consumed'] - previous[1]) / elapsed if elapsed > 0 else 0.0
+            if stats['queued']:
+                # Time until the last queued packet is analyzed at the current pace
+                latency = max(latency, stats['queued'] / rate if rate else float('inf'))
+            dropped += stats['dropped'] - previous[2]
+        self.fill = fill
+        self.latency = latency
+        self.dropped += dropped
+
+        if fill >= self.high_watermark or latency > self.max_latency or dropped:
+            self.calm = 0
+            if self.level < self.max_level:
+                self._set_level(self.level + 1)
+                logger.warning(f"Network analysis overloaded (queue {fill:.0%}, latency {latency:.2f}s, "
+                               f"{dropped} dropped), shedding load: level {self.level}, "
+                               f"analyzing {self.sample_rate:.1%} of flows")
+        elif fill <= self.low_watermark and latency <= self.max_latency / 2:
+            self.calm += 1
+            if self.level > LEVEL_FULL and self.calm >= self.recover_after:
+                self.calm = 0
+                self._set_level(self.level - 1)
+                logger.info(f"Network analysis load dropped, restoring: level {self.level}, "
+                            f"analyzing {self.sample_rate:.1%} of flows")
+        else:
+            self.calm = 0
+
+        if self.level > LEVEL_FULL or dropped:
+            if self.shed_since is None:
+                self.shed_since = time.time()
+            self.shed_max_level = max(self.shed_max_level, self.level)
+            self.shed_dropped += dropped
+        return self.level
+
+    def coverage(self):
+        """Return how coverage was reduced since the last call, or None if it was complete"""
+        if self.shed_since is None:
+            return None
+        sampled_out = self.sampled_out
+        report = {
+            'since': self.shed_since,
+            'until': time.time(),
+            'max_level': self.shed_max_level,
+            'min_sample_rate': 1 / 2 ** max(self.shed_max_level - LEVEL_HEADER_ONLY, 0),
+            'header_only': self.shed_max_level >= LEVEL_HEADER_ONLY,
+            'sampled_out_packets': sampled_out - self.shed_sampled_out,
+            'dropped_packets': self.shed_dropped,
+        }
+        # A window still shedding continues in the next report
+        self.shed_since = report['until'] if self.level > LEVEL_FULL else None
+        self.shed_max_level = self.level
+        self.shed_sampled_out = sampled_out
+        self.shed_dropped = 0
+        return report
+
+    def stats(self):
+        """Return the current shedding state"""
+        return {
+            'level': self.level,
+            'sample_rate': self.sample_rate,
+            'queue_fill': self.fill,
+            'queue_latency_seconds': self.latency,
+            'sampled_out_packets': self.sampled_out,
+            'transitions': self.transitions,
+        }
+
+    def _set_level(self, level):
+        """Switch to a shedding level"""
+        self.level = level
+        self.transitions += 1
+        self.flags = SLOT_HEADER_ONLY if level >= LEVEL_HEADER_ONLY else 0
+        rate = self.sample_rate
+        self.threshold = None if rate >= 1 else int(rate * 0x100000000)
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Packet decoder for ZeroHunter
+
+Decodes Ethernet (with 802.1Q/802.1ad VLAN tags), IPv4, IPv6, TCP, UDP,
+ICMP and ICMPv6 headers straight from the capture buffer. Headers are
+read with precompiled struct.Struct unpackers on a memoryview, and the
+results are written into one reused PacketHeader record, so decoding
+does not copy the packet or allocate per-packet objects beyond the
+unpacked integers.
+"""
+
+import struct
+
+# Link types (pcap DLT_* / LINKTYPE_*)
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86dd
+ETHERTYPE_VLAN = 0x8100
+ETHERTYPE_QINQ = 0x88a8
+
+PROTO_ICMP = 1
+PROTO_TCP = 6
+PROTO_UDP = 17
+PROTO_ICMPV6 = 58
+
+# IPv6 extension headers that are skipped to reach the transport header
+IPV6_EXTENSIONS = frozenset((0, 43, 60))
+IPV6_FRAGMENT = 44
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_PSH = 0x08
+TCP_ACK = 0x10
+TCP_URG = 0x20
+
+_ETHERTYPE = struct.Struct('!H')
+_VLAN = struct.Struct('!HH')
+_IPV4 = struct.Struct('!BBHHHBBHII')
+_IPV6 = struct.Struct('!IHBBQQQQ')
+_IPV4_ADDRESSES = struct.Struct('!II')
+_IPV6_ADDRESSES = struct.Struct('!QQQQ')
+_IPV6_EXTENSION = struct.Struct('!BB')
+_IPV6_FRAGMENT = struct.Struct('!BxH')
+_TCP = struct.Struct('!HHIIBB')
+_UDP = struct.Struct('!HHH')
+_ICMP = struct.Struct('!BB')
+_PORTS = struct.Struct('!HH')
+# Flow hash fields: IPv4 version/IHL, fragment, protocol and addresses; IPv6 next header and addresses
+_IPV4_FLOW = struct.Struct('!B5xHxB2xII')
+_IPV6_FLOW = struct.Struct('!6xBxQQQQ')
+
+# Multiplier spreading flow tuples over the hash range
+_MIX = 0x9e3779b97f4a7c15
+_MASK64 = (1 << 64) - 1
+
+class PacketHeader:
+    """Decoded headers of one packet; overwritten by every decode() call"""
+
+    __slots__ = ('ts', 'length', 'vlan', 'ethertype', 'ip_version', 'src', 'dst', 'ttl',
+                 'protocol', 'fragment', 'sport', 'dport', 'seq', 'ack', 'tcp_flags',
+                 'icmp_type', 'icmp_code', 'payload_offset', 'payload_length')
+
+    def __init__(self):
+        """Initialize packet header"""
+        self.clear()
+
+    def clear(self):
+        """Reset every field"""
+        self.ts = 0.0
+        self.length = 0
+        self.vlan = 0
+        self.ethertype = 0
+        self.ip_version = 0
+        self.src = 0
+        self.dst = 0
+        self.ttl = 0
+        self.protocol = 0
+        self.fragment = False
+        self.sport = 0
+        self.dport = 0
+        self.seq = 0
+        self.ack = 0
+        self.tcp_flags = 0
+        self.icmp_type = 0
+        self.icmp_code = 0
+        self.payload_offset = 0
+        self.payload_length = 0
+
+    def src_address(self):
+        """Return the source address as a string"""
+        return _format_address(self.ip_version, self.src)
+
+    def dst_address(self):
+        """Return the destination address as a string"""
+        return _format_address(self.ip_version, self.dst)
+
+    def as_dict(self):
+        """Return a copy of the fields, for findings that outlive the packet"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+class PacketDecoder:
+    """Decoder for Ethernet/VLAN/IPv4/IPv6/TCP/UDP/ICMP packets"""
+
+    def __init__(self, linktype=LINKTYPE_ETHERNET):
+        """Initialize packet decoder"""
+        self.linktype = linktype
+        self.header = PacketHeader()
+        self.errors = 0
+
+    def decode(self, ts, data):
+        """Decode a packet into the shared header record, or return None if it is not IP"""
+        view = memoryview(data)
+        header = self.header
+        header.ts = ts
+        header.length = len(view)
+        header.vlan = 0
+        header.fragment = False
+        header.sport = header.dport = 0
+        header.seq = header.ack = header.tcp_flags = 0
+        header.icmp_type = header.icmp_code = 0
+
+        try:
+            if self.linktype == LINKTYPE_ETHERNET:
+                offset = 14
+                ethertype, = _ETHERTYPE.unpack_from(view, 12)
+                while ethertype == ETHERTYPE_VLAN or ethertype == ETHERTYPE_QINQ:
+                    tci, ethertype = _VLAN.unpack_from(view, offset)
+                    # The innermost tag wins
+                    header.vlan = tci & 0x0fff
+                    offset += 4
+            elif self.linktype == LINKTYPE_RAW:
+                offset = 0
+                ethertype = ETHERTYPE_IPV6 if view[0] >> 4 == 6 else ETHERTYPE_IPV4
+            else:
+                return None
+            header.ethertype = ethertype
+
+            if ethertype == ETHERTYPE_IPV4:
+                offset, end = self._decode_ipv4(view, offset, header)
+            elif ethertype == ETHERTYPE_IPV6:
+                offset, end = self._decode_ipv6(view, offset, header)
+            else:
+                return None
+
+            if not header.fragment:
+                protocol = header.protocol
+                if protocol == PROTO_TCP:
+                    (header.sport, header.dport, header.seq, header.ack,
+                     data_offset, header.tcp_flags) = _TCP.unpack_from(view, offset)
+                    offset += (data_offset >> 4) * 4
+                elif protocol == PROTO_UDP:
+                    header.sport, header.dport, _ = _UDP.unpack_from(view, offset)
+                    offset += 8
+                elif protocol == PROTO_ICMP or protocol == PROTO_ICMPV6:
+                    header.icmp_type, header.icmp_code = _ICMP.unpack_from(view, offset)
+                    offset += 8
+        except (struct.error, IndexError):
+            # Truncated or malformed headers
+            self.errors += 1
+            return None
+        finally:
+            view.release()
+
+        # Snapped packets end before the length given in the IP header
+        end = min(end, header.length)
+        header.payload_offset = min(offset, end)
+        header.payload_length = end - header.payload_offset
+        return header
+
+    def address_hash(self, data):
+        """Return a hash of the packet's IP address pair, equal in both directions (0 if not IP)"""
+        try:
+            if self.linktype == LINKTYPE_ETHERNET:
+                offset = 14
+                ethertype, = _ETHERTYPE.unpack_from(data, 12)
+                while ethertype == ETHERTYPE_VLAN or ethertype == ETHERTYPE_QINQ:
+                    ethertype, = _ETHERTYPE.unpack_from(data, offset + 2)
+                    offset += 4
+            elif self.linktype == LINKTYPE_RAW:
+                offset = 0
+                ethertype = ETHERTYPE_IPV6 if data[0] >> 4 == 6 else ETHERTYPE_IPV4
+            else:
+                return 0
+
+            if ethertype == ETHERTYPE_IPV4:
+                src, dst = _IPV4_ADDRESSES.unpack_from(data, offset + 12)
+                return src ^ dst
+            if ethertype == ETHERTYPE_IPV6:
+                src_high, src_low, dst_high, dst_low = _IPV6_ADDRESSES.unpack_from(data, offset + 8)
+                return src_high ^ src_low ^ dst_high ^ dst_low
+        except (struct.error, IndexError):
+            pass
+        return 0
+
+    def flow_hash(self, data, offset=0):
+        """Return a hash of the 5-tuple of the packet at offset, equal in both directions (0 if not IP)
+        
+        Non-first fragments carry no ports and hash by address pair and protocol.
+        """
+        try:
+            if self.linktype == LINKTYPE_ETHERNET:
+                ethertype, = _ETHERTYPE.unpack_from(data, offset + 12)
+                offset += 14
+                while ethertype == ETHERTYPE_VLAN or ethertype == ETHERTYPE_QINQ:
+                    ethertype, = _ETHERTYPE.unpack_from(data, offset + 2)
+                    offset += 4
+            elif self.linktype == LINKTYPE_RAW:
+                ethertype = ETHERTYPE_IPV6 if data[offset] >> 4 == 6 else ETHERTYPE_IPV4
+            else:
+                return 0
+
+            if ethertype == ETHERTYPE_IPV4:
+                version_ihl, fragment, protocol, src, dst = _IPV4_FLOW.unpack_from(data, offset)
+                value = src ^ dst
+                fragment &= 0x1fff
+                offset += (version_ihl & 0x0f) * 4
+            elif ethertype == ETHERTYPE_IPV6:
+                protocol, src_high, src_low, dst_high, dst_low = _IPV6_FLOW.unpack_from(data, offset)
+                value = src_high ^ src_low ^ dst_high ^ dst_low
+                fragment = 0
+                offset += 40
+                while protocol in IPV6_EXTENSIONS or protocol == IPV6_FRAGMENT:
+                    if protocol == IPV6_FRAGMENT:
+                        protocol, fragment = _IPV6_FRAGMENT.unpack_from(data, offset)
+                        fragment &= 0xfff8
+                        offset += 8
+                    else:
+                        protocol, length = _IPV6_EXTENSION.unpack_from(data, offset)
+                        offset += (length + 1) * 8
+            else:
+                return 0
+
+            value ^= protocol
+            if not fragment and (protocol == PROTO_TCP or protocol == PROTO_UDP):
+                sport, dport = _PORTS.unpack_from(data, offset)
+                value ^= (sport ^ dport) << 8
+        except (struct.error, IndexError):
+            return 0
+        return ((value * _MIX) & _MASK64) >> 32
+
+    def payload(self, data):
+        """Return the payload of the last decoded packet as a memoryview (no copy)"""
+        header = self.header
+        return memoryview(data)[header.payload_offset:header.payload_offset + header.payload_length]
+
+    def _decode_ipv4(self, view, offset, header):
+        """Decode an IPv4 header, returning (transport offset, end of IP packet)"""
+        (version_ihl, _, total_length, _, fragment, header.ttl, header.protocol, _,
+         header.src, header.dst) = _IPV4.unpack_from(view, offset)
+        if version_ihl >> 4 != 4:
+            raise struct.error('not an IPv4 header')
+        header.ip_version = 4
+        # Only the first fragment carries the transport header
+        header.fragment = bool(fragment & 0x1fff)
+        return offset + (version_ihl & 0x0f) * 4, offset + total_length
+
+    def _decode_ipv6(self, view, offset, header):
+        """Decode an IPv6 header and its extension headers"""
+        (version, payload_length, next_header, header.ttl,
+         src_high, src_low, dst_high, dst_low) = _IPV6.unpack_from(view, offset)
+        if version >> 28 != 6:
+            raise struct.error('not an IPv6 header')
+        header.ip_version = 6
+        header.src = src_high << 64 | src_low
+        header.dst = dst_high << 64 | dst_low
+        end = offset + 40 + payload_length
+        offset += 40
+
+        while next_header in IPV6_EXTENSIONS or next_header == IPV6_FRAGMENT:
+            if next_header == IPV6_FRAGMENT:
+                next_header, fragment = _IPV6_FRAGMENT.unpack_from(view, offset)
+                header.fragment = bool(fragment & 0xfff8)
+                offset += 8
+            else:
+                next_header, length = _IPV6_EXTENSION.unpack_from(view, offset)
+                offset += (length + 1) * 8
+        header.protocol = next_header
+        return offset, end
+
+
+def _format_address(version, address):
+    """Format an integer IP address"""
+    if version == 4:
+        return f'{address >> 24}.{address >> 16 & 0xff}.{address >> 8 & 0xff}.{address & 0xff}'
+    if version == 6:
+        import ipaddress
+        return str(ipaddress.IPv6Address(address))
+    return None
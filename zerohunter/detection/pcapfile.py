@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Capture file reader for ZeroHunter
+
+Reads classic libpcap and pcapng files without libpcap. The file is
+memory-mapped and records are located with precompiled struct.Struct
+unpackers, so replaying multi-GB captures does not go through read()
+calls per packet.
+"""
+
+import os
+import mmap
+import struct
+import logging
+
+logger = logging.getLogger('zerohunter.detection.pcapfile')
+
+PCAP_MAGIC = 0xa1b2c3d4
+PCAP_MAGIC_NS = 0xa1b23c4d
+PCAPNG_SHB = 0x0a0d0d0a
+PCAPNG_BYTE_ORDER = 0x1a2b3c4d
+
+PCAPNG_IDB = 0x00000001
+PCAPNG_PB = 0x00000002
+PCAPNG_SPB = 0x00000003
+PCAPNG_EPB = 0x00000006
+
+# if_tsresol option of the interface description block
+PCAPNG_OPT_TSRESOL = 9
+
+class PcapError(Exception):
+    """Raised for files that are not valid pcap or pcapng captures"""
+
+class PcapReader:
+    """Iterate over the packets of a pcap or pcapng file as (ts, data, linktype)"""
+
+    def __init__(self, path):
+        """Open a capture file"""
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.format = None
+        self.truncated = False
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+        except (ValueError, OSError):
+            self._file.close()
+            raise
+
+        if len(self._map) < 4:
+            self.close()
+            raise PcapError(f"{path}: file too short")
+        magics = struct.unpack_from('<I', self._map, 0) + struct.unpack_from('>I', self._map, 0)
+        if PCAPNG_SHB in magics:
+            self.format = 'pcapng'
+        elif PCAP_MAGIC in magics or PCAP_MAGIC_NS in magics:
+            self.format = 'pcap'
+        else:
+            self.close()
+            raise PcapError(f"{path}: not a pcap or pcapng file")
+
+    def __enter__(self):
+        """Enter context"""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Exit context"""
+        self.close()
+
+    def close(self):
+        """Close the file"""
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def __iter__(self):
+        """Yield (timestamp, packet bytes, link type) for every packet"""
+        if self.format == 'pcapng':
+            return self._iter_pcapng()
+        return self._iter_pcap()
+
+    @property
+    def buffer(self):
+        """The mapped file, for reading packets found by locate() in place"""
+        return self._map
+
+    def locate(self):
+        """Yield (timestamp, offset, length, link type) for every packet, without copying it"""
+        if self.format == 'pcapng':
+            return self._iter_pcapng(locate=True)
+        return self._iter_pcap(locate=True)
+
+    def packets_at(self, times, offsets, lengths, linktypes):
+        """Yield (timestamp, packet bytes, link type) for packets found by locate()"""
+        data = self._map
+        for ts, offset, length, linktype in zip(times, offsets, lengths, linktypes):
+            yield ts, data[offset:offset + length], linktype
+
+    def _iter_pcap(self, locate=False):
+        """Read a classic libpcap file"""
+        data = self._map
+        if len(data) < 24:
+            raise PcapError(f"{self.path}: truncated pcap header")
+        magic, = struct.unpack_from('<I', data, 0)
+        order = '<' if magic in (PCAP_MAGIC, PCAP_MAGIC_NS) else '>'
+        magic, _, _, _, _, _, linktype = struct.unpack_from(order + 'IHHiIII', data, 0)
+        scale = 1e-9 if magic == PCAP_MAGIC_NS else 1e-6
+        # The upper bits carry FCS information
+        linktype &= 0x0fffffff
+
+        record = struct.Struct(order + 'IIII')
+        offset = 24
+        end = len(data)
+        while offset + 16 <= end:
+            sec, frac, caplen, _ = record.unpack_from(data, offset)
+            if offset + 16 + caplen > end:
+                break
+            if locate:
+                yield sec + frac * scale, offset + 16, caplen, linktype
+            else:
+                yield sec + frac * scale, data[offset + 16:offset + 16 + caplen], linktype
+            offset += 16 + caplen
+        if offset < end:
+            self.truncated = True
+            logger.warning(f"Capture file {self.path} is truncated")
+
+    def _iter_pcapng(self, locate=False):
+        """Read a pcapng file (one or more sections)"""
+        data = self._map
+        end = len(data)
+        offset = 0
+        order = '<'
+        interfaces = []
+        block = struct.Struct('<II')
+        epb = struct.Struct('<IIIII')
+
+        while offset + 12 <= end:
+            block_type, length = block.unpack_from(data, offset)
+            if block_type == PCAPNG_SHB:
+                # Each section has its own byte order and interfaces
+                magic, = struct.unpack_from('<I', data, offset + 8)
+                order = '<' if magic == PCAPNG_BYTE_ORDER else '>'
+                block = struct.Struct(order + 'II')
+                epb = struct.Struct(order + 'IIIII')
+                block_type, length = block.unpack_from(data, offset)
+                interfaces = []
+            if length < 12 or offset + length > end:
+                self.truncated = True
+                logger.warning(f"Capture file {self.path} is truncated")
+                break
+            body = offset + 8
+            offset += length
+
+            if block_type == PCAPNG_EPB:
+                interface, high, low, caplen, _ = epb.unpack_from(data, body)
+                linktype, scale = interfaces[interface]
+                start = body + 20
+                ts = ((high << 32) | low) * scale
+            elif block_type == PCAPNG_SPB:
+                linktype, _ = interfaces[0]
+                caplen = min(struct.unpack_from(order + 'I', data, body)[0], length - 16)
+                start = body + 4
+                ts = 0.0
+            elif block_type == PCAPNG_PB:
+                interface, _, high, low, caplen, _ = struct.unpack_from(order + 'HHIIII', data, body)
+                linktype, scale = interfaces[interface]
+                start = body + 20
+                ts = ((high << 32) | low) * scale
+            else:
+                if block_type == PCAPNG_IDB:
+                    interfaces.append(self._parse_interface(data, body, offset - 4, order))
+                continue
+            if locate:
+                yield ts, start, caplen, linktype
+            else:
+                yield ts, data[start:start + caplen], linktype
+
+    def _parse_interface(self, data, offset, end, order):
+        """Return (link type, timestamp scale) of an interface description block"""
+        linktype, = struct.unpack_from(order + 'H', data, offset)
+        scale = 1e-6
+        option = offset + 8
+        while option + 4 <= end:
+            code, length = struct.unpack_from(order + 'HH', data, option)
+            if code == 0:
+                break
+            if code == PCAPNG_OPT_TSRESOL and length >= 1:
+                resolution = data[option + 4]
+                scale = 2.0 ** -(resolution & 0x7f) if resolution & 0x80 else 10.0 ** -resolution
+            option += 4 + (length + 3) // 4 * 4
+        return linktype, scale
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Network prefix index for ZeroHunter
+
+Longest-prefix matching of IPv4 and IPv6 addresses against IOC netblocks
+(CIDR prefixes and address ranges). Networks are grouped by prefix length
+into sorted arrays of network addresses: IPv4 networks as integers and
+IPv6 networks as 16-byte big-endian strings. A lookup masks the address
+to each length present, longest first, and binary-searches that length's
+array. Feeds use a few dozen distinct lengths at most. A batch of
+addresses is sorted once, and masking keeps it sorted, so every search
+over an array walks it in order.
+"""
+
+import socket
+import logging
+import ipaddress
+from bisect import bisect_left
+
+from zerohunter.core.lazy import lazy_import
+
+np = lazy_import('numpy')
+
+logger = logging.getLogger('zerohunter.detection.prefixes')
+
+_BITS = {4: 32, 6: 128}
+
+def _mask(version, length):
+    """Return the netmask of a prefix length as an integer"""
+    bits = _BITS[version]
+    return ((1 << length) - 1) << (bits - length)
+
+def parse_networks(value):
+    """Return the (version, length, network) prefixes of a CIDR, address or 'first-last' range"""
+    value = value.strip()
+    address, _, length = value.partition('/')
+    if '-' not in value:
+        # Fast path for feeds of plain CIDRs; ipaddress handles the rest
+        try:
+            version, network = parse_address(address)
+            length = int(length) if length else _BITS[version]
+            if 0 <= length <= _BITS[version]:
+                return [(version, length, network & _mask(version, length))]
+        except OSError:
+            pass
+    if '-' in value:
+        first, last = (ipaddress.ip_address(part.strip()) for part in value.split('-', 1))
+        networks = ipaddress.summarize_address_range(first, last)
+    else:
+        networks = [ipaddress.ip_network(value, strict=False)]
+    return [(network.version, network.prefixlen, int(network.network_address)) for network in networks]
+
+def parse_address(value):
+    """Return the (version, address) of an address string, integer (IPv4) or packed address"""
+    if isinstance(value, str):
+        try:
+            return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, value), 'big')
+        except OSError:
+            return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, value), 'big')
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return (4 if len(value) == 4 else 6), int.from_bytes(value, 'big')
+    return 4, int(value)
+
+def network_tables(values):
+    """Return {(version, length): sorted unique NumPy array of networks} for prefix strings"""
+    grouped = {}
+    for value in values:
+        try:
+            prefixes = parse_networks(value)
+        except ValueError as e:
+            logger.warning(f"Ignoring invalid network IOC {value!r}: {e}")
+            continue
+        for version, length, network in prefixes:
+            grouped.setdefault((version, length), []).append(network)
+    tables = {}
+    for (version, length), networks in grouped.items():
+        if version == 4:
+            array = np.array(networks, dtype=np.uint64)
+        else:
+            array = np.array([network.to_bytes(16, 'big') for network in networks], dtype='S16')
+        tables[version, length] = np.unique(array)
+    return tables
+
+class PrefixIndex:
+    """Longest-prefix-match index over IPv4 and IPv6 networks"""
+
+    def __init__(self, tables=None):
+        """Index {(version, length): sorted array} tables (see network_tables)"""
+        self.tables = {4: [], 6: []}
+        self.count = 0
+        for (version, length), networks in sorted((tables or {}).items(), key=lambda item: -item[0][1]):
+            if not len(networks):
+                continue
+            if version == 4:
+                # Single lookups bisect a memoryview, whose items are plain ints
+                networks = np.asarray(networks, dtype=np.uint64)
+                searchable = memoryview(networks)
+            else:
+                searchable = networks
+            self.tables[version].append((length, networks, searchable))
+            self.count += len(networks)
+
+    @classmethod
+    def from_networks(cls, values):
+        """Build an index from CIDR, address or range strings"""
+        return cls(network_tables(values))
+
+    def __len__(self):
+        """Return the number of indexed networks"""
+        return self.count
+
+    def lookup(self, address):
+        """Return the longest network (as a string) containing an address, or None"""
+        version, value = parse_address(address)
+        for length, networks, searchable in self.tables[version]:
+            network = value & _mask(version, length)
+            if version == 4:
+                index = bisect_left(searchable, network)
+                found = index < len(searchable) and searchable[index] == network
+            else:
+                key = network.to_bytes(16, 'big')
+                index = int(np.searchsorted(networks, key))
+                # NumPy returns the items without their trailing zero bytes
+                found = index < len(networks) and networks[index] == key.rstrip(b'\0')
+            if found:
+                return f"{ipaddress.ip_address(network)}/{length}"
+        return None
+
+    def lookup_many(self, addresses):
+        """Return the longest matching prefix length of every address (-1 for none)
+
+        addresses is a NumPy integer array of IPv4 addresses, a NumPy array
+        of packed IPv6 addresses ('S16', or uint8 with 16 columns), or a
+        sequence of address strings of either version.
+        """
+        if isinstance(addresses, np.ndarray):
+            if addresses.dtype.kind in 'iu' and addresses.ndim == 1:
+                return self._match(4, addresses.astype(np.uint64))
+            return self._match(6, self._packed(addresses))
+
+        lengths = np.full(len(addresses), -1, dtype=np.int16)
+        positions = {4: [], 6: []}
+        values = {4: [], 6: []}
+        for position, address in enumerate(addresses):
+            try:
+                version, value = parse_address(address)
+            except (OSError, ValueError, TypeError):
+                continue
+            positions[version].append(position)
+            values[version].append(value)
+        if values[4]:
+            lengths[positions[4]] = self._match(4, np.array(values[4], dtype=np.uint64))
+        if values[6]:
+            packed = np.array([value.to_bytes(16, 'big') for value in values[6]], dtype='S16')
+            lengths[positions[6]] = self._match(6, self._packed(packed))
+        return lengths
+
+    def contains_many(self, addresses):
+        """Return a boolean mask of the addresses inside any network"""
+        return self.lookup_many(addresses) >= 0
+
+    @staticmethod
+    def _packed(addresses):
+        """Return IPv6 addresses as a contiguous (n, 16) uint8 array"""
+        return np.ascontiguousarray(addresses).view(np.uint8).reshape(-1, 16)
+
+    def _match(self, version, keys):
+        """Return the longest matching prefix length of every key (uint64 or (n, 16) uint8)"""
+        lengths = np.full(len(keys), -1, dtype=np.int16)
+        if not self.tables[version] or not len(keys):
+            return lengths
+        if version == 4:
+            order = np.argsort(keys)
+        else:
+            order = np.argsort(keys.view('S16').ravel())
+        # Addresses still unmatched, in sorted order; each mask keeps them sorted
+        pending = keys[order]
+        for length, networks, _ in self.tables[version]:
+            if version == 4:
+                masked = pending & np.uint64(_mask(4, length))
+            else:
+                netmask = np.frombuffer(_mask(6, length).to_bytes(16, 'big'), dtype=np.uint8)
+                masked = (pending & netmask).view('S16').ravel()
+            index = np.searchsorted(networks, masked)
+            index[index == len(networks)] = 0
+            found = networks[index] == masked
+            if found.any():
+                lengths[order[found]] = length
+                order = order[~found]
+                pending = pending[~found]
+                if not len(order):
+                    break
+        return lengths
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Stream protocol analyzers for ZeroHunter
+
+Incremental parsers for reassembled TCP streams (see reassembly.py). They
+receive the bytes of each direction as they become available and report
+protocol events (HTTP requests and responses, SMTP envelopes, FTP
+commands) to a callback. Partial lines are buffered up to max_line bytes.
+"""
+
+import logging
+
+from zerohunter.detection.reassembly import CLIENT, SERVER
+
+logger = logging.getLogger('zerohunter.detection.protocols')
+
+class StreamAnalyzer:
+    """Base class for analyzers of one reassembled TCP stream"""
+
+    protocol = None
+
+    def __init__(self, stream, emit, max_line=8192):
+        """Initialize stream analyzer"""
+        self.stream = stream
+        self.emit = emit
+        self.max_line = max_line
+
+    def feed(self, direction, data):
+        """Consume the next bytes of a direction (CLIENT or SERVER)"""
+
+    def gap(self, direction):
+        """Note that bytes are missing before the next data of a direction"""
+
+    def close(self):
+        """Finish the stream"""
+
+    def event(self, **fields):
+        """Report a protocol event for this stream"""
+        stream = self.stream
+        fields.update(protocol=self.protocol, ts=stream.last_seen, client=stream.client,
+                      client_port=stream.client_port, server=stream.server,
+                      server_port=stream.server_port)
+        self.emit(fields)
+
+class LineAnalyzer(StreamAnalyzer):
+    """Stream analyzer for line-based protocols"""
+
+    def __init__(self, stream, emit, max_line=8192):
+        """Initialize line analyzer"""
+        super().__init__(stream, emit, max_line)
+        self.buffers = [bytearray(), bytearray()]
+        self.skip = [0, 0]
+
+    def feed(self, direction, data):
+        """Split the data into lines"""
+        buffer = self.buffers[direction]
+        if self.skip[direction]:
+            # Bytes the protocol declared as a body
+            skipped = min(self.skip[direction], len(data))
+            self.skip[direction] -= skipped
+            data = data[skipped:]
+        buffer += data
+
+        start = 0
+        while True:
+            end = buffer.find(b'\n', start)
+            if end < 0:
+                break
+            line = bytes(buffer[start:end]).rstrip(b'\r')
+            start = end + 1
+            self.line(direction, line)
+            if self.skip[direction]:
+                skipped = min(self.skip[direction], len(buffer) - start)
+                self.skip[direction] -= skipped
+                start += skipped
+        del buffer[:start]
+        if len(buffer) > self.max_line:
+            # Not a line-based exchange any more (binary or attack payload)
+            self.line(direction, bytes(buffer[:self.max_line]))
+            buffer.clear()
+
+    def gap(self, direction):
+        """Drop the partial line before the gap"""
+        self.buffers[direction].clear()
+        self.skip[direction] = 0
+
+    def line(self, direction, line):
+        """Handle one line"""
+
+class HttpAnalyzer(LineAnalyzer):
+    """HTTP/1.x requests and responses"""
+
+    protocol = 'http'
+    # Headers included in the events
+    HEADERS = ('host', 'user-agent', 'content-type', 'content-length', 'server', 'location')
+
+    def __init__(self, stream, emit, max_line=8192):
+        """Initialize HTTP analyzer"""
+        super().__init__(stream, emit, max_line)
+        self.messages = [None, None]
+
+    def line(self, direction, line):
+        """Parse start lines and headers, skipping bodies"""
+        message = self.messages[direction]
+        if message is None:
+            parts = line.decode('latin-1').split(' ', 2)
+            if direction == CLIENT and len(parts) == 3 and parts[2].startswith('HTTP/'):
+                self.messages[direction] = {'method': parts[0], 'uri': parts[1], 'version': parts[2],
+                                            'headers': {}}
+            elif direction == SERVER and len(parts) >= 2 and parts[0].startswith('HTTP/'):
+                self.messages[direction] = {'version': parts[0], 'status': parts[1], 'headers': {}}
+            elif line:
+                self.event(type='malformed', direction=direction, line=line[:256])
+            return
+
+        if line:
+            name, _, value = line.decode('latin-1').partition(':')
+            message['headers'][name.strip().lower()] = value.strip()
+            return
+
+        # End of headers
+        self.messages[direction] = None
+        headers = message['headers']
+        message['headers'] = {key: headers[key] for key in self.HEADERS if key in headers}
+        self.event(type='request' if direction == CLIENT else 'response', **message)
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            # Chunked bodies end the header parsing for this direction
+            self.skip[direction] = self.max_line * 1024
+        else:
+            try:
+                self.skip[direction] = max(int(headers.get('content-length', 0)), 0)
+            except ValueError:
+                pass
+
+class SmtpAnalyzer(LineAnalyzer):
+    """SMTP envelopes and authentication"""
+
+    protocol = 'smtp'
+    COMMANDS = ('HELO', 'EHLO', 'MAIL', 'RCPT', 'AUTH', 'STARTTLS')
+
+    def __init__(self, stream, emit, max_line=8192):
+        """Initialize SMTP analyzer"""
+        super().__init__(stream, emit, max_line)
+        self.in_data = False
+
+    def line(self, direction, line):
+        """Report client commands, skipping message contents"""
+        if direction != CLIENT:
+            return
+        if self.in_data:
+            self.in_data = line != b'.'
+            return
+        command, _, argument = line.decode('latin-1').partition(' ')
+        command = command.upper()
+        if command == 'DATA':
+            self.in_data = True
+        elif command in self.COMMANDS:
+            if command == 'AUTH':
+                # Keep the mechanism, not the credentials
+                argument = argument.split(' ', 1)[0]
+            self.event(type='command', command=command, argument=argument)
+
+class FtpAnalyzer(LineAnalyzer):
+    """FTP control connection commands"""
+
+    protocol = 'ftp'
+    COMMANDS = ('USER', 'RETR', 'STOR', 'DELE', 'MKD', 'RMD', 'SITE', 'PORT', 'EPRT', 'PASV', 'EPSV')
+
+    def line(self, direction, line):
+        """Report client commands"""
+        if direction != CLIENT:
+            return
+        command, _, argument = line.decode('latin-1').partition(' ')
+        command = command.upper()
+        if command == 'PASS':
+            self.event(type='command', command=command, argument='')
+        elif command in self.COMMANDS:
+            self.event(type='command', command=command, argument=argument)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TCP stream reassembly for ZeroHunter
+
+Rebuilds the byte streams of TCP connections from decoded packets and
+hands them to protocol analyzers incrementally. Out-of-order segments are
+buffered until the gap before them is filled, overlaps keep the bytes
+that arrived first, and only the first depth bytes of each direction are
+reassembled. Memory is bounded by a per-stream cap on buffered segments,
+a global cap on all buffered segments and a cap on the number of streams;
+least recently seen streams are evicted first.
+"""
+
+import logging
+from collections import OrderedDict
+
+from zerohunter.detection.flows import flow_key
+from zerohunter.detection.packet import TCP_SYN, TCP_FIN, TCP_RST
+
+logger = logging.getLogger('zerohunter.detection.reassembly')
+
+CLIENT = 0
+SERVER = 1
+
+def _seq_diff(a, b):
+    """Return a - b in TCP sequence space, as a signed 32-bit value"""
+    diff = (a - b) & 0xffffffff
+    return diff - 0x100000000 if diff & 0x80000000 else diff
+
+class StreamDirection:
+    """Reassembly state of one direction of a TCP stream"""
+
+    __slots__ = ('next_seq', 'pending', 'pending_bytes', 'delivered', 'truncated', 'finished')
+
+    def __init__(self):
+        """Initialize stream direction"""
+        self.next_seq = None
+        self.pending = {}
+        self.pending_bytes = 0
+        self.delivered = 0
+        self.truncated = False
+        self.finished = False
+
+class TcpStream:
+    """A TCP connection being reassembled; directions are indexed by CLIENT and SERVER"""
+
+    __slots__ = ('key', 'client', 'client_port', 'server', 'server_port', 'directions',
+                 'analyzer', 'first_seen', 'last_seen', 'gaps')
+
+    def __init__(self, key, header, server_is_dst):
+        """Initialize stream from its first packet"""
+        self.key = key
+        if server_is_dst:
+            self.client, self.client_port = header.src, header.sport
+            self.server, self.server_port = header.dst, header.dport
+        else:
+            self.client, self.client_port = header.dst, header.dport
+            self.server, self.server_port = header.src, header.sport
+        self.directions = (StreamDirection(), StreamDirection())
+        self.analyzer = None
+        self.first_seen = header.ts
+        self.last_seen = header.ts
+        self.gaps = 0
+
+class Reassembler:
+    """Reassembles TCP streams to the server ports that have a protocol analyzer"""
+
+    def __init__(self, analyzers, depth=64 * 1024, max_streams=50000, max_pending=256 * 1024,
+                 max_memory=128 * 1024 * 1024, window=1024 * 1024, idle_timeout=120.0):
+        """Initialize reassembler; analyzers maps server ports to analyzer factories"""
+        self.analyzers = analyzers
+        self.depth = depth
+        self.max_streams = max_streams
+        self.max_pending = max_pending
+        self.max_memory = max_memory
+        self.window = window
+        self.idle_timeout = idle_timeout
+
+        # Least recently seen streams first
+        self.streams = OrderedDict()
+        self.memory = 0
+        self.counts = {'streams': 0, 'evicted': 0, 'expired': 0, 'gaps': 0, 'dropped_segments': 0,
+                       'truncated': 0}
+
+    def __len__(self):
+        """Return the number of open streams"""
+        return len(self.streams)
+
+    def process(self, header, payload):
+        """Feed a decoded TCP segment and its payload (a memoryview) to its stream"""
+        key = flow_key(header)
+        flags = header.tcp_flags
+        stream = self.streams.get(key)
+        if stream is None:
+            if flags & TCP_RST:
+                return
+            stream = self._open(key, header)
+            if stream is None:
+                return
+        else:
+            self.streams.move_to_end(key)
+        stream.last_seen = header.ts
+
+        index = CLIENT if header.src == stream.client and header.sport == stream.client_port else SERVER
+        direction = stream.directions[index]
+        seq = header.seq
+        if flags & TCP_SYN:
+            direction.next_seq = (seq + 1) & 0xffffffff
+            seq = direction.next_seq
+        elif direction.next_seq is None:
+            # Picked up mid-stream
+            direction.next_seq = seq
+
+        if len(payload) and not direction.truncated:
+            self._segment(stream, index, direction, seq, payload)
+
+        if flags & TCP_FIN:
+            direction.finished = True
+        if flags & TCP_RST or all(d.finished for d in stream.directions):
+            self._close(stream)
+
+    def expire(self, now):
+        """Close the streams idle for longer than the idle timeout"""
+        while self.streams:
+            stream = next(iter(self.streams.values()))
+            if now - stream.last_seen <= self.idle_timeout:
+                break
+            self.counts['expired'] += 1
+            self._close(stream)
+
+    def flush(self):
+        """Close every open stream"""
+        while self.streams:
+            self._close(next(iter(self.streams.values())))
+
+    def _open(self, key, header):
+        """Start reassembling a stream if one of its ports has an analyzer"""
+        factory = self.analyzers.get(header.dport)
+        server_is_dst = factory is not None
+        if factory is None:
+            factory = self.analyzers.get(header.sport)
+            if factory is None:
+                return None
+
+        while len(self.streams) >= self.max_streams:
+            self.counts['evicted'] += 1
+            self._close(next(iter(self.streams.values())))
+        stream = self.streams[key] = TcpStream(key, header, server_is_dst)
+        stream.analyzer = factory(stream)
+        self.counts['streams'] += 1
+        return stream
+
+    def _segment(self, stream, index, direction, seq, payload):
+        """Deliver an in-order segment or buffer an out-of-order one"""
+        offset = _seq_diff(seq, direction.next_seq)
+        if offset <= 0:
+            # Retransmissions and overlaps keep the bytes delivered first
+            if -offset >= len(payload):
+                return
+            self._deliver(stream, index, direction, payload[-offset:])
+            self._drain(stream, index, direction)
+            return
+
+        if offset > self.window or seq in direction.pending:
+            self.counts['dropped_segments'] += 1
+            return
+        size = len(payload)
+        if direction.pending_bytes + size > self.max_pending:
+            if not direction.pending:
+                self.counts['dropped_segments'] += 1
+                return
+            # The missing segment is not coming back in time; continue after the gap
+            self._skip_gap(stream, index, direction)
+            if direction.truncated:
+                return
+            self._segment(stream, index, direction, seq, payload)
+            return
+        if not self._reserve(stream, size):
+            self.counts['dropped_segments'] += 1
+            return
+        direction.pending[seq] = bytes(payload)
+        direction.pending_bytes += size
+
+    def _drain(self, stream, index, direction):
+        """Deliver buffered segments that became contiguous"""
+        while direction.pending and not direction.truncated:
+            for seq in direction.pending:
+                if _seq_diff(seq, direction.next_seq) <= 0:
+                    break
+            else:
+                return
+            chunk = direction.pending.pop(seq)
+            self._release(direction, len(chunk))
+            overlap = _seq_diff(direction.next_seq, seq)
+            if overlap < len(chunk):
+                self._deliver(stream, index, direction, memoryview(chunk)[overlap:])
+
+    def _skip_gap(self, stream, index, direction):
+        """Give up on missing data and continue at the earliest buffered segment"""
+        if not direction.pending:
+            return
+        direction.next_seq = min(direction.pending, key=lambda seq: _seq_diff(seq, direction.next_seq))
+        stream.gaps += 1
+        self.counts['gaps'] += 1
+        stream.analyzer.gap(index)
+        self._drain(stream, index, direction)
+
+    def _deliver(self, stream, index, direction, data):
+        """Hand contiguous bytes to the stream's analyzer, up to the depth"""
+        direction.next_seq = (direction.next_seq + len(data)) & 0xffffffff
+        room = self.depth - direction.delivered
+        if len(data) >= room:
+            data = data[:room]
+            direction.truncated = True
+            self.counts['truncated'] += 1
+            for chunk in direction.pending.values():
+                self._release(direction, len(chunk))
+            direction.pending = {}
+        direction.delivered += len(data)
+        if len(data):
+            try:
+                stream.analyzer.feed(index, bytes(data))
+            except Exception as e:
+                logger.error(f"Error in stream analyzer: {e}")
+
+    def _reserve(self, stream, size):
+        """Account buffered bytes, evicting other streams when over the global cap"""
+        while self.memory + size > self.max_memory:
+            oldest = next(iter(self.streams.values()))
+            if oldest is stream:
+                return False
+            self.counts['evicted'] += 1
+            self._close(oldest)
+        self.memory += size
+        return True
+
+    def _release(self, direction, size):
+        """Return buffered bytes"""
+        direction.pending_bytes -= size
+        self.memory -= size
+
+    def _close(self, stream):
+        """Stop reassembling a stream and free its buffers"""
+        if self.streams.pop(stream.key, None) is None:
+            return
+        for direction in stream.directions:
+            self.memory -= direction.pending_bytes
+            direction.pending = {}
+            direction.pending_bytes = 0
+        try:
+            stream.analyzer.close()
+        except Exception as e:
+            logger.error(f"Error closing stream analyzer: {e}")
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Packet ring buffer for ZeroHunter
+
+A preallocated single-producer/single-consumer ring of fixed-size packet
+slots. The capture thread copies packets in and never blocks: when the
+ring is full the packet is dropped and counted. The consumer (an analysis
+thread, or a forked analysis process sharing the anonymous mapping) reads
+packets in place and sleeps on a pipe while the ring is empty.
+
+The head and tail counters live in the mapping and are each written by
+one side only, so no lock is needed.
+"""
+
+import os
+import mmap
+import struct
+import select
+
+# Control block: head at 0, tail at 64 and flags at 128, on separate cache lines;
+# the counters are indexes into the block viewed as 64-bit words
+_HEAD = 0
+_TAIL = 8
+_WAITING = 128
+_CLOSED = 129
+_CONTROL_SIZE = 192
+
+_SLOT = struct.Struct('dIHBx')
+
+class PacketRing:
+    """Fixed-capacity ring of packets shared between one producer and one consumer"""
+
+    def __init__(self, slots=16384, slot_size=2048):
+        """Allocate the ring"""
+        self.slots = slots
+        self.slot_size = slot_size
+        self.stride = _SLOT.size + slot_size
+        # An anonymous shared mapping is inherited by forked consumers
+        self.buffer = mmap.mmap(-1, _CONTROL_SIZE + slots * self.stride)
+        self.view = memoryview(self.buffer)
+        # Aligned single-word stores, so the other side never sees a torn
+        # counter (struct.pack_into clears the field before writing it)
+        self.counters = self.view[:_CONTROL_SIZE].cast('Q')
+        self.wake_read, self.wake_write = os.pipe()
+        os.set_blocking(self.wake_write, False)
+
+        # Producer-side state and counters
+        self.head = 0
+        self.pushed = 0
+        self.dropped = 0
+        self.truncated = 0
+
+    def push(self, ts, data, interface=0, flags=0):
+        """Copy a packet into the ring; returns False if it was dropped because the ring is full"""
+        buffer = self.buffer
+        head = self.head
+        if head - self.counters[_TAIL] >= self.slots:
+            self.dropped += 1
+            return False
+
+        length = len(data)
+        if length > self.slot_size:
+            length = self.slot_size
+            self.truncated += 1
+        offset = _CONTROL_SIZE + (head % self.slots) * self.stride
+        _SLOT.pack_into(buffer, offset, ts, length, interface, flags)
+        offset += _SLOT.size
+        self.view[offset:offset + length] = data[:length]
+
+        # Publish the slot, then wake the consumer if it went to sleep
+        self.head = head + 1
+        self.counters[_HEAD] = self.head
+        self.pushed += 1
+        if buffer[_WAITING]:
+            buffer[_WAITING] = 0
+            self._wake()
+        return True
+
+    def pop_batch(self, handler, limit=1000):
+        """Call handler(ts, data, interface, flags) for up to limit packets, returning how many
+
+        data is a memoryview of the slot and is only valid during the call.
+        """
+        buffer = self.buffer
+        view = self.view
+        counters = self.counters
+        tail = counters[_TAIL]
+        available = min(counters[_HEAD] - tail, limit)
+        for _ in range(available):
+            offset = _CONTROL_SIZE + (tail % self.slots) * self.stride
+            ts, length, interface, flags = _SLOT.unpack_from(buffer, offset)
+            offset += _SLOT.size
+            handler(ts, view[offset:offset + length], interface, flags)
+            tail += 1
+            # Free the slot only after the handler is done with it
+            counters[_TAIL] = tail
+        return available
+
+    def wait(self, timeout):
+        """Sleep until the producer publishes a packet, the ring is closed or timeout passes"""
+        buffer = self.buffer
+        buffer[_WAITING] = 1
+        # Re-check after announcing the wait, or a push in between would go unnoticed
+        if self.counters[_HEAD] != self.counters[_TAIL] or self.closed:
+            buffer[_WAITING] = 0
+            return
+        ready, _, _ = select.select([self.wake_read], [], [], timeout)
+        if ready:
+            os.read(self.wake_read, 4096)
+
+    def __len__(self):
+        """Return the number of packets waiting in the ring"""
+        return self.counters[_HEAD] - self.counters[_TAIL]
+
+    @property
+    def closed(self):
+        """Whether the producer has finished"""
+        return bool(self.buffer[_CLOSED])
+
+    def close(self):
+        """Tell the consumer that no more packets will come"""
+        self.buffer[_CLOSED] = 1
+        self._wake()
+
+    def release(self):
+        """Free the ring's memory and descriptors once both sides are done"""
+        self.counters.release()
+        self.view.release()
+        self.buffer.close()
+        os.close(self.wake_read)
+        os.close(self.wake_write)
+
+    def stats(self):
+        """Return the producer-side counters and the consumer's progress"""
+        return {'pushed': self.pushed, 'dropped': self.dropped, 'truncated': self.truncated,
+                'queued': len(self), 'consumed': self.counters[_TAIL]}
+
+    def _wake(self):
+        """Wake a sleeping consumer"""
+        try:
+            os.write(self.wake_write, b'\0')
+        except BlockingIOError:
+            # The pipe is full of wakeups already
+            pass
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Persistent scan cache for ZeroHunter
+
+Remembers the findings of every scanned file so that later scans only
+have to look at files that changed. Entries are keyed by file metadata
+(device, inode, size, mtime) and by content hash, and are tied to the
+version of the rule set that produced them.
+"""
+
+import os
+import json
+import sqlite3
+import logging
+
+logger = logging.getLogger('zerohunter.detection.scan_cache')
+
+def _encode(value):
+    """Tag the bytes and tuples in findings, which JSON cannot tell from str and list"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {'__bytes__': bytes(value).hex()}
+    if isinstance(value, tuple):
+        return {'__tuple__': [_encode(item) for item in value]}
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    return value
+
+def _decode_object(value):
+    """Restore the bytes and tuples tagged by _encode"""
+    if len(value) == 1:
+        if '__bytes__' in value:
+            return bytes.fromhex(value['__bytes__'])
+        if '__tuple__' in value:
+            return tuple(value['__tuple__'])
+    return value
+
+def _load_findings(text, path):
+    """Decode stored findings, reported for path"""
+    findings = json.loads(text, object_hook=_decode_object)
+    # Contents are shared by every file with the same hash
+    for finding in findings:
+        if 'file' in finding:
+            finding['file'] = path
+    return findings
+
+class ScanCache:
+    """On-disk index of previous file scan results"""
+
+    def __init__(self, path):
+        """Initialize scan cache"""
+        self.path = path
+        self.version = None
+        self._conn = None
+        self._pid = None
+
+        # Create cache directory if it doesn't exist
+        cache_dir = os.path.dirname(path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _connection(self):
+        """Return the SQLite connection for the current process"""
+        # Connections must not be shared with forked scan workers
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=60.0)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS files ('
+                'path TEXT PRIMARY KEY, device INTEGER, inode INTEGER, size INTEGER, '
+                'mtime_ns INTEGER, sha256 TEXT, version TEXT)'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS contents ('
+                'sha256 TEXT PRIMARY KEY, version TEXT, findings TEXT)'
+            )
+            # Finds the other files that share a content row
+            self._conn.execute('CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256)')
+            self._pid = os.getpid()
+        return self._conn
+
+    def set_version(self, version):
+        """Set the rule set version, dropping entries from other versions"""
+        if version == self.version:
+            return
+
+        self.version = version
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute('DELETE FROM files WHERE version != ?', (version,))
+                conn.execute('DELETE FROM contents WHERE version != ?', (version,))
+                # Contents of files that changed or were rescanned under another name
+                conn.execute('DELETE FROM contents WHERE NOT EXISTS '
+                             '(SELECT 1 FROM files WHERE files.sha256 = contents.sha256)')
+        except sqlite3.Error as e:
+            logger.error(f"Error invalidating scan cache {self.path}: {e}")
+
+    def lookup(self, path, stat):
+        """Return cached findings for an unchanged file, or None"""
+        try:
+            row = self._connection().execute(
+                'SELECT f.device, f.inode, f.size, f.mtime_ns, c.findings FROM files f '
+                'JOIN contents c ON c.sha256 = f.sha256 '
+                'WHERE f.path = ? AND f.version = ? AND c.version = ?',
+                (path, self.version, self.version)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Error reading scan cache {self.path}: {e}")
+            return None
+
+        if row is None or tuple(row[:4]) != self._stat_key(stat):
+            return None
+        return _load_findings(row[4], path)
+
+    def lookup_content(self, path, sha256):
+        """Return cached findings for identical content seen before, or None"""
+        try:
+            row = self._connection().execute(
+                'SELECT findings FROM contents WHERE sha256 = ? AND version = ?',
+                (sha256, self.version)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Error reading scan cache {self.path}: {e}")
+            return None
+
+        if row is None:
+            return None
+        return _load_findings(row[0], path)
+
+    def store(self, path, stat, sha256, findings):
+        """Record the findings for a scanned file"""
+        try:
+            conn = self._connection()
+            previous = conn.execute('SELECT sha256 FROM files WHERE path = ?', (path,)).fetchone()
+            conn.execute(
+                'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (path,) + self._stat_key(stat) + (sha256, self.version)
+            )
+            conn.execute(
+                'INSERT OR REPLACE INTO contents VALUES (?, ?, ?)',
+                (sha256, self.version, json.dumps(_encode(findings), default=str))
+            )
+            # The file's old content goes unless another file still has it
+            if previous is not None and previous[0] != sha256:
+                conn.execute(
+                    'DELETE FROM contents WHERE sha256 = ? AND NOT EXISTS '
+                    '(SELECT 1 FROM files WHERE sha256 = ?)',
+                    (previous[0], previous[0])
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Error writing scan cache {self.path}: {e}")
+
+    def remove_missing(self, directory, paths):
+        """Forget the files below a directory that are not among the paths of a complete walk"""
+        prefix = os.path.join(directory, '')
+        try:
+            conn = self._connection()
+            rows = conn.execute('SELECT path FROM files WHERE substr(path, 1, ?) = ?',
+                                (len(prefix), prefix)).fetchall()
+            missing = [(path,) for path, in rows if path not in paths]
+            if not missing:
+                return
+            with conn:
+                conn.executemany('DELETE FROM files WHERE path = ?', missing)
+                conn.execute('DELETE FROM contents WHERE NOT EXISTS '
+                             '(SELECT 1 FROM files WHERE files.sha256 = contents.sha256)')
+            logger.debug(f"Removed {len(missing)} deleted files from scan cache {self.path}")
+        except sqlite3.Error as e:
+            logger.error(f"Error pruning scan cache {self.path}: {e}")
+
+    def commit(self):
+        """Flush pending cache writes to disk"""
+        if self._conn is None or self._pid != os.getpid():
+            return
+        try:
+            self._conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error committing scan cache {self.path}: {e}")
+
+    def _stat_key(self, stat):
+        """Return the metadata used to detect file changes"""
+        return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
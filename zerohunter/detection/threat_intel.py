@@ -7,11 +7,21 @@ Threat intelligence module for ZeroHunter
 
 import os
 import time
+import hashlib
 import logging
-import threading
-import requests
 import json
-import yara
+
+from zerohunter.core.lazy import lazy_import
+from zerohunter.core.scheduler import create_scheduler, PRIORITY_LOW
+from zerohunter.detection.domains import domain_keys, normalize_domain
+from zerohunter.detection.feeds import FeedManager
+from zerohunter.detection.ioc_store import (DOMAIN_TYPE, NETWORK_TYPE, IocStore, IocStoreError,
+                                            apply_changes, build_store, ioc_hash, store_sections)
+from zerohunter.detection.prefixes import PrefixIndex
+from zerohunter.detection.yara_rules import YaraRuleset
+
+np = lazy_import('numpy')
+yara = lazy_import('yara')
 
 logger = logging.getLogger('zerohunter.detection.threat_intel')
 
@@ -22,17 +32,48 @@ class ThreatIntelligence:
         """Initialize threat intelligence module"""
         self.config = config
         self.running = False
-        self.thread = None
+        self.scheduler = None
+        self.owns_scheduler = False
         self.update_interval = config.get('threat_intelligence.update_interval', 24) * 3600  # Convert to seconds
         self.sources = config.get('threat_intelligence.sources', [])
-        self.last_update = 0
+        # False-positive rate of the Bloom filters that screen batched lookups (0 disables them)
+        self.bloom_fp_rate = config.get('threat_intelligence.bloom_fp_rate', 0.01)
+        # Whether listed domains also match the names below them
+        self.domain_subdomains = config.get('threat_intelligence.domain_subdomains', True)
+        # Indicators live in a memory-mapped store; these sets hold the ones
+        # added since it was last written
         self.iocs = {
             'ip': set(),
             'domain': set(),
             'url': set(),
             'file_hash': set(),
+            # CIDR prefixes and 'first-last' address ranges, matched by longest prefix
+            NETWORK_TYPE: set(),
         }
-        self.yara_rules = {}
+        self.ioc_store = None
+        self.data_dir = os.path.expanduser('~/.zerohunter/data/threat_intel')
+        self.store_file = os.path.join(self.data_dir, 'iocs.store')
+        # Feeds are fetched concurrently and only their changes reach the store
+        self.feeds = FeedManager(
+            self.sources, os.path.join(self.data_dir, 'feeds'),
+            workers=config.get('threat_intelligence.feed_workers', 4),
+            timeout=config.get('threat_intelligence.feed_timeout', 60.0),
+            max_size=config.get('threat_intelligence.feed_max_size', 512 * 1024 * 1024),
+        )
+        self.last_update = self.feeds.last_fetch
+        # All rule files compiled into one ruleset, cached under data_dir/yara_cache
+        self.yara_ruleset = YaraRuleset(os.path.join(self.data_dir, 'yara'),
+                                        os.path.join(self.data_dir, 'yara_cache'),
+                                        on_swap=self._rules_changed)
+        self.ruleset_version = None
+        # Per-file YARA limits; files above scan.max_map_size are matched in windows
+        self.yara_timeout = config.get('threat_intelligence.yara_timeout', 60)
+        self.yara_max_scan_size = config.get('threat_intelligence.yara_max_scan_size', 0)
+        self.yara_chunk_size = config.get('threat_intelligence.yara_chunk_size', 64 * 1024 * 1024)
+        self.yara_chunk_overlap = config.get('threat_intelligence.yara_chunk_overlap', 1024 * 1024)
+        self.max_map_size = config.get('scan.max_map_size', 2 * 1024 * 1024 * 1024)
+        # Set by the detection engine
+        self.governor = None
         
         # Initialize threat intelligence
         self._init_threat_intel()
@@ -42,52 +83,86 @@ class ThreatIntelligence:
     def _init_threat_intel(self):
         """Initialize threat intelligence data"""
         # Create data directory if it doesn't exist
-        data_dir = os.path.expanduser('~/.zerohunter/data/threat_intel')
+        data_dir = self.data_dir
         if not os.path.exists(data_dir):
             os.makedirs(data_dir)
             
-        # Load existing data if available
+        # IOC lists in the JSON format are converted to a store once, or
+        # again when the JSON file is rewritten by other tools
         iocs_file = os.path.join(data_dir, 'iocs.json')
-        if os.path.exists(iocs_file):
-            try:
-                with open(iocs_file, 'r') as f:
-                    data = json.load(f)
-                    self.iocs = {k: set(v) for k, v in data.items()}
-                    self.last_update = os.path.getmtime(iocs_file)
-                    logger.info(f"Loaded {sum(len(v) for v in self.iocs.values())} IOCs from {iocs_file}")
-            except Exception as e:
-                logger.error(f"Error loading IOCs from {iocs_file}: {e}")
+        if os.path.exists(iocs_file) and (not os.path.exists(self.store_file) or
+                                          os.path.getmtime(iocs_file) > os.path.getmtime(self.store_file)):
+            self._import_json(iocs_file)
+            
+        # Load existing data if available
+        if os.path.exists(self.store_file):
+            self._open_store()
                 
         # Load YARA rules if available
-        yara_dir = os.path.join(data_dir, 'yara')
-        if os.path.exists(yara_dir):
+        if os.path.exists(self.yara_ruleset.rules_dir):
             try:
-                for root, _, files in os.walk(yara_dir):
-                    for file in files:
-                        if file.endswith('.yar') or file.endswith('.yara'):
-                            rule_path = os.path.join(root, file)
-                            try:
-                                self.yara_rules[file] = yara.compile(rule_path)
-                                logger.info(f"Loaded YARA rules from {rule_path}")
-                            except Exception as e:
-                                logger.error(f"Error compiling YARA rules from {rule_path}: {e}")
+                self.yara_ruleset.load()
             except Exception as e:
                 logger.error(f"Error loading YARA rules: {e}")
                 
-        # Update if needed
-        if time.time() - self.last_update > self.update_interval:
-            self.update()
+        self.ruleset_version = self._compute_ruleset_version()
+                
+        # Feeds are fetched by the monitor task once the module is started
+        if self.ioc_store is None:
+            self.update(fetch=False)
+            
+    def _import_json(self, iocs_file):
+        """Convert an IOC list in the JSON format to the store"""
+        try:
+            with open(iocs_file, 'r') as f:
+                data = json.load(f)
+            base = IocStore(self.store_file, fp_rate=0) if os.path.exists(self.store_file) else None
+            count = build_store(self.store_file, data, base=base)
+            logger.info(f"Converted {count} IOCs from {iocs_file} to {self.store_file}")
+        except Exception as e:
+            logger.error(f"Error converting IOCs from {iocs_file}: {e}")
+    
+    def _open_store(self):
+        """Map the IOC store, replacing the previous mapping"""
+        try:
+            # Lookups still running on the old mapping keep it alive until they finish
+            self.ioc_store = IocStore(self.store_file, self.bloom_fp_rate)
+            logger.info(f"Loaded {len(self.ioc_store)} IOCs from {self.store_file}")
+        except (OSError, IocStoreError) as e:
+            logger.error(f"Error loading IOCs from {self.store_file}: {e}")
+    
+    def _compute_ruleset_version(self):
+        """Compute a digest of the loaded IOCs and YARA rules"""
+        # Scan results cached under an older digest are discarded
+        digest = hashlib.sha256()
+        if self.ioc_store is not None:
+            digest.update(f"store:{self.ioc_store.digest}\n".encode())
+        for ioc_type in sorted(self.iocs):
+            digest.update(f"{ioc_type}:{len(self.iocs[ioc_type])}\n".encode())
+            for value in sorted(self.iocs[ioc_type]):
+                digest.update(value.encode('utf-8', 'surrogateescape') + b'\n')
+        # The ruleset digest covers the rule sources it was compiled from
+        digest.update(f"yara:{self.yara_ruleset.digest}\n".encode())
+        return digest.hexdigest()
+    
+    def _rules_changed(self):
+        """Pick up a YARA ruleset compiled in the background"""
+        self.ruleset_version = self._compute_ruleset_version()
         
-    def start(self):
+    def start(self, scheduler=None):
         """Start threat intelligence module"""
         if self.running:
             logger.warning("Threat intelligence module already running")
             return
             
         self.running = True
-        self.thread = threading.Thread(target=self._monitor_loop)
-        self.thread.daemon = True
-        self.thread.start()
+        self.owns_scheduler = scheduler is None
+        self.scheduler = scheduler or create_scheduler(self.config)
+        self.scheduler.add_periodic('threat_intel.update', self._monitor,
+                                    self.config.get('scheduler.threat_intel_interval', 60.0),
+                                    priority=PRIORITY_LOW)
+        if self.owns_scheduler:
+            self.scheduler.start()
         logger.info("Threat intelligence module started")
         
     def stop(self):
@@ -97,71 +172,239 @@ class ThreatIntelligence:
             return
             
         self.running = False
-        if self.thread:
-            self.thread.join(timeout=5.0)
+        self.scheduler.remove('threat_intel.update')
+        self.feeds.close()
+        if self.owns_scheduler:
+            self.scheduler.stop()
+        self.scheduler = None
         logger.info("Threat intelligence module stopped")
         
-    def _monitor_loop(self):
-        """Main monitoring loop"""
-        while self.running:
-            try:
-                # Check if update is needed
-                if time.time() - self.last_update > self.update_interval:
-                    self.update()
-                    
-                # Sleep for a bit
-                time.sleep(60.0)
-            except Exception as e:
-                logger.error(f"Error in threat intelligence monitoring loop: {e}")
+    def _monitor(self):
+        """Update threat intelligence data when it is out of date"""
+        if time.time() - self.last_update > self.update_interval:
+            self.update()
+        if os.path.exists(self.yara_ruleset.rules_dir):
+            self.yara_ruleset.refresh()
                 
-    def update(self):
-        """Update threat intelligence data"""
+    def update(self, fetch=True):
+        """Fetch the threat feeds and apply their changes and the pending indicators to the store"""
         logger.info("Updating threat intelligence data")
-        
-        # This is a placeholder for actual implementation
-        # In a real implementation, this would fetch data from threat intelligence sources
-        
-        self.last_update = time.time()
-        
-        # Save updated data
-        data_dir = os.path.expanduser('~/.zerohunter/data/threat_intel')
-        iocs_file = os.path.join(data_dir, 'iocs.json')
+        pending = {ioc_type: set(values) for ioc_type, values in self.iocs.items()}
+        local = store_sections({ioc_type: values for ioc_type, values in pending.items() if values})
         try:
-            with open(iocs_file, 'w') as f:
-                json.dump({k: list(v) for k, v in self.iocs.items()}, f)
-            logger.info(f"Saved {sum(len(v) for v in self.iocs.values())} IOCs to {iocs_file}")
+            # A missing or unreadable store is rebuilt from the feed snapshots
+            added, removed = self.feeds.fetch(local, fetch=fetch, rebuild=self.ioc_store is None)
+            if added or removed or self.ioc_store is None:
+                count = apply_changes(self.store_file, self.ioc_store, added, removed)
+                logger.info(f"Added {sum(map(len, added.values()))} and removed "
+                            f"{sum(map(len, removed.values()))} IOCs, {count} in {self.store_file}")
+                self._open_store()
+            self.feeds.commit()
+            for ioc_type, values in pending.items():
+                self.iocs[ioc_type].difference_update(values)
         except Exception as e:
-            logger.error(f"Error saving IOCs to {iocs_file}: {e}")
+            logger.error(f"Error saving IOCs to {self.store_file}: {e}")
+        
+        if fetch:
+            self.last_update = time.time()
+        self.ruleset_version = self._compute_ruleset_version()
                 
     def check_ioc(self, ioc_type, value):
         """Check if a value matches a known indicator of compromise"""
+        if ioc_type == NETWORK_TYPE:
+            try:
+                return self.lookup_network(value) is not None
+            except (OSError, ValueError, TypeError):
+                return False
+        if ioc_type == DOMAIN_TYPE:
+            return self.match_domain(value) is not None
         if ioc_type in self.iocs and value in self.iocs[ioc_type]:
             return True
-        return False
+        store = self.ioc_store
+        return store is not None and store.contains(ioc_type, value)
+
+    def check_iocs(self, ioc_type, values):
+        """Check a batch of values (a list or NumPy array), returning a NumPy boolean mask of the matches"""
+        if ioc_type == NETWORK_TYPE:
+            return self.lookup_networks(values) >= 0
+        if ioc_type == DOMAIN_TYPE:
+            return np.fromiter((match is not None for match in self.match_domains(values)),
+                               dtype=bool, count=len(values))
+        return self._check_exact(ioc_type, values)
+
+    def _check_exact(self, ioc_type, values):
+        """Return a NumPy boolean mask of the values stored or pending as indicators"""
+        count = len(values)
+        store = self.ioc_store
+        if store is not None and store.count(ioc_type):
+            keys = np.fromiter((ioc_hash(str(value)) for value in values), dtype=np.uint64, count=count)
+            matches = store.contains_hashes(ioc_type, keys)
+        else:
+            matches = np.zeros(count, dtype=bool)
+        pending = self._pending(ioc_type)
+        if pending:
+            matches |= np.fromiter((value in pending for value in values), dtype=bool, count=count)
+        return matches
+
+    def _pending(self, ioc_type):
+        """Return the pending indicators of a type, in the form they are stored"""
+        pending = self.iocs.get(ioc_type, set())
+        if ioc_type == DOMAIN_TYPE and pending:
+            return {normalize_domain(value) for value in pending}
+        return pending
+
+    def match_domain(self, name):
+        """Return the listed domain (or '*.' wildcard) covering a name, or None"""
+        keys = domain_keys(normalize_domain(name), self.domain_subdomains)
+        pending = self._pending(DOMAIN_TYPE)
+        store = self.ioc_store
+        if store is not None and store.fp_rate and store.count(DOMAIN_TYPE):
+            # Most parent domains are not listed; the filter rejects them cheaply
+            store.prefilter(DOMAIN_TYPE)
+        for key in keys:
+            if key in pending or (store is not None and store.contains(DOMAIN_TYPE, key)):
+                return key
+        return None
+
+    def match_domains(self, names):
+        """Return the listed domain covering each name of a batch (a DNS log, say), or None
+
+        The keys of all names are checked in one batch.
+        """
+        keys = []
+        owners = []
+        for position, name in enumerate(names):
+            for key in domain_keys(normalize_domain(str(name)), self.domain_subdomains):
+                keys.append(key)
+                owners.append(position)
+        matches = [None] * len(names)
+        # Keys come most specific first, so the first match of a name wins
+        for index in np.flatnonzero(self._check_exact(DOMAIN_TYPE, keys)):
+            if matches[owners[index]] is None:
+                matches[owners[index]] = keys[index]
+        return matches
+
+    def lookup_network(self, address):
+        """Return the most specific network IOC containing an address, or None"""
+        matches = [index.lookup(address) for index in self._network_indexes()]
+        matches = [network for network in matches if network is not None]
+        return max(matches, key=lambda network: int(network.rsplit('/', 1)[1]), default=None)
+
+    def lookup_networks(self, addresses):
+        """Return the longest prefix length matching each address of a batch (-1 for none)
+
+        addresses is a NumPy array of IPv4 integers or packed IPv6 addresses,
+        or a sequence of address strings (see PrefixIndex.lookup_many).
+        """
+        lengths = np.full(len(addresses), -1, dtype=np.int16)
+        for index in self._network_indexes():
+            np.maximum(lengths, index.lookup_many(addresses), out=lengths)
+        return lengths
+
+    def _network_indexes(self):
+        """Return the prefix indexes of the stored and the pending network IOCs"""
+        indexes = []
+        if self.ioc_store is not None and len(self.ioc_store.networks):
+            indexes.append(self.ioc_store.networks)
+        pending = self.iocs.get(NETWORK_TYPE)
+        if pending:
+            # Pending networks are few; update() moves them to the store
+            indexes.append(PrefixIndex.from_networks(pending))
+        return indexes
     
-    def scan_file(self, file_path):
+    def scan_file(self, file_path, data=None):
         """Scan a file using YARA rules"""
-        logger.info(f"Scanning file with YARA rules: {file_path}")
-        results = []
+        logger.debug(f"Scanning file with YARA rules: {file_path}")
+        # One pass of the whole ruleset; a background recompile swaps it whole
+        rules = self.yara_ruleset.rules
+        if rules is None:
+            return []
         
         try:
-            # Apply all YARA rules to the file
-            for rule_name, rule in self.yara_rules.items():
-                matches = rule.match(file_path)
-                if matches:
-                    for match in matches:
-                        results.append({
-                            'type': 'yara_match',
-                            'rule': match.rule,
-                            'tags': match.tags,
-                            'meta': match.meta,
-                            'strings': match.strings,
-                            'file': file_path,
-                        })
+            if data is None:
+                size = os.path.getsize(file_path)
+                if size > self.max_map_size or (self.yara_max_scan_size and size > self.yara_max_scan_size):
+                    return self._scan_windows(rules, file_path, size)
+                # libyara memory-maps the file itself
+                matches = rules.match(file_path, timeout=self.yara_timeout)
+            elif self.yara_max_scan_size and len(data) > self.yara_max_scan_size:
+                with memoryview(data) as view, view[:self.yara_max_scan_size] as head:
+                    matches = rules.match(data=head, timeout=self.yara_timeout)
+            else:
+                matches = rules.match(data=data, timeout=self.yara_timeout)
+            return [self._match_result(match, file_path) for match in matches]
+        except yara.TimeoutError:
+            logger.warning(f"YARA scan of {file_path} timed out after {self.yara_timeout} seconds")
         except Exception as e:
             logger.error(f"Error scanning file {file_path} with YARA rules: {e}")
+        return []
+    
+    def _scan_windows(self, rules, file_path, size):
+        """Match a file too large to map in overlapping windows
         
-        return results
+        String offsets are relative to the file, but filesize and absolute
+        offsets in rule conditions refer to the window being matched.
+        """
+        limit = min(size, self.yara_max_scan_size) if self.yara_max_scan_size else size
+        step = max(self.yara_chunk_size - self.yara_chunk_overlap, 1)
+        deadline = time.monotonic() + self.yara_timeout
+        found = {}
+        try:
+            with open(file_path, 'rb') as f:
+                for start in range(0, limit, step):
+                    f.seek(start)
+                    window = f.read(min(self.yara_chunk_size, limit - start))
+                    if self.governor is not None:
+                        self.governor.throttle_read(len(window))
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise yara.TimeoutError()
+                    for match in rules.match(data=window, timeout=max(int(remaining), 1)):
+                        result = self._match_result(match, file_path, start)
+                        key = (match.namespace, match.rule)
+                        if key in found:
+                            found[key]['strings'].extend(result['strings'])
+                        else:
+                            found[key] = result
+                    if start + len(window) >= limit:
+                        break
+        except yara.TimeoutError:
+            logger.warning(f"YARA scan of {file_path} timed out after {self.yara_timeout} seconds")
+        except Exception as e:
+            logger.error(f"Error scanning file {file_path} with YARA rules: {e}")
+        
+        # Strings inside an overlap are found by both windows
+        for result in found.values():
+            result['strings'] = sorted(set(result['strings']))
+        return list(found.values())
+    
+    def _match_result(self, match, file_path, offset=0):
+        """Convert a YARA match to a finding, moving string offsets by offset"""
+        strings = self._format_strings(match.strings)
+        if offset:
+            strings = [(position + offset, identifier, matched) for position, identifier, matched in strings]
+        return {
+            'type': 'yara_match',
+            'rule': match.rule,
+            'namespace': match.namespace,
+            'tags': match.tags,
+            'meta': match.meta,
+            'strings': strings,
+            'file': file_path,
+        }
+    
+    def _format_strings(self, strings):
+        """Convert YARA string matches to plain (offset, identifier, data) tuples"""
+        # yara-python >= 4.3 returns StringMatch objects, which cannot be
+        # pickled back from scan workers
+        formatted = []
+        for string in strings:
+            if isinstance(string, tuple):
+                formatted.append(string)
+            else:
+                for instance in string.instances:
+                    formatted.append((instance.offset, string.identifier, instance.matched_data))
+        return formatted
     
     def scan_memory(self, pid=None):
         """Scan process memory using YARA rules"""
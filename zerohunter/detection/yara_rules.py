@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Compiled YARA ruleset cache for ZeroHunter
+
+Every rule file under the rules directory is compiled into one ruleset,
+each file in its own namespace, and the compiled ruleset is saved with
+Rules.save() under a digest of the rule sources and the YARA version.
+Later starts load it with yara.load() instead of compiling. When the
+sources change, the previous ruleset stays in use while the new one is
+compiled in the background, and the two are swapped in one assignment.
+"""
+
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+
+from zerohunter.core.lazy import lazy_import
+
+yara = lazy_import('yara')
+
+logger = logging.getLogger('zerohunter.detection.yara_rules')
+
+RULE_SUFFIXES = ('.yar', '.yara')
+CACHE_SUFFIX = '.yarc'
+
+def find_rule_files(rules_dir):
+    """Return the sorted paths of the rule files under a directory"""
+    paths = []
+    for root, _, files in os.walk(rules_dir):
+        paths.extend(os.path.join(root, name) for name in files if name.endswith(RULE_SUFFIXES))
+    return sorted(paths)
+
+def fingerprint(paths):
+    """Return a cheap summary of the rule files that changes when any of them does"""
+    summary = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            summary.append((path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            summary.append((path, None, None))
+    return tuple(summary)
+
+def source_digest(rules_dir, paths):
+    """Return the digest of the rule sources and of the YARA version that compiles them"""
+    digest = hashlib.sha256()
+    # Compiled rulesets are only loadable by the libyara version that saved them
+    digest.update(f"{getattr(yara, '__version__', '')}:{getattr(yara, 'YARA_VERSION', '')}\n".encode())
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            logger.error(f"Error reading YARA rules from {path}: {e}")
+            continue
+        digest.update(f"{os.path.relpath(path, rules_dir)}:{len(data)}\n".encode())
+        digest.update(data)
+    return digest.hexdigest()
+
+def _namespace(rules_dir, path):
+    """Return the namespace of a rule file: its path below the rules directory, without suffix"""
+    return os.path.splitext(os.path.relpath(path, rules_dir))[0].replace(os.sep, '/')
+
+def compile_rules(rules_dir, paths):
+    """Compile rule files into one namespaced ruleset, leaving out the files that do not compile"""
+    filepaths = {_namespace(rules_dir, path): path for path in paths}
+    if not filepaths:
+        return None
+    try:
+        return yara.compile(filepaths=filepaths)
+    except yara.Error as e:
+        logger.error(f"Error compiling YARA ruleset, checking the rule files one by one: {e}")
+    compiled = {}
+    for name, path in filepaths.items():
+        try:
+            yara.compile(filepath=path)
+            compiled[name] = path
+        except yara.Error as e:
+            logger.error(f"Error compiling YARA rules from {path}: {e}")
+    return yara.compile(filepaths=compiled) if compiled else None
+
+class YaraRuleset:
+    """The compiled ruleset of a rules directory, cached across starts"""
+
+    def __init__(self, rules_dir, cache_dir, on_swap=None):
+        """Initialize YARA ruleset; on_swap is called after a new ruleset is swapped in"""
+        self.rules_dir = rules_dir
+        self.cache_dir = cache_dir
+        self.on_swap = on_swap
+        # (Rules or None, source digest, rule files), replaced as a whole
+        self.current = (None, None, [])
+        self.fingerprint = None
+        self.lock = threading.Lock()
+        self.builder = None
+
+    @property
+    def rules(self):
+        """The ruleset in use, or None"""
+        return self.current[0]
+
+    @property
+    def digest(self):
+        """Digest of the sources of the ruleset in use"""
+        return self.current[1]
+
+    @property
+    def paths(self):
+        """Rule files of the ruleset in use"""
+        return self.current[2]
+
+    def load(self):
+        """Load the cached ruleset, compiling it only if no usable ruleset is cached"""
+        paths = find_rule_files(self.rules_dir)
+        self.fingerprint = fingerprint(paths)
+        if not paths:
+            return
+        digest = source_digest(self.rules_dir, paths)
+        rules = self._load_cached(self._cache_file(digest))
+        if rules is not None:
+            self.current = (rules, digest, paths)
+            logger.info(f"Loaded compiled YARA ruleset of {len(paths)} rule files")
+            return
+
+        # Keep scanning with the last ruleset while the changed sources compile
+        stale = self._latest_cached()
+        if stale is not None:
+            rules = self._load_cached(stale)
+            if rules is not None:
+                self.current = (rules, os.path.basename(stale)[:-len(CACHE_SUFFIX)], paths)
+                logger.info("YARA rules changed, using the previous ruleset until they are compiled")
+                self._start_build()
+                return
+        self._build(paths, digest)
+
+    def refresh(self):
+        """Recompile in the background if the rule files changed since they were loaded"""
+        paths = find_rule_files(self.rules_dir)
+        if fingerprint(paths) != self.fingerprint:
+            self._start_build()
+
+    def wait(self, timeout=None):
+        """Wait for a background compilation to finish"""
+        builder = self.builder
+        if builder is not None:
+            builder.join(timeout)
+
+    def _start_build(self):
+        """Compile the rule files in a background thread, unless one is already running"""
+        with self.lock:
+            if self.builder is not None and self.builder.is_alive():
+                return
+            self.builder = threading.Thread(target=self._build, name='zerohunter-yara-compile', daemon=True)
+            self.builder.start()
+
+    def _build(self, paths=None, digest=None):
+        """Compile the rule files, save the result in the cache and swap it in"""
+        try:
+            if paths is None:
+                paths = find_rule_files(self.rules_dir)
+                digest = source_digest(self.rules_dir, paths)
+            self.fingerprint = fingerprint(paths)
+            if digest == self.digest:
+                return
+            rules = compile_rules(self.rules_dir, paths)
+            if rules is not None:
+                self._save(rules, digest)
+            self.current = (rules, digest, paths)
+            logger.info(f"Compiled YARA ruleset of {len(paths)} rule files")
+            if self.on_swap is not None:
+                self.on_swap()
+        except Exception as e:
+            logger.error(f"Error building YARA ruleset: {e}")
+
+    def _cache_file(self, digest):
+        """Return the cache path of a ruleset"""
+        return os.path.join(self.cache_dir, f'{digest}{CACHE_SUFFIX}')
+
+    def _latest_cached(self):
+        """Return the most recently saved ruleset in the cache, or None"""
+        try:
+            cached = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                      if name.endswith(CACHE_SUFFIX)]
+        except OSError:
+            return None
+        return max(cached, key=os.path.getmtime, default=None)
+
+    def _load_cached(self, path):
+        """Load a saved ruleset, or return None if it is missing or unusable"""
+        if not os.path.exists(path):
+            return None
+        try:
+            return yara.load(path)
+        except yara.Error as e:
+            logger.warning(f"Ignoring unusable compiled YARA ruleset {path}: {e}")
+            return None
+
+    def _save(self, rules, digest):
+        """Save a compiled ruleset atomically and drop the older ones"""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.ruleset-')
+            os.close(fd)
+            try:
+                rules.save(tmp_path)
+                os.replace(tmp_path, self._cache_file(digest))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(CACHE_SUFFIX) and name != f'{digest}{CACHE_SUFFIX}':
+                    os.unlink(os.path.join(self.cache_dir, name))
+        except (OSError, yara.Error) as e:
+            logger.error(f"Error saving compiled YARA ruleset to {self.cache_dir}: {e}")
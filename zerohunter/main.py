@@ -6,11 +6,10 @@ Main entry point for ZeroHunter application
 """
 
 import sys
+import json
 import argparse
 import logging
-from PyQt5.QtWidgets import QApplication
 
-from zerohunter.ui.main_window import MainWindow
 from zerohunter.core.config import Config
 from zerohunter.core.logger import setup_logger
 
@@ -26,6 +25,15 @@ def parse_arguments():
     parser.add_argument('--directory', type=str, help='Scan a directory')
     parser.add_argument('--process', type=int, help='Scan a process')
     parser.add_argument('--memory', action='store_true', help='Scan memory')
+    parser.add_argument('--pcap', type=str, help='Replay a pcap or pcapng file instead of capturing (with --network)')
+    parser.add_argument('--jobs', type=int, help='Number of parallel scan workers')
+    parser.add_argument('--no-cache', action='store_true', help='Rescan files even if unchanged since the last scan')
+    parser.add_argument('--stats', action='store_true', help='Print detector statistics after the scan')
+    parser.add_argument('--coordinator', action='store_true', help='Distribute a directory or file list scan to workers')
+    parser.add_argument('--worker', action='store_true', help='Scan shards handed out by a coordinator')
+    parser.add_argument('--listen', type=str, help='Coordinator address to listen on (host:port)')
+    parser.add_argument('--connect', type=str, help='Coordinator address to connect to (host:port)')
+    parser.add_argument('--file-list', type=str, help='File with one path per line to scan')
     parser.add_argument('--report', action='store_true', help='Generate a report')
     parser.add_argument('--format', type=str, choices=['pdf', 'html', 'json'], default='pdf', help='Report format')
     parser.add_argument('--output', type=str, help='Output file')
@@ -36,6 +44,21 @@ def parse_arguments():
     return parser.parse_args()
 
 
+def print_results(results):
+    """Print scan results as JSON lines as they arrive"""
+    for result in results:
+        print(json.dumps(result, default=str), flush=True)
+
+
+def read_file_list(file_path):
+    """Yield the paths listed in a file, one per line"""
+    with open(file_path, 'r') as f:
+        for line in f:
+            path = line.rstrip('\n')
+            if path:
+                yield path
+
+
 def main():
     """Main function"""
     args = parse_arguments()
@@ -56,32 +79,72 @@ def main():
     if args.config:
         config.load(args.config)
     
+    # Distributed scanning
+    if args.coordinator:
+        logger.info("Starting ZeroHunter scan coordinator")
+        from zerohunter.detection.distributed import ScanCoordinator
+        coordinator = ScanCoordinator(config, args.listen)
+        if args.directory:
+            print_results(coordinator.iter_scan_directory(args.directory))
+        elif args.file_list:
+            print_results(coordinator.iter_scan_files(read_file_list(args.file_list)))
+        else:
+            logger.error("No scan target specified")
+            return 1
+        return 1 if coordinator.failed or coordinator.planning_failed else 0
+    if args.worker:
+        logger.info("Starting ZeroHunter scan worker")
+        from zerohunter.detection import DetectionEngine
+        from zerohunter.detection.distributed import ScanWorker
+        engine = DetectionEngine(config, use_cache=not args.no_cache)
+        engine.governor.apply_priority()
+        worker = ScanWorker(config, args.connect, engine=engine)
+        return 0 if worker.run() else 1
+    
     # CLI mode
     if args.cli:
         logger.info("Starting ZeroHunter in CLI mode")
+        from zerohunter.detection import DetectionEngine
         # TODO: Implement CLI mode
         if args.scan:
+            engine = DetectionEngine(config, use_cache=not args.no_cache)
+            engine.governor.apply_priority()
             if args.system:
                 logger.info("Scanning system")
-                # TODO: Implement system scan
+                print_results(engine.iter_scan_system())
+            elif args.network and args.pcap:
+                from zerohunter.detection.pcapfile import PcapError
+                try:
+                    stats = engine.replay_pcap(args.pcap, jobs=args.jobs)
+                except (OSError, PcapError) as e:
+                    logger.error(f"Error replaying capture file {args.pcap}: {e}")
+                    return 1
+                if stats is None:
+                    return 1
+                print(f"Replayed {stats['packets']} packets ({stats['bytes'] / (1024 * 1024):.1f} MB) "
+                      f"in {stats['seconds']:.2f}s with {stats['jobs']} jobs: "
+                      f"{stats['packets_per_s']:.0f} packets/s, {stats['flows']} flows", file=sys.stderr)
             elif args.network:
                 logger.info("Scanning network")
-                # TODO: Implement network scan
+                print_results(engine.iter_scan_network())
             elif args.file:
                 logger.info(f"Scanning file: {args.file}")
-                # TODO: Implement file scan
+                print_results(engine.scan_file(args.file))
             elif args.directory:
                 logger.info(f"Scanning directory: {args.directory}")
-                # TODO: Implement directory scan
+                print_results(engine.iter_scan_directory(args.directory, jobs=args.jobs))
             elif args.process:
                 logger.info(f"Scanning process: {args.process}")
-                # TODO: Implement process scan
+                print_results(engine.iter_scan_process(args.process))
             elif args.memory:
                 logger.info("Scanning memory")
-                # TODO: Implement memory scan
+                print_results(engine.iter_scan_memory())
             else:
                 logger.error("No scan target specified")
                 return 1
+            if args.stats:
+                print(engine.metrics_registry.summary(), file=sys.stderr)
+                engine.export_metrics()
         elif args.report:
             logger.info(f"Generating {args.format} report")
             # TODO: Implement report generation
@@ -94,6 +157,9 @@ def main():
     # GUI mode
     else:
         logger.info("Starting ZeroHunter in GUI mode")
+        # PyQt5 is only needed for the GUI
+        from PyQt5.QtWidgets import QApplication
+        from zerohunter.ui.main_window import MainWindow
         app = QApplication(sys.argv)
         window = MainWindow(config)
         window.show()
@@ -7,10 +7,12 @@ Core module for ZeroHunter machine learning functionality
 
 import os
 import logging
-import numpy as np
-import tensorflow as tf
-from sklearn.ensemble import IsolationForest
-from sklearn.svm import OneClassSVM
+
+from zerohunter.core.lazy import lazy_import
+from zerohunter.core.metrics import get_registry
+
+np = lazy_import('numpy')
+tf = lazy_import('tensorflow')
 
 logger = logging.getLogger('zerohunter.ml')
 
@@ -22,6 +24,7 @@ class ModelManager:
         self.config = config
         self.models_dir = config.get('ml.models_dir', os.path.expanduser('~/.zerohunter/models'))
         self.models = {}
+        self.metrics = get_registry()
         
         # Create models directory if it doesn't exist
         if not os.path.exists(self.models_dir):
@@ -34,6 +37,9 @@ class ModelManager:
         
     def _load_models(self):
         """Load machine learning models"""
+        from sklearn.ensemble import IsolationForest
+        from sklearn.svm import OneClassSVM
+        
         # Check if models exist
         if os.path.exists(os.path.join(self.models_dir, 'system_if.pkl')):
             try:
@@ -76,6 +82,9 @@ class ModelManager:
             
     def _create_default_models(self):
         """Create default machine learning models"""
+        from sklearn.ensemble import IsolationForest
+        from sklearn.svm import OneClassSVM
+        
         # Isolation Forest for system metrics
         self.models['system_if'] = IsolationForest(
             n_estimators=100,
@@ -136,16 +145,17 @@ class ModelManager:
             return None
             
         try:
-            if name == 'system_if':
-                return self.models[name].predict(data)
-            elif name == 'network_svm':
-                return self.models[name].predict(data)
-            elif name == 'behavior_lstm':
-                # In a real implementation, this would use the LSTM model
-                return None
-            else:
-                logger.error(f"Unknown model type: {name}")
-                return None
+            with self.metrics.timed('ModelManager', f'predict_{name}', getattr(data, 'nbytes', 0)):
+                if name == 'system_if':
+                    return self.models[name].predict(data)
+                elif name == 'network_svm':
+                    return self.models[name].predict(data)
+                elif name == 'behavior_lstm':
+                    # In a real implementation, this would use the LSTM model
+                    return None
+                else:
+                    logger.error(f"Unknown model type: {name}")
+                    return None
         except Exception as e:
             logger.error(f"Error making predictions with model {name}: {e}")
             return None